@@ -0,0 +1,395 @@
+#!/usr/bin/python
+
+from color import cDim
+from filemove import moveFile, writeStream
+from pathlib import Path
+from scanfile import IScanFileReader
+from zipedit import removeZipEntries
+import bz2
+import gzip
+import io
+import logging
+import lzma
+import os
+import tarfile
+import tempfile
+import threading
+import zipfile
+import zlib
+
+class ContainerEntryReader(IScanFileReader):
+    """
+    Base implementation of IScanFileReader for an entry of a compressed container.
+    Subclasses open the decompressed stream of the entry.
+    If a spool directory is given the decompressed data is written to a temporary
+    file in that directory while it is read for hashing. A rename of the entry then
+    only renames the temporary file, so every entry is decompressed once."""
+
+    def __init__(self, containerName: str, entryName: str, size: int, spoolDir: Path = None):
+        self.__path = containerName + '/' + entryName
+        self.__file = None
+        self.__size = size
+        self.__spoolDir = spoolDir
+        self.__spool = None
+        self.__spoolName = None
+        self.__spooled = 0
+        self.name = Path(entryName).name
+
+    def __repr__(self):
+        return self.name
+
+    def openStream(self):
+        """
+        Open the decompressed stream of the entry"""
+
+        pass
+
+    def _extract(self, destFile: Path, sha1: str):
+        """
+        Write the entry to the destination file if it wasn't spooled while hashing"""
+
+        with self.openStream() as stream:
+            writeStream(stream, destFile, sha1)
+
+    def isRemovable(self) -> bool:
+        """
+        Check unlink removes the entry from its container"""
+
+        return False
+
+    def open(self):
+        if self.__file is not None:
+            logging.warning("compressed file is already open %s", cDim(self.as_posix()))
+            return
+        self.__file = self.openStream()
+        if self.__spoolDir is not None:
+            self.release()
+            # the entry name isn't part of the spool file name, so a long name can't exceed NAME_MAX
+            spoolFd, self.__spoolName = tempfile.mkstemp(suffix=".part", dir=self.__spoolDir)
+            self.__spool = os.fdopen(spoolFd, "wb")
+            self.__spooled = 0
+
+    def close(self):
+        if self.__file is None:
+            logging.warning("compressed file is already closed %s", cDim(self.as_posix()))
+            return
+        self.__file.close()
+        self.__file = None
+        if self.__spool is not None:
+            self.__spool.close()
+            self.__spool = None
+            if self.__size is not None and self.__spooled != self.__size:
+                self.release()
+
+    def size(self):
+        return self.__size
+
+    def read(self, size: int):
+        data = self.__file.read(size)
+        if self.__spool is not None:
+            self.__spool.write(data)
+            self.__spooled += len(data)
+        return data
+
+    def as_posix(self):
+        return self.__path
+
+    def rename(self, destFile: Path, sha1: str = None):
+        if self.__spoolName is not None:
+            logging.debug("rename spooled entry %s to %s", cDim(self.__spoolName), cDim(destFile.as_posix()))
+            # like writeStream the content is synced before the entry may be removed from the container
+            spoolFd = os.open(self.__spoolName, os.O_RDONLY)
+            try:
+                os.fsync(spoolFd)
+            finally:
+                os.close(spoolFd)
+            moveFile(Path(self.__spoolName), destFile)
+            self.__spoolName = None
+        else:
+            self._extract(destFile, sha1)
+        if self.isRemovable():
+            self.unlink()
+        else:
+            logging.debug("entry %s is copied and kept in its container", cDim(self.as_posix()))
+
+    def release(self):
+        if self.__spoolName is not None:
+            os.unlink(self.__spoolName)
+            self.__spoolName = None
+
+class ZipFileReader(ContainerEntryReader):
+    """
+    Implementation of IScanFileReader for a file in a ZIP archive.
+    Moved or deleted entries are added to removedEntries. They are removed from
+    the archive after all entries are processed. Entries of an archive without
+    archivePath are nested in another container and have no cache key.
+    getArchive returns the ZipFile handle to read the entry from in the calling thread."""
+
+    def __init__(self, getArchive, zipInfo: zipfile.ZipInfo, containerName: str,
+            spoolDir: Path = None, removedEntries: set = None, archivePath: Path = None):
+        super().__init__(containerName, zipInfo.filename, zipInfo.file_size, spoolDir)
+        self.__zipInfo = zipInfo
+        self.__getArchive = getArchive
+        self.__removedEntries = removedEntries
+        self.__archivePath = archivePath
+
+    def openStream(self):
+        return self.__getArchive().open(self.__zipInfo)
+
+    def isRemovable(self) -> bool:
+        return self.__removedEntries is not None
+
+    def unlink(self):
+        if not self.isRemovable():
+            logging.warning("Deleting a zip entry is not supported for this archive. File Skipped %s",
+                cDim(self.as_posix()))
+            return
+        logging.debug("zip entry %s is removed from archive", cDim(self.as_posix()))
+        # entries with the same name are told apart by their header offset
+        self.__removedEntries.add(self.__zipInfo.header_offset)
+
+    def crc(self) -> str:
+        return format(self.__zipInfo.CRC, "0>8x")
+
+    def cacheKey(self) -> tuple:
+        if self.__archivePath is None:
+            return None
+        # entries are valid as long as the archive itself is unchanged
+        stat = os.stat(self.__archivePath)
+        return (self.as_posix(), stat.st_dev, stat.st_ino, self.size(), stat.st_mtime_ns)
+
+class TarFileReader(ContainerEntryReader):
+    """
+    Implementation of IScanFileReader for a file in a TAR archive read as a stream.
+    The member can only be read once while the archive is at its position, so it
+    can only be moved if it was spooled while hashing. Removing members from
+    the archive isn't supported."""
+
+    def __init__(self, archive: tarfile.TarFile, member: tarfile.TarInfo, containerName: str,
+            spoolDir: Path = None):
+        super().__init__(containerName, member.name, member.size, spoolDir)
+        self.__archive = archive
+        self.__member = member
+
+    def openStream(self):
+        return self.__archive.extractfile(self.__member)
+
+    def _extract(self, destFile: Path, sha1: str):
+        raise io.UnsupportedOperation(f"tar member {self.as_posix()} can only be moved if it was spooled")
+
+    def unlink(self):
+        logging.warning("Deleting a tar member is not supported. File Skipped %s", cDim(self.as_posix()))
+
+class CompressedFileReader(ContainerEntryReader):
+    """
+    Implementation of IScanFileReader for a single compressed file like gzip, bzip2 or xz.
+    The size is unknown until the file is decompressed. Moving or deleting the
+    entry deletes the compressed file, because it contains nothing else.
+    A compressed file nested in another container is read from a file object and
+    can't be deleted."""
+
+    def __init__(self, source, containerName: str, opener, spoolDir: Path = None):
+        super().__init__(containerName, Path(containerName).stem, None, spoolDir)
+        self.__source = source
+        self.__opener = opener
+
+    def openStream(self):
+        if not isinstance(self.__source, Path):
+            self.__source.seek(0)
+        return self.__opener(self.__source)
+
+    def isRemovable(self) -> bool:
+        return isinstance(self.__source, Path)
+
+    def unlink(self):
+        if not self.isRemovable():
+            logging.warning("Deleting a nested compressed file is not supported. File Skipped %s",
+                cDim(self.as_posix()))
+            return
+        logging.debug("compressed file %s is removed", cDim(self.__source.as_posix()))
+        self.__source.unlink()
+
+class IContainer:
+    """
+    Interface for a compressed container scaned by StrategyScanCompressed.
+    Entries are returned as IScanFileReader one after another. Every entry must
+    be processed completely before the next entry is requested, so containers
+    can be read as a stream.
+    A container is opened either from a file path or from a seekable binary file
+    object of a container nested in another one. containerName is the name shown for
+    the container and defaults to the path. extensions are the lower case file name
+    endings of the container type used to find nested containers.
+    If parallel is true the entries can be hashed by several threads at the same time."""
+
+    name: str = None
+    extensions: tuple = ()
+    parallel: bool = False
+
+    @staticmethod
+    def isContainer(source) -> bool:
+        pass
+
+    def entries(self):
+        pass
+
+    def close(self):
+        pass
+
+class ZipContainer(IContainer):
+    """
+    ZIP archive. Moved or deleted entries are removed by rewriting the archive
+    once when it is closed. Entries of a nested archive can't be removed.
+    Every thread reading entries of an archive file gets its own ZipFile handle,
+    so entries are decompressed in parallel without sharing a file position."""
+
+    name = "zip"
+    extensions = (".zip",)
+
+    def __init__(self, source, spoolDir: Path = None, containerName: str = None):
+        self.__path = source if isinstance(source, Path) else None
+        self.__containerName = containerName if containerName is not None else source.as_posix()
+        self.__spoolDir = spoolDir
+        self.__removedEntries = set() if self.__path is not None else None
+        self.__archive = zipfile.ZipFile(source)
+        self.__threadArchives = threading.local()
+        self.__threadArchives.archive = self.__archive
+        self.__openArchives = [self.__archive]
+        self.__lock = threading.Lock()
+        self.parallel = self.__path is not None
+
+    @staticmethod
+    def isContainer(source) -> bool:
+        return zipfile.is_zipfile(source)
+
+    def entries(self):
+        for info in self.__archive.infolist():
+            if not info.is_dir():
+                yield ZipFileReader(self.__threadArchive, info, self.__containerName, self.__spoolDir,
+                    self.__removedEntries, self.__path)
+
+    def __threadArchive(self) -> zipfile.ZipFile:
+        archive = getattr(self.__threadArchives, "archive", None)
+        if archive is None:
+            archive = zipfile.ZipFile(self.__path)
+            self.__threadArchives.archive = archive
+            with self.__lock:
+                self.__openArchives.append(archive)
+        return archive
+
+    def close(self):
+        with self.__lock:
+            for archive in self.__openArchives:
+                archive.close()
+            self.__openArchives.clear()
+        if self.__removedEntries:
+            try:
+                removeZipEntries(self.__path, self.__removedEntries)
+            except CONTAINER_ERRORS as error:
+                logging.error("zip file %s is kept unchanged because removing moved entries caused an error %s",
+                    cDim(self.__path.as_posix()), cDim(str(error)))
+
+class TarContainer(IContainer):
+    """
+    TAR archive, optionally compressed with gzip, bzip2 or xz. The archive is read
+    as a stream from start to end without random access."""
+
+    name = "tar"
+    extensions = (".tar", ".tgz", ".tbz", ".tbz2", ".txz")
+
+    def __init__(self, source, spoolDir: Path = None, containerName: str = None):
+        self.__containerName = containerName if containerName is not None else source.as_posix()
+        self.__spoolDir = spoolDir
+        if isinstance(source, Path):
+            self.__archive = tarfile.open(source, "r|*")
+        else:
+            self.__archive = tarfile.open(fileobj=source, mode="r|*")
+
+    @staticmethod
+    def isContainer(source) -> bool:
+        return tarfile.is_tarfile(source)
+
+    def entries(self):
+        for member in self.__archive:
+            if member.isfile():
+                yield TarFileReader(self.__archive, member, self.__containerName, self.__spoolDir)
+
+    def close(self):
+        self.__archive.close()
+
+class CompressedContainer(IContainer):
+    """
+    Single compressed file. Subclasses define the magic bytes and the module to open it."""
+
+    magic: bytes = None
+    opener = None
+
+    def __init__(self, source, spoolDir: Path = None, containerName: str = None):
+        containerName = containerName if containerName is not None else source.as_posix()
+        self.__reader = CompressedFileReader(source, containerName, type(self).opener, spoolDir)
+
+    @classmethod
+    def isContainer(cls, source) -> bool:
+        if not isinstance(source, Path):
+            return source.read(len(cls.magic)) == cls.magic
+        with open(source, "rb") as file:
+            return file.read(len(cls.magic)) == cls.magic
+
+    def entries(self):
+        yield self.__reader
+
+class GzipContainer(CompressedContainer):
+    name = "gzip"
+    extensions = (".gz",)
+    magic = b"\x1f\x8b"
+    opener = gzip.open
+
+class Bz2Container(CompressedContainer):
+    name = "bzip2"
+    extensions = (".bz2",)
+    magic = b"BZh"
+    opener = bz2.open
+
+class XzContainer(CompressedContainer):
+    name = "xz"
+    extensions = (".xz",)
+    magic = b"\xfd7zXZ\x00"
+    opener = lzma.open
+
+CONTAINER_TYPES = [ZipContainer, TarContainer, GzipContainer, Bz2Container, XzContainer]
+
+CONTAINER_ERRORS = (OSError, EOFError, zipfile.BadZipFile, tarfile.TarError, lzma.LZMAError, zlib.error)
+
+def registerContainer(containerType: type):
+    """
+    Register another IContainer implementation. Containers are detected in order of registration.
+    @param containerType
+        class implementing IContainer"""
+
+    CONTAINER_TYPES.append(containerType)
+
+def findContainerType(source) -> type:
+    """
+    Detect the container type of a file.
+    @param source
+        the file to check, either a path or a seekable binary file object
+    @return
+        the first registered IContainer class accepting the file or None"""
+
+    for containerType in CONTAINER_TYPES:
+        try:
+            if containerType.isContainer(source):
+                return containerType
+        except CONTAINER_ERRORS as error:
+            logging.debug("file %s is no %s file: %s", cDim(str(source)), containerType.name, error)
+        finally:
+            if not isinstance(source, Path):
+                source.seek(0)
+    return None
+
+def isContainerName(name: str) -> bool:
+    """
+    Check if a file name ends with the extension of any registered container type."""
+
+    name = name.lower()
+    return any(name.endswith(extension) for containerType in CONTAINER_TYPES
+        for extension in containerType.extensions)
@@ -0,0 +1,194 @@
+#!/usr/bin/python
+
+from color import cDim
+from pathlib import Path
+import logging
+import os
+import pickle
+
+SYMLINK = "symlink"
+
+class DestinationIndex:
+    """
+    In memory inventory of the destination directory. Every directory is listed once
+    and stores its entries by name. An entry is either a symlink, or a file with the SHA1
+    digest known so far or None. A digest is stored with the size and modification time of
+    the file and is only returned while both are unchanged, because a file overwritten in
+    place doesn't change the modification time of its directory. Other strategies update the index for every change they
+    do in the destination directory, so no file system access is needed to check a path.
+    If indexFile is given the inventory is loaded from and saved to it. Only directories
+    with a changed modification time are listed again on load or refresh and their
+    digests are dropped."""
+
+    VERSION = 2
+
+    def __init__(self, destPath: Path, indexFile: Path = None):
+        self.__destPath = destPath
+        self.__indexFile = indexFile
+        self.__directories = {}
+        self.__changedDirectories = set()
+        if indexFile is not None and indexFile.exists():
+            self.__load()
+        else:
+            self.__inventory(".")
+        logging.info("destination index of %s contains %s directories",
+            cDim(destPath.as_posix()), len(self.__directories))
+
+    def __load(self):
+        try:
+            with open(self.__indexFile, "rb") as file:
+                index = pickle.load(file)
+            if index.get("version") != self.VERSION or index.get("root") != self.__destPath.as_posix():
+                logging.info("destination index %s does not match and is rebuild", cDim(self.__indexFile.as_posix()))
+                self.__inventory(".")
+                return
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as exception:
+            logging.warning("destination index %s can't be read and is rebuild because: %s",
+                cDim(self.__indexFile.as_posix()), exception)
+            self.__inventory(".")
+            return
+        self.__directories = index["directories"]
+        self.refresh()
+
+    def refresh(self):
+        """
+        List all directories changed outside of the index again."""
+
+        self.__updateChanged()
+        for directory, (mtime, _) in list(self.__directories.items()):
+            try:
+                changed = os.stat(self.__destPath / directory).st_mtime_ns != mtime
+            except OSError:
+                logging.debug("directory %s was removed from destination", cDim(directory))
+                del self.__directories[directory]
+                continue
+            if changed:
+                logging.debug("directory %s changed and is listed again", cDim(directory))
+                self.__inventory(directory, False)
+        if "." not in self.__directories:
+            self.__inventory(".")
+
+    def __inventory(self, directory: str, recursive: bool = True):
+        """
+        List the given directory relative to the destination. Subdirectories are
+        listed as well if recursive is set or they aren't in the index yet."""
+
+        stack = [directory]
+        while len(stack) > 0:
+            current = stack.pop()
+            path = self.__destPath / current
+            try:
+                entries = {}
+                with os.scandir(path) as scan:
+                    for dirEntry in scan:
+                        if dirEntry.is_symlink():
+                            entries[dirEntry.name] = SYMLINK
+                        elif dirEntry.is_dir():
+                            subDirectory = self.__relative(Path(dirEntry.path))
+                            if recursive or subDirectory not in self.__directories:
+                                stack.append(subDirectory)
+                        else:
+                            entries[dirEntry.name] = None
+                self.__directories[current] = [os.stat(path).st_mtime_ns, entries]
+            except OSError as error:
+                logging.error("list destination directory %s caused an error %s",
+                    cDim(path.as_posix()), cDim(str(error)))
+
+    def __relative(self, path: Path) -> str:
+        return path.relative_to(self.__destPath).as_posix()
+
+    def __entries(self, path: Path) -> dict:
+        directory = self.__directories.get(self.__relative(path.parent))
+        return directory[1] if directory is not None else None
+
+    def isDirectory(self, path: Path) -> bool:
+        return self.__relative(path) in self.__directories
+
+    def isSymlink(self, path: Path) -> bool:
+        entries = self.__entries(path)
+        return entries is not None and entries.get(path.name) is SYMLINK
+
+    def isFile(self, path: Path) -> bool:
+        entries = self.__entries(path)
+        return entries is not None and path.name in entries and entries[path.name] is not SYMLINK
+
+    def digest(self, path: Path) -> str:
+        """
+        Get the SHA1 of a file in the destination directory.
+        @return
+            the SHA1 as hex string or None if the file wasn't hashed yet"""
+
+        entries = self.__entries(path)
+        entry = entries.get(path.name) if entries is not None else None
+        if entry is None or entry is SYMLINK:
+            return None
+        digest, size, mtime = entry
+        if size is not None:
+            try:
+                fileStat = os.stat(path)
+            except OSError:
+                return None
+            if fileStat.st_size != size or fileStat.st_mtime_ns != mtime:
+                logging.debug("file %s changed since it was hashed", cDim(path.as_posix()))
+                entries[path.name] = None
+                return None
+        return digest.hex()
+
+    def addDirectory(self, path: Path):
+        """
+        Add a created directory and all its parents not in the index."""
+
+        while not self.isDirectory(path):
+            self.__directories[self.__relative(path)] = [None, {}]
+            self.__changedDirectories.add(self.__relative(path))
+            path = path.parent
+
+    def addFile(self, path: Path, sha1: str = None):
+        """
+        Add a file with its SHA1. If the file doesn't exist yet, because it is only
+        planned, the digest is kept without revalidation."""
+
+        entry = None
+        if sha1 is not None:
+            try:
+                fileStat = os.stat(path)
+                entry = (bytes.fromhex(sha1), fileStat.st_size, fileStat.st_mtime_ns)
+            except OSError:
+                entry = (bytes.fromhex(sha1), None, None)
+        self.__entries(path)[path.name] = entry
+        self.__changedDirectories.add(self.__relative(path.parent))
+
+    def addSymlink(self, path: Path):
+        self.__entries(path)[path.name] = SYMLINK
+        self.__changedDirectories.add(self.__relative(path.parent))
+
+    def remove(self, path: Path):
+        self.__entries(path).pop(path.name, None)
+        self.__changedDirectories.add(self.__relative(path.parent))
+
+    def __updateChanged(self):
+        for directory in self.__changedDirectories:
+            try:
+                self.__directories[directory][0] = os.stat(self.__destPath / directory).st_mtime_ns
+            except (OSError, KeyError):
+                self.__directories.pop(directory, None)
+        self.__changedDirectories.clear()
+
+    def save(self):
+        """
+        Write the index file if one is given. The modification time of all
+        changed directories is read again, so they are not listed on the next load."""
+
+        if self.__indexFile is None:
+            return
+        self.__updateChanged()
+        logging.info("write destination index %s", cDim(self.__indexFile.as_posix()))
+        tempFile = self.__indexFile.with_name(self.__indexFile.name + ".tmp")
+        try:
+            with open(tempFile, "wb") as file:
+                pickle.dump({"version": self.VERSION, "root": self.__destPath.as_posix(),
+                    "directories": self.__directories}, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tempFile, self.__indexFile)
+        except OSError as error:
+            logging.warning("destination index %s can't be written because: %s",
+                cDim(self.__indexFile.as_posix()), error)
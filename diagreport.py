@@ -0,0 +1,74 @@
+#!/usr/bin/python
+
+from color import cDim
+from pathlib import Path
+from tosecdat import TosecGameRom
+import csv
+import json
+import logging
+
+class DiagReport:
+    """
+    Abstract report of a diagnosis written while scanning, so files are not kept in memory
+    to print them at the end. Every line is one file or missing ROM entry with the fields:
+    - status: having, duplicate, unknown, misnamed or missing
+    - path: the found file or empty for missing ROMs
+    - dat: name of the TOSEC DAT of the ROM entry
+    - game: name of the game of the ROM entry
+    - name: name of the ROM entry, the expected name for misnamed files
+    - sha1: SHA1 of the ROM entry"""
+
+    FIELDS = ("status", "path", "dat", "game", "name", "sha1")
+
+    def __init__(self, reportFile: Path):
+        logging.info("write diag report %s", cDim(reportFile.as_posix()))
+        self._file = open(reportFile, "w", encoding="utf-8", newline="")
+        self.counts = dict.fromkeys(("having", "duplicate", "unknown", "misnamed", "missing"), 0)
+
+    def write(self, status: str, path: Path, rom: TosecGameRom = None):
+        """
+        Write a report line.
+        @param status
+            the diagnosis of the file
+        @param path
+            the found file or None for missing ROM entries
+        @param rom
+            the ROM entry or None for unknown files"""
+
+        self.counts[status] += 1
+        self._writeRecord({"status": status, "path": "" if path is None else path.as_posix(),
+            "dat": "" if rom is None else rom.game.header.name, "game": "" if rom is None else rom.game.name,
+            "name": "" if rom is None else rom.name, "sha1": "" if rom is None else rom.sha1})
+
+    def _writeRecord(self, record: dict):
+        """
+        Write a record in the format of the report"""
+
+        pass
+
+    def close(self):
+        self._file.close()
+
+class JsonLinesReport(DiagReport):
+    """
+    Report with one JSON object per line"""
+
+    def _writeRecord(self, record: dict):
+        self._file.write(json.dumps(record) + "\n")
+
+class CsvReport(DiagReport):
+    """
+    Report as CSV file with a header line"""
+
+    def __init__(self, reportFile: Path):
+        super().__init__(reportFile)
+        self.__writer = csv.DictWriter(self._file, self.FIELDS)
+        self.__writer.writeheader()
+
+    def _writeRecord(self, record: dict):
+        self.__writer.writerow(record)
+
+REPORT_FORMATS = {"jsonl": JsonLinesReport, "csv": CsvReport}
+
+def createDiagReport(reportFile: Path, reportFormat: str) -> DiagReport:
+    return REPORT_FORMATS[reportFormat](reportFile)
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+
+from color import cDim
+from pathlib import Path
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+class FileMoveException(Exception):
+    """
+    Exception if a copied file doesn't match the expected hash"""
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+def moveFile(source: Path, destFile: Path, sha1: str = None):
+    """
+    Move a file. If source and destination are on the same filesystem the file is renamed.
+    Otherwise the file is copied by the kernel into a temporary file in the destination directory,
+    which is renamed to the destination after the copy is complete. The source is removed afterwards.
+    If the source can't be removed, e.g. on a read only mount, the verified copy is kept and only
+    a warning is logged, so the destination file is still used by the caller.
+    @param source
+        file to move
+    @param destFile
+        destination file name
+    @param sha1
+        if given the copy is verified against this hash while copying"""
+
+    try:
+        os.rename(source, destFile)
+        return
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+    logging.debug("file %s is on another filesystem than %s and is copied",
+        cDim(source.as_posix()), cDim(destFile.as_posix()))
+    copyFile(source, destFile, sha1)
+    try:
+        source.unlink()
+    except OSError as error:
+        logging.warning("file %s was copied to %s but can't be removed: %s",
+            cDim(source.as_posix()), cDim(destFile.as_posix()), error)
+
+def copyFile(source: Path, destFile: Path, sha1: str = None):
+    """
+    Copy a file atomically. The content is copied by copy_file_range or sendfile without
+    passing it through user space. If a hash is given every copied chunk is read back
+    from the destination, while it is still in the page cache, to verify the copy.
+    The copy is synced and renamed to the destination file at the end. On error the
+    temporary file is removed.
+    @param source
+        file to copy
+    @param destFile
+        destination file name
+    @param sha1
+        if given the copy is verified against this hash"""
+
+    tempFd, tempName = tempfile.mkstemp(prefix="." + destFile.name + ".", suffix=".part", dir=destFile.parent)
+    try:
+        sourceFd = os.open(source, os.O_RDONLY)
+        try:
+            digest = hashlib.sha1() if sha1 is not None else None
+            copy = kernelCopy if hasattr(os, "copy_file_range") else sendfileCopy
+            offset = 0
+            while True:
+                try:
+                    copied = copy(sourceFd, tempFd, offset, CHUNK_SIZE)
+                except OSError as error:
+                    if copy is userCopy or error.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                            errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSOCK):
+                        raise
+                    copy = sendfileCopy if copy is kernelCopy else userCopy
+                    continue
+                if copied == 0:
+                    break
+                if digest is not None:
+                    digest.update(os.pread(tempFd, copied, offset))
+                offset += copied
+        finally:
+            os.close(sourceFd)
+        if digest is not None and digest.hexdigest() != sha1:
+            raise FileMoveException(f"copy of {cDim(source.as_posix())} has sha1 {cDim(digest.hexdigest())} "
+                f"but expected {cDim(sha1)}")
+        os.fsync(tempFd)
+        os.close(tempFd)
+        tempFd = None
+        shutil.copystat(source, tempName)
+        os.rename(tempName, destFile)
+    except BaseException:
+        if tempFd is not None:
+            os.close(tempFd)
+        os.unlink(tempName)
+        raise
+
+def writeStream(stream, destFile: Path, sha1: str = None):
+    """
+    Write the content of a binary stream atomically to a file. The stream is copied
+    in chunks into a temporary file in the destination directory, so memory stays flat
+    for any stream size. The file is synced and renamed to the destination file at the end.
+    On error the temporary file is removed.
+    @param stream
+        binary file object to read from
+    @param destFile
+        destination file name
+    @param sha1
+        if given the content is verified against this hash while copying"""
+
+    tempFd, tempName = tempfile.mkstemp(prefix="." + destFile.name + ".", suffix=".part", dir=destFile.parent)
+    try:
+        with os.fdopen(tempFd, "wb") as tempFile:
+            digest = hashlib.sha1() if sha1 is not None else None
+            while True:
+                data = stream.read(CHUNK_SIZE)
+                if len(data) == 0:
+                    break
+                if digest is not None:
+                    digest.update(data)
+                tempFile.write(data)
+            if digest is not None and digest.hexdigest() != sha1:
+                raise FileMoveException(f"extracted file {cDim(destFile.as_posix())} has sha1 "
+                    f"{cDim(digest.hexdigest())} but expected {cDim(sha1)}")
+            tempFile.flush()
+            os.fsync(tempFile.fileno())
+        os.rename(tempName, destFile)
+    except BaseException:
+        os.unlink(tempName)
+        raise
+
+def sha1File(path: Path) -> str:
+    """
+    Hash a file to verify it before another copy is removed"""
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as file:
+        while True:
+            data = file.read(CHUNK_SIZE)
+            if len(data) == 0:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+def kernelCopy(sourceFd: int, destFd: int, offset: int, count: int) -> int:
+    return os.copy_file_range(sourceFd, destFd, count, offset, offset)
+
+def sendfileCopy(sourceFd: int, destFd: int, offset: int, count: int) -> int:
+    os.lseek(destFd, offset, os.SEEK_SET)
+    return os.sendfile(destFd, sourceFd, offset, count)
+
+def userCopy(sourceFd: int, destFd: int, offset: int, count: int) -> int:
+    data = os.pread(sourceFd, count, offset)
+    return os.pwrite(destFd, data, offset)
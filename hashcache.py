@@ -0,0 +1,61 @@
+#!/usr/bin/python
+
+from color import cDim
+from pathlib import Path
+import logging
+import sqlite3
+import threading
+
+class HashCache:
+    """
+    Persistent cache of file hashes stored in a SQLite database.
+    An entry is stored by the path of the file and is only valid as long as
+    device, inode, size and modification time of the file are unchanged.
+    The cache can be used by several threads at once."""
+
+    COMMIT_INTERVAL = 1000
+
+    def __init__(self, cacheFile: Path):
+        logging.debug("open hash cache %s", cDim(cacheFile.as_posix()))
+        self.__lock = threading.Lock()
+        self.__uncommitted = 0
+        self.__db = sqlite3.connect(cacheFile.as_posix(), check_same_thread=False)
+        self.__db.execute("CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, device INTEGER, inode INTEGER, size INTEGER, mtime INTEGER, "
+            "crc TEXT, md5 TEXT, sha1 TEXT)")
+
+    def load(self, key: tuple) -> tuple:
+        """
+        Search for the hashes of a file.
+        @param key
+            tuple of (path, device, inode, size, mtime) of the file
+        @return
+            tuple of (crc, md5, sha1) or None if the file isn't cached or was changed"""
+
+        with self.__lock:
+            row = self.__db.execute("SELECT device, inode, size, mtime, crc, md5, sha1 FROM files WHERE path = ?",
+                key[:1]).fetchone()
+        if row is None or row[:4] != key[1:]:
+            return None
+        return row[4:]
+
+    def store(self, key: tuple, crc: str, md5: str, sha1: str):
+        """
+        Store the hashes of a file.
+        @param key
+            tuple of (path, device, inode, size, mtime) of the file
+        @param crc, md5, sha1
+            hashes of the file content"""
+
+        with self.__lock:
+            self.__db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                key + (crc, md5, sha1))
+            self.__uncommitted += 1
+            if self.__uncommitted >= self.COMMIT_INTERVAL:
+                self.__db.commit()
+                self.__uncommitted = 0
+
+    def close(self):
+        with self.__lock:
+            self.__db.commit()
+            self.__db.close()
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+
+from color import cDim
+from pathlib import Path
+import logging
+import sqlite3
+
+class HaveDatabase:
+    """
+    Persistent database of the ROM files in the destination directory stored in
+    a SQLite database. For every file or softlink the SHA1 of its content is stored
+    by its path. It is filled by scans and used to rebuild the destination after
+    the TOSEC DATs changed without reading the files again."""
+
+    COMMIT_INTERVAL = 1000
+
+    def __init__(self, haveFile: Path):
+        logging.debug("open have database %s", cDim(haveFile.as_posix()))
+        self.__uncommitted = 0
+        self.__db = sqlite3.connect(haveFile.as_posix())
+        self.__db.execute("CREATE TABLE IF NOT EXISTS have (path TEXT PRIMARY KEY, sha1 TEXT, link INTEGER)")
+        self.__db.execute("CREATE INDEX IF NOT EXISTS have_sha1 ON have (sha1)")
+
+    def store(self, path: Path, sha1: str, link: bool = False):
+        self.__execute("INSERT OR REPLACE INTO have VALUES (?, ?, ?)", (path.as_posix(), sha1, int(link)))
+
+    def remove(self, path: Path):
+        self.__execute("DELETE FROM have WHERE path = ?", (path.as_posix(),))
+
+    def __execute(self, statement: str, values: tuple):
+        self.__db.execute(statement, values)
+        self.__uncommitted += 1
+        if self.__uncommitted >= self.COMMIT_INTERVAL:
+            self.__db.commit()
+            self.__uncommitted = 0
+
+    def groups(self):
+        """
+        Iterate over all stored paths grouped by SHA1.
+        @return
+            generator of tuples (sha1, list of file paths, list of softlink paths)"""
+
+        self.__db.commit()
+        rows = self.__db.cursor().execute("SELECT sha1, path, link FROM have ORDER BY sha1, path")
+        sha1 = None
+        files = []
+        links = []
+        for rowSha1, path, link in rows.fetchall():
+            if rowSha1 != sha1:
+                if sha1 is not None:
+                    yield sha1, files, links
+                sha1 = rowSha1
+                files = []
+                links = []
+            (links if link else files).append(Path(path))
+        if sha1 is not None:
+            yield sha1, files, links
+
+    def close(self):
+        self.__db.commit()
+        self.__db.close()
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+
+from color import cDim
+from pathlib import Path
+from filemove import sha1File
+import errno
+import json
+import logging
+import os
+
+class MoveJournal:
+    """
+    Append only journal of a scan stored as JSON lines. Before a file is moved, linked or
+    deleted a plan record is written, after the operation a done record. A scanned record is
+    written for every source file processed completely.
+    Plan records are synced to the file before the operation starts. Done and scanned records
+    are written in batches and synced together.
+    If resume is set the journal of an interrupted scan is continued. Operations planned but not
+    done are finished or rolled back and all scanned source files are skipped. Without resume
+    an existing journal is not overwritten and FileExistsError is raised."""
+
+    BATCH_SIZE = 256
+
+    def __init__(self, journalFile: Path, resume: bool = False):
+        self.__journalFile = journalFile
+        self.__scanned = set()
+        self.__nextId = 0
+        self.__unsynced = 0
+        planned = {}
+        if resume and journalFile.exists():
+            planned = self.__read()
+        elif resume:
+            logging.warning("journal %s does not exist. Scan is started from the beginning",
+                cDim(journalFile.as_posix()))
+        elif journalFile.exists() and journalFile.stat().st_size > 0:
+            raise FileExistsError(errno.EEXIST, "journal of an earlier scan exists",
+                journalFile.as_posix())
+        self.__file = open(journalFile, "a" if resume else "w", encoding="utf-8")
+        for planId, record in planned.items():
+            self.__recover(planId, record)
+        self.sync()
+
+    def __read(self) -> dict:
+        """
+        Read the journal and return the plan records without done record"""
+
+        planned = {}
+        with open(self.__journalFile, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line may be incomplete after a crash
+                    logging.warning("journal %s has an incomplete record", cDim(self.__journalFile.as_posix()))
+                    continue
+                if "scanned" in record:
+                    self.__scanned.add(record["scanned"])
+                elif "done" in record:
+                    planned.pop(record["done"], None)
+                elif "plan" in record:
+                    planned[record["plan"]] = record
+                    self.__nextId = max(self.__nextId, record["plan"] + 1)
+        logging.info("journal %s has %s scanned files and %s unfinished operations",
+            cDim(self.__journalFile.as_posix()), len(self.__scanned), len(planned))
+        return planned
+
+    def __recover(self, planId: int, record: dict):
+        source = Path(record["source"])
+        dest = Path(record["dest"])
+        operation = record["op"]
+        try:
+            if operation == "move":
+                if dest.exists():
+                    # the move was completed, only the source of a copy may be left
+                    if source.is_file():
+                        if record.get("sha1") is None or sha1File(dest) != record["sha1"]:
+                            logging.error("destination %s of unfinished move doesn't match %s, which is kept",
+                                cDim(dest.as_posix()), cDim(source.as_posix()))
+                            return
+                        logging.warning("remove source %s of finished move to %s",
+                            cDim(source.as_posix()), cDim(dest.as_posix()))
+                        source.unlink()
+                else:
+                    for tempFile in dest.parent.glob("." + dest.name + ".*.part"):
+                        logging.warning("remove unfinished copy %s", cDim(tempFile.as_posix()))
+                        tempFile.unlink()
+                    if not source.is_file():
+                        logging.warning("file %s was not moved to %s and is scaned again",
+                            cDim(source.as_posix()), cDim(dest.as_posix()))
+            elif operation == "link":
+                if not dest.is_symlink() and not dest.exists():
+                    logging.warning("finish softlink file %s to %s", cDim(dest.as_posix()), cDim(record["target"]))
+                    dest.symlink_to(record["target"])
+            elif operation == "delete":
+                if source.is_file():
+                    # the file may have been deleted because of a duplicate changed since
+                    if record.get("sha1") is None or sha1File(dest) != record["sha1"]:
+                        logging.error("file %s of unfinished delete doesn't match duplicate %s, which is kept",
+                            cDim(dest.as_posix()), cDim(source.as_posix()))
+                        return
+                    logging.warning("finish delete of duplicate file %s", cDim(source.as_posix()))
+                    source.unlink()
+        except OSError as error:
+            logging.error("unfinished %s of %s to %s can't be recovered: %s",
+                operation, cDim(source.as_posix()), cDim(dest.as_posix()), error)
+            return
+        self.done(planId)
+
+    def plan(self, operation: str, source: str, dest: Path, sha1: str = None, target: Path = None) -> int:
+        """
+        Record an operation before it is started.
+        @param operation
+            either move, link or delete
+        @return
+            id of the operation to pass to done"""
+
+        planId = self.__nextId
+        self.__nextId += 1
+        record = {"plan": planId, "op": operation, "source": source, "dest": dest.as_posix()}
+        if sha1 is not None:
+            record["sha1"] = sha1
+        if target is not None:
+            record["target"] = target.as_posix()
+        self.__file.write(json.dumps(record) + "\n")
+        self.sync()
+        return planId
+
+    def done(self, planId: int):
+        self.__write({"done": planId})
+
+    def scanned(self, source: Path):
+        self.__scanned.add(source.as_posix())
+        self.__write({"scanned": source.as_posix()})
+
+    def isScanned(self, source: Path) -> bool:
+        return source.as_posix() in self.__scanned
+
+    def __write(self, record: dict):
+        self.__file.write(json.dumps(record) + "\n")
+        self.__unsynced += 1
+        if self.__unsynced >= self.BATCH_SIZE:
+            self.sync()
+
+    def sync(self):
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__unsynced = 0
+
+    def close(self):
+        self.sync()
+        self.__file.close()
@@ -0,0 +1,189 @@
+#!/usr/bin/python
+
+from color import cDim
+from filemove import FileMoveException, sha1File
+from journal import MoveJournal
+from operations import FileOperations
+from pathlib import Path
+from scanfile import IScanFileReader, PlainFileReader
+import json
+import logging
+import os
+
+class MovePlan:
+    """
+    Moves, softlinks and deletes decided by a scan without changing any file. The plan
+    is stored as JSON document with the totals of files and bytes at the top, so it can be
+    reviewed before it is applied. Source files are stored with size and modification time
+    and are only changed by apply if they are unchanged. Deletes of duplicates are stored
+    with the SHA1 of the duplicate."""
+
+    VERSION = 2
+
+    def __init__(self):
+        self.moves = []
+        self.links = []
+        self.deletes = []
+
+    def totals(self) -> dict:
+        return {"moves": len(self.moves), "moveBytes": sum(move["size"] for move in self.moves),
+            "links": len(self.links),
+            "deletes": len(self.deletes), "deleteBytes": sum(delete["size"] for delete in self.deletes)}
+
+    def save(self, planFile: Path):
+        totals = self.totals()
+        logging.warning("plan %s moves %s files with %s bytes, links %s files and deletes %s files with %s bytes",
+            cDim(planFile.as_posix()), totals["moves"], totals["moveBytes"], totals["links"],
+            totals["deletes"], totals["deleteBytes"])
+        with open(planFile, "w", encoding="utf-8") as file:
+            json.dump({"version": self.VERSION, "totals": totals, "moves": self.moves, "links": self.links,
+                "deletes": self.deletes}, file, indent=1)
+
+    @classmethod
+    def load(cls, planFile: Path):
+        with open(planFile, encoding="utf-8") as file:
+            document = json.load(file)
+        if document.get("version") != cls.VERSION:
+            raise ValueError(f"plan {planFile.as_posix()} has an unsupported version")
+        plan = cls()
+        plan.moves = document["moves"]
+        plan.links = document["links"]
+        plan.deletes = document["deletes"]
+        return plan
+
+class PlannedOperations(FileOperations):
+    """
+    FileOperations recording every operation in a MovePlan instead of executing it.
+    Only plain files can be planned. Entries of compressed containers are skipped."""
+
+    immediate = False
+
+    def __init__(self, plan: MovePlan):
+        super().__init__()
+        self.__plan = plan
+
+    def createDirectory(self, directory: Path):
+        pass
+
+    def removeSymlink(self, destFile: Path):
+        # a symlink at the destination is replaced by apply
+        pass
+
+    def move(self, source: IScanFileReader, destFile: Path, sha1: str, readOnly: bool = False):
+        if not isinstance(source, PlainFileReader):
+            raise OSError(f"entry {source.as_posix()} of a compressed file can't be planned")
+        sourceStat = source.stat()
+        logging.info("plan rename file %s to %s", cDim(source.as_posix()), cDim(destFile.as_posix()))
+        self.__plan.moves.append({"source": source.as_posix(), "dest": destFile.as_posix(), "sha1": sha1,
+            "size": sourceStat.st_size, "mtime": sourceStat.st_mtime_ns, "readOnly": readOnly})
+
+    def link(self, source: IScanFileReader, destFile: Path, linkTo: Path):
+        logging.info("plan softlink file %s to %s", cDim(destFile.as_posix()), cDim(linkTo.as_posix()))
+        self.__plan.links.append({"source": source.as_posix(), "dest": destFile.as_posix(),
+            "target": linkTo.as_posix()})
+
+    def delete(self, source: IScanFileReader, duplicateOf: Path, sha1: str = None):
+        if not isinstance(source, PlainFileReader):
+            logging.warning("entry %s of a compressed file can't be planned for delete", cDim(source.as_posix()))
+            return
+        sourceStat = source.stat()
+        logging.info("plan delete duplicate file %s", cDim(source.as_posix()))
+        self.__plan.deletes.append({"source": source.as_posix(), "duplicateOf": duplicateOf.as_posix(),
+            "sha1": sha1, "size": sourceStat.st_size, "mtime": sourceStat.st_mtime_ns})
+
+def statUnchanged(record: dict) -> os.stat_result:
+    """
+    Get the stat of a planned source file.
+    @return
+        the stat or None if the file is missing or was changed since planning"""
+
+    try:
+        sourceStat = os.stat(record["source"])
+    except OSError as error:
+        logging.error("planned file %s can't be found: %s", cDim(record["source"]), error)
+        return None
+    if sourceStat.st_size != record["size"] or sourceStat.st_mtime_ns != record["mtime"]:
+        logging.error("planned file %s was changed and is skipped", cDim(record["source"]))
+        return None
+    return sourceStat
+
+def applyPlan(planFile: Path, operations: FileOperations, journal: MoveJournal = None):
+    """
+    Execute a saved MovePlan. Moves are done first ordered by the device of the source
+    and the destination directory, so every destination directory is filled at once.
+    Softlinks and deletes of duplicates follow. Changed or missing source files and
+    existing destination files are skipped. A duplicate is only deleted if the file it
+    duplicates was moved by this apply or has the planned size and SHA1. If a journal is given every applied source
+    is recorded and sources recorded before are skipped.
+    @param planFile
+        the plan to execute
+    @param operations
+        the operations to execute the plan with"""
+
+    plan = MovePlan.load(planFile)
+    totals = plan.totals()
+    logging.info("apply plan %s with %s moves of %s bytes", cDim(planFile.as_posix()),
+        totals["moves"], totals["moveBytes"])
+    moves = []
+    for move in plan.moves:
+        if journal is not None and journal.isScanned(Path(move["source"])):
+            continue
+        sourceStat = statUnchanged(move)
+        if sourceStat is not None:
+            moves.append((sourceStat.st_dev, Path(move["dest"]).parent.as_posix(), move["source"], move))
+    moves.sort(key=lambda entry: entry[:3])
+    directories = set()
+    moved = set()
+    for _, _, _, move in moves:
+        source = Path(move["source"])
+        destFile = Path(move["dest"])
+        if not prepareDestination(destFile, operations, directories):
+            continue
+        try:
+            operations.move(PlainFileReader(source), destFile, move["sha1"], move["readOnly"])
+        except (OSError, FileMoveException) as error:
+            logging.error("rename file %s to %s failed: %s", cDim(source.as_posix()), cDim(destFile.as_posix()), error)
+            continue
+        moved.add(move["dest"])
+        if journal is not None:
+            journal.scanned(source)
+    for link in plan.links:
+        destFile = Path(link["dest"])
+        if not Path(link["target"]).exists():
+            logging.error("softlink %s is skipped because %s does not exist", cDim(link["dest"]), cDim(link["target"]))
+        elif prepareDestination(destFile, operations, directories):
+            operations.link(PlainFileReader(Path(link["source"])), destFile, Path(link["target"]))
+    for delete in plan.deletes:
+        if delete["duplicateOf"] not in moved and not isDuplicate(delete):
+            logging.error("duplicate file %s is kept because %s doesn't have its content",
+                cDim(delete["source"]), cDim(delete["duplicateOf"]))
+        elif statUnchanged(delete) is not None:
+            logging.warning("delete Duplicate file %s", cDim(delete["source"]))
+            operations.delete(PlainFileReader(Path(delete["source"])), Path(delete["duplicateOf"]), delete["sha1"])
+
+def isDuplicate(delete: dict) -> bool:
+    """
+    Check the file a planned delete duplicates has the size and SHA1 of the deleted file"""
+
+    try:
+        if os.stat(delete["duplicateOf"]).st_size != delete["size"]:
+            return False
+        return delete["sha1"] is not None and sha1File(Path(delete["duplicateOf"])) == delete["sha1"]
+    except OSError:
+        return False
+
+def prepareDestination(destFile: Path, operations: FileOperations, directories: set) -> bool:
+    """
+    Remove a symlink at the destination and create missing directories.
+    @return
+        false if a file already exists at the destination"""
+
+    if destFile.is_symlink():
+        operations.removeSymlink(destFile)
+    elif destFile.exists():
+        logging.error("destination file %s already exists and is skipped", cDim(destFile.as_posix()))
+        return False
+    if destFile.parent not in directories:
+        operations.createDirectory(destFile.parent)
+        directories.add(destFile.parent)
+    return True
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+
+from color import cDim
+from journal import MoveJournal
+from pathlib import Path
+from scanfile import IScanFileReader
+import logging
+import os
+import stat
+
+class FileOperations:
+    """
+    Changes of the file system decided by StrategyRename. The operations are
+    executed immediately. If a MoveJournal is given every move, softlink and delete
+    is recorded before and after it is done.
+    Errors of an operation are raised to the caller."""
+
+    # operations change the file system when they are called
+    immediate = True
+
+    def __init__(self, journal: MoveJournal = None):
+        self.__journal = journal
+
+    def createDirectory(self, directory: Path):
+        logging.debug("creating directory %s", cDim(directory.as_posix()))
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def removeSymlink(self, destFile: Path):
+        destFile.unlink()
+
+    def move(self, source: IScanFileReader, destFile: Path, sha1: str, readOnly: bool = False):
+        logging.info("rename file %s to %s", cDim(source.as_posix()), cDim(destFile.as_posix()))
+        planId = self.__plan("move", source, destFile, sha1)
+        # a failed move stays planned, so a resume checks the source and the destination
+        source.rename(destFile, sha1)
+        self.__done(planId)
+        if readOnly:
+            self.removeWritePermission(destFile)
+
+    def link(self, source: IScanFileReader, destFile: Path, linkTo: Path):
+        logging.info("softlink file %s to %s", cDim(destFile.as_posix()), cDim(linkTo.as_posix()))
+        planId = self.__plan("link", source, destFile, target=linkTo)
+        destFile.symlink_to(linkTo)
+        self.__done(planId)
+
+    def delete(self, source: IScanFileReader, duplicateOf: Path, sha1: str = None):
+        planId = self.__plan("delete", source, duplicateOf, sha1)
+        source.unlink()
+        self.__done(planId)
+
+    def __plan(self, operation: str, source: IScanFileReader, destFile: Path, sha1: str = None,
+            target: Path = None) -> int:
+        if self.__journal is None:
+            return None
+        return self.__journal.plan(operation, source.as_posix(), destFile, sha1, target)
+
+    def __done(self, planId: int):
+        if planId is not None:
+            self.__journal.done(planId)
+
+    def removeWritePermission(self, destFile: Path):
+        currentPermission = stat.S_IMODE(os.lstat(destFile).st_mode)
+        os.chmod(destFile, currentPermission & (~stat.S_IWUSR) & (~stat.S_IWGRP) & (~stat.S_IWOTH))
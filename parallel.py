@@ -0,0 +1,34 @@
+#!/usr/bin/python
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+def orderedMap(func, items, jobs: int):
+    """
+    Apply func to every item and yield tuples of (item, func(item)) in the order of items.
+    If jobs is greater than one func is executed by a pool of worker threads. Only a
+    limited number of items is processed ahead of the consumer, so memory stays bounded.
+    The consumer of the generator always runs in the calling thread.
+    @param func
+        function executed for every item
+    @param items
+        iterable of the items to process. Is consumed lazily
+    @param jobs
+        number of worker threads. 1 or less process the items in the calling thread
+    @return
+        generator of (item, result) tuples"""
+
+    if jobs <= 1:
+        for item in items:
+            yield item, func(item)
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) >= jobs * 2:
+                done, future = pending.popleft()
+                yield done, future.result()
+        while len(pending) > 0:
+            done, future = pending.popleft()
+            yield done, future.result()
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+from color import cDim
+from filemove import FileMoveException
+from havedb import HaveDatabase
+from operations import FileOperations
+from pathlib import Path
+from scanfile import PlainFileReader
+from strategyrename import Matcher
+import logging
+import os
+
+def rebuildDestination(destPath: Path, matcher: Matcher, haveDb: HaveDatabase, operations: FileOperations):
+    """
+    Rebuild the destination directory for changed TOSEC DATs without reading any file.
+    The paths of every SHA1 in the HaveDatabase are compared with the paths expected by
+    the loaded DATs. Only different paths are changed:
+    - no file is at an expected path -> a stored file is moved there
+    - other expected paths are missing -> softlinks to the file are created
+    - softlinks not expected anymore -> are removed
+    - files not expected anymore or SHA1 not in any DAT -> are reported
+    - stored files deleted since the last scan -> are removed from the HaveDatabase and
+      their softlinks are removed if no other file with the SHA1 is left
+    @param destPath
+        the destination directory
+    @param matcher
+        Matcher with the ROMs of the new DATs
+    @param haveDb
+        the files in the destination directory
+    @param operations
+        the operations to change the destination with"""
+
+    counts = {"moved": 0, "linked": 0, "unlinked": 0, "obsolete": 0}
+    for sha1, files, links in haveDb.groups():
+        files = existingFiles(files, haveDb)
+        if len(files) == 0:
+            counts["unlinked"] += removeDanglingLinks(links, haveDb, operations)
+            continue
+        roms = matcher.findSha1(sha1)
+        if roms is None:
+            for file in files:
+                logging.warning("file %s is not in any TOSEC DAT anymore", cDim(file.as_posix()))
+                counts["obsolete"] += 1
+            continue
+        expected = [rom.getFileName(destPath) for rom in roms]
+        kept = [file for file in files if file in expected]
+        if len(kept) == 0:
+            moved = moveToExpected(files, expected, sha1, haveDb, operations)
+            if moved is None:
+                continue
+            counts["moved"] += 1
+            files.remove(moved[0])
+            kept.append(moved[1])
+        for link in links:
+            if link == kept[0]:
+                continue
+            if not os.path.islink(link):
+                haveDb.remove(link)
+            elif link not in expected or os.readlink(link) != kept[0].as_posix():
+                operations.removeSymlink(link)
+                haveDb.remove(link)
+                counts["unlinked"] += 1
+        for file in files:
+            if file not in kept:
+                logging.warning("file %s is not expected by any TOSEC DAT anymore", cDim(file.as_posix()))
+                counts["obsolete"] += 1
+        for path in expected:
+            if path in kept or os.path.lexists(path):
+                continue
+            operations.createDirectory(path.parent)
+            operations.link(PlainFileReader(kept[0]), path, kept[0])
+            haveDb.store(path, sha1, True)
+            counts["linked"] += 1
+    logging.warning("rebuild of %s moved %s files, created %s softlinks, removed %s softlinks and found %s obsolete files",
+        cDim(destPath.as_posix()), counts["moved"], counts["linked"], counts["unlinked"], counts["obsolete"])
+
+def existingFiles(files: list[Path], haveDb: HaveDatabase) -> list[Path]:
+    """
+    Remove stored files deleted since the last scan from the HaveDatabase.
+    @return
+        the stored files still existing"""
+
+    existing = []
+    for file in files:
+        if file.is_file():
+            existing.append(file)
+        else:
+            logging.error("stored file %s does not exist anymore", cDim(file.as_posix()))
+            haveDb.remove(file)
+    return existing
+
+def removeDanglingLinks(links: list[Path], haveDb: HaveDatabase, operations: FileOperations) -> int:
+    """
+    Remove the stored softlinks of a SHA1 without any existing file.
+    @return
+        the number of removed softlinks"""
+
+    removed = 0
+    for link in links:
+        if os.path.islink(link) and not link.exists():
+            operations.removeSymlink(link)
+            removed += 1
+        haveDb.remove(link)
+    return removed
+
+def moveToExpected(files: list[Path], expected: list[Path], sha1: str, haveDb: HaveDatabase,
+        operations: FileOperations) -> tuple:
+    """
+    Move the first file which can be moved to the first free expected path.
+    @return
+        tuple of the moved file and its new path or None if no file was moved"""
+
+    target = next((path for path in expected if not os.path.lexists(path) or os.path.islink(path)), None)
+    if target is None:
+        logging.error("files %s can't be moved because all expected paths are used by other files",
+            cDim(", ".join(file.as_posix() for file in files)))
+        return None
+    for file in files:
+        if os.path.islink(target):
+            operations.removeSymlink(target)
+        operations.createDirectory(target.parent)
+        try:
+            operations.move(PlainFileReader(file), target, sha1)
+        except (OSError, FileMoveException) as error:
+            logging.error("rename file %s to %s failed: %s", cDim(file.as_posix()), cDim(target.as_posix()), error)
+            continue
+        haveDb.remove(file)
+        haveDb.store(target, sha1)
+        return file, target
+    return None
@@ -1,10 +1,13 @@
 #!/usr/bin/python
 
 from color import cDim
+from filemove import moveFile
+from hashcache import HashCache
 from pathlib import Path
 import binascii
 import hashlib
 import logging
+import os
 
 class IScanFileReader:
     """
@@ -22,23 +25,52 @@ class IScanFileReader:
         pass
 
     def size(self):
+        """
+        @return
+            size of the file or None if unknown before reading the file"""
+
         pass
 
     def as_posix(self):
         pass
 
-    def rename(self, destFile: Path):
+    def rename(self, destFile: Path, sha1: str = None):
         pass
 
     def unlink(self):
         pass
 
+    def crc(self) -> str:
+        """
+        CRC of the file if it is known without reading the file.
+        @return
+            CRC as hex string or None if unknown"""
+
+        return None
+
+    def release(self):
+        """
+        Free resources kept after the file was processed"""
+
+        pass
+
+    def cacheKey(self) -> tuple:
+        """
+        Key identifying the current content of the file for a HashCache.
+        @return
+            tuple of (path, device, inode, size, mtime) or None if the file can't be cached"""
+
+        return None
+
 class PlainFileReader(IScanFileReader):
     """
-    Implementation of IScanFileReader for a file on a filesystem."""
+    Implementation of IScanFileReader for a file on a filesystem.
+    If the file was found by os.scandir the DirEntry can be given to reuse its cached stat."""
 
-    def __init__(self, fileName: Path):
+    def __init__(self, fileName: Path, dirEntry: os.DirEntry = None):
         self.__fileName = fileName
+        self.__dirEntry = dirEntry
+        self.__stat = None
         self.__file = None
         self.name = self.__fileName.name
 
@@ -59,7 +91,12 @@ class PlainFileReader(IScanFileReader):
         self.__file = None
 
     def size(self):
-        return self.__fileName.stat().st_size
+        return self.stat().st_size
+
+    def stat(self) -> os.stat_result:
+        if self.__stat is None:
+            self.__stat = self.__dirEntry.stat() if self.__dirEntry is not None else self.__fileName.stat()
+        return self.__stat
 
     def read(self, size: int):
         return self.__file.read(size)
@@ -67,51 +104,153 @@ class PlainFileReader(IScanFileReader):
     def as_posix(self):
         return self.__fileName.as_posix()
 
-    def rename(self, destFile: Path):
-        self.__fileName.rename(destFile)
+    def rename(self, destFile: Path, sha1: str = None):
+        moveFile(self.__fileName, destFile, sha1)
 
     def unlink(self):
         self.__fileName.unlink()
 
+    def cacheKey(self) -> tuple:
+        stat = self.stat()
+        return (self.__fileName.as_posix(), stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+class Crc32:
+    """
+    CRC32 calculation with the same interface as the hashlib objects."""
+
+    def __init__(self):
+        self.__crc = 0
+
+    def update(self, data: bytes):
+        self.__crc = binascii.crc32(data, self.__crc)
+
+    def hexdigest(self) -> str:
+        return format(self.__crc & 0xffffffff, "0>8x")
+
+class ReplayBuffer:
+    """
+    Keeps read data up to a limit in memory to calculate further hashes without
+    reading the file again. If the limit is exceeded chunks is set to None."""
+
+    def __init__(self, limit: int):
+        self.__limit = limit
+        self.__size = 0
+        self.chunks = []
+
+    def append(self, data: bytes):
+        if self.chunks is None:
+            return
+        self.__size += len(data)
+        if self.__size > self.__limit:
+            self.chunks = None
+        else:
+            self.chunks.append(data)
+
 class ScanFile:
     """
     ScanFile represents a found file on the filesystem.
     On init the given file is read to calculate file size, CRC, SHA1 and MD5.
+    If a HashCache is given and contains the unchanged file the hashes are taken
+    from the cache instead of reading the file.
+    If isCandidate is given and returns false for the file size and the CRC known by
+    the reader (e.g. from a ZIP directory) the file isn't read at all and isLoaded stays false.
+    If staged is set only the CRC is calculated first. MD5 and SHA1 are only calculated
+    if isCandidate returns true for the CRC, otherwise they stay None. Small files are
+    replayed from memory, bigger files are read a second time.
     If the given file coudn't be read an exception is raised."""
 
-    def __init__(self, fileName: IScanFileReader):
+    REPLAY_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, fileName: IScanFileReader, hashCache: HashCache = None, isCandidate = None,
+            staged: bool = False):
         self.fileName = fileName
         self.isLoaded = False
+        try:
+            if isCandidate is not None:
+                self.size = fileName.size()
+                if self.size is not None and not isCandidate(self.size, fileName.crc()):
+                    logging.debug("file %s not loaded because no ROM has size %s and crc %s",
+                        cDim(self.fileName.as_posix()), self.size, fileName.crc())
+                    return
+            cacheKey = fileName.cacheKey() if hashCache is not None else None
+            if cacheKey is not None:
+                cached = hashCache.load(cacheKey)
+                if cached is not None and (cached[2] is not None
+                        or (isCandidate is not None and not isCandidate(cacheKey[3], cached[0]))):
+                    self.size = cacheKey[3]
+                    self.crc, self.md5, self.sha1 = cached
+                    self.isLoaded = True
+                    logging.info("scan file from cache %s", cDim(str(vars(self))))
+                    return
+        except OSError as error:
+            logging.error("stat file %s caused an error %s",
+                cDim(self.fileName.as_posix()), cDim(str(error)))
+            return
+        self.__hashFile(isCandidate if staged else None)
+        if self.isLoaded and cacheKey is not None:
+            hashCache.store(cacheKey, self.crc, self.md5, self.sha1)
+
+    def __hashFile(self, isCandidate):
         logging.debug("load file %s into memory", cDim(self.fileName.as_posix()))
         try:
-            fileName.open()
-            self.size = fileName.size()
-            fileLoaded = 0
+            self.size = self.fileName.size()
+            rawCRC = Crc32()
             rawMD5 = hashlib.md5()
             rawSHA1 = hashlib.sha1()
-            rawCRC = 0
-            while True:
-                fileData = fileName.read(1024*1024)
-                if len(fileData) == 0:
-                    break
-                fileLoaded += len(fileData)
-                rawMD5.update(fileData)
-                rawSHA1.update(fileData)
-                rawCRC = binascii.crc32(fileData, rawCRC)
-
+            if isCandidate is None:
+                fileLoaded = self.__readFile([rawCRC.update, rawMD5.update, rawSHA1.update])
+            else:
+                replay = ReplayBuffer(self.REPLAY_SIZE)
+                fileLoaded = self.__readFile([rawCRC.update, replay.append])
             logging.debug("file %s bytes loaded %s", cDim(self.fileName.as_posix()), self.size)
-            self.crc = format(rawCRC & 0xffffffff, "0>8x")
-            self.md5 = rawMD5.hexdigest()
-            self.sha1 = rawSHA1.hexdigest()
-
+            if self.size is None:
+                self.size = fileLoaded
+            self.crc = rawCRC.hexdigest()
             if self.size != fileLoaded:
                 logging.error("file %s file size %s does not match file system size %s",
-                    cDim(self.fileName.as_posix()), cDim(self.size), cDim(fileLoaded))
-            else:
-                self.isLoaded = True
-                logging.info("scan file %s", cDim(str(vars(self))))
+                    cDim(self.fileName.as_posix()), cDim(str(self.size)), cDim(str(fileLoaded)))
+                return
+
+            if isCandidate is not None:
+                if not isCandidate(self.size, self.crc):
+                    self.md5 = None
+                    self.sha1 = None
+                    self.isLoaded = True
+                    logging.info("scan file without ROM candidate %s", cDim(str(vars(self))))
+                    return
+                if replay.chunks is None:
+                    fileLoaded = self.__readFile([rawMD5.update, rawSHA1.update])
+                    if self.size != fileLoaded:
+                        logging.error("file %s changed while reading", cDim(self.fileName.as_posix()))
+                        return
+                else:
+                    for chunk in replay.chunks:
+                        rawMD5.update(chunk)
+                        rawSHA1.update(chunk)
+            self.md5 = rawMD5.hexdigest()
+            self.sha1 = rawSHA1.hexdigest()
+            self.isLoaded = True
+            logging.info("scan file %s", cDim(str(vars(self))))
         except OSError as error:
             logging.error("open file %s caused an error %s",
-                cDim(self.fileName.as_posix()), cDim(error))
-        else:
-            fileName.close()
+                cDim(self.fileName.as_posix()), cDim(str(error)))
+
+    def __readFile(self, consumers: list) -> int:
+        """
+        Read the complete file and pass every chunk to the given consumers.
+        @return
+            number of bytes read"""
+
+        self.fileName.open()
+        try:
+            fileLoaded = 0
+            while True:
+                fileData = self.fileName.read(1024*1024)
+                if len(fileData) == 0:
+                    break
+                fileLoaded += len(fileData)
+                for consumer in consumers:
+                    consumer(fileData)
+            return fileLoaded
+        finally:
+            self.fileName.close()
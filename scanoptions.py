@@ -0,0 +1,44 @@
+#!/usr/bin/python
+
+from dataclasses import dataclass, fields
+import argparse
+
+@dataclass
+class ScanOptions:
+    """
+    Options of a single scan run by Tosec.scanDirectory. If source is given matching
+    files are moved from source to dest, otherwise dest is diagnosed without moving.
+    The defaults are the same as for the command line."""
+
+    dest: str
+    source: str = None
+    hashCache: str = None
+    destIndex: str = None
+    journal: str = None
+    resume: bool = False
+    plan: str = None
+    fastAudit: bool = False
+    auditSample: float = 0
+    haveDb: str = None
+    rebuild: bool = False
+    jobs: int = 1
+    stagedHash: bool = False
+    delDupes: bool = False
+    diag: bool = False
+    noHaving: bool = False
+    noMissing: bool = False
+    report: str = None
+    reportFormat: str = "jsonl"
+    noWritePermission: bool = False
+    recursive: bool = False
+    scanCompressed: bool = False
+    nestedDepth: int = 2
+    watch: bool = False
+
+    @classmethod
+    def fromNamespace(cls, params: argparse.Namespace):
+        """
+        Create the options from parsed command line arguments. Other arguments are ignored
+        and missing arguments keep their default."""
+
+        return cls(**{field.name: getattr(params, field.name, field.default) for field in fields(cls)})
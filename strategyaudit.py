@@ -0,0 +1,66 @@
+#!/usr/bin/python
+
+from color import cDim
+from hashcache import HashCache
+from pathlib import Path
+from scanfile import PlainFileReader, ScanFile
+from strategyrename import Matcher
+from strategyscan import StrategyScan
+import logging
+import os
+import random
+
+class StrategyAudit(StrategyScan):
+    """
+    Strategy to scan the destination directory trusting names and sizes.
+    Every ROM entry is expected at the path given by TosecGameRom.getFileName. A file at
+    the expected path of a ROM with the same size is reported as match without reading it.
+    All other files are hashed and matched like by StrategyScan.
+    If sample is given this percentage of the trusted files is hashed as well, so damaged
+    files are found over time. A damaged sampled file is reported as not matching."""
+
+    def __init__(self, destPath: Path, matcher: Matcher, jobs: int = 1, hashCache: HashCache = None,
+            staged: bool = False, recursive: bool = False, sample: float = 0):
+        super().__init__(matcher, jobs, hashCache, staged, recursive)
+        self.__sample = sample / 100
+        self.__expected = {}
+        for rom in matcher.roms():
+            self.__expected.setdefault(rom.getFileName(destPath).as_posix(), []).append(rom)
+        logging.debug("audit expects %s files in %s", len(self.__expected), cDim(destPath.as_posix()))
+
+    def __expectedRoms(self, reader: PlainFileReader) -> list:
+        """
+        Get the ROM entries expected at the path of the file with the size of the file"""
+
+        roms = self.__expected.get(reader.as_posix())
+        if roms is None:
+            return []
+        try:
+            size = reader.size()
+        except OSError as error:
+            logging.error("stat file %s caused an error %s", cDim(reader.as_posix()), cDim(str(error)))
+            return []
+        return [rom for rom in roms if rom.size == size]
+
+    def _loadFile(self, entry: Path, dirEntry: os.DirEntry = None) -> ScanFile:
+        reader = PlainFileReader(entry, dirEntry)
+        trusted = len(self.__expectedRoms(reader)) > 0 and random.random() >= self.__sample
+        if trusted:
+            # an isCandidate rejecting the file keeps it unread
+            scan = ScanFile(reader, None, lambda size, crc: False)
+        else:
+            scan = ScanFile(reader, self._hashCache, self._matcher.isCandidate, self._staged)
+        # a file not hashed on purpose must not be mistaken for a file which failed to read
+        scan.trusted = trusted
+        return scan
+
+    def _scanFile(self, entry: Path, scan: ScanFile):
+        if not scan.trusted:
+            super()._scanFile(entry, scan)
+            return
+        roms = self.__expectedRoms(scan.fileName)
+        if len(roms) > 0:
+            logging.debug("file %s trusted by name and size", cDim(entry.as_posix()))
+            self.doStrategyMatch(scan, roms)
+        else:
+            self.doStrategyNoMatch(scan)
@@ -1,6 +1,8 @@
 #!/usr/bin/python
 
 from color import cDim, cGreen, cRed, cYellow
+from diagreport import DiagReport
+from pathlib import Path
 from scanfile import ScanFile
 from strategy import Strategy
 from tosecdat import TosecGameRom
@@ -15,15 +17,18 @@ class StrategyDiag(Strategy):
     - Duplicates: ROMs found but entry was already found before
     - Unknown: Either
             files not matching any TOSEC entry OR
-            file has not the expected name for the TOSEC entry"""
+            file has not the expected name for the TOSEC entry
+    If a DiagReport is given every file is written to it while scanning and only a summary
+    is printed. Duplicates and unknown files are then counted instead of kept in memory."""
 
-    def __init__(self, noMissing: bool, noHaving: bool):
+    def __init__(self, noMissing: bool, noHaving: bool, report: DiagReport = None):
         super().__init__()
         self.goodBySystem = {}
         self.dups = {}
         self.bads = []
         self.__noMissing = noMissing
         self.__noHaving = noHaving
+        self.__report = report
 
     def doStrategyMatch(self, scanFile: ScanFile, tosecRomMatches: list[TosecGameRom]) -> ScanFile:
         found = super().doStrategyMatch(scanFile, tosecRomMatches) or scanFile
@@ -31,34 +36,58 @@ class StrategyDiag(Strategy):
         foundRoms = [entry for entry in tosecRomMatches if found.fileName.name == entry.name]
         if len(foundRoms) > 0:
             for rom in foundRoms:
-                if rom in self.goodBySystem.get(rom.game.header, {}):
-                    self.dups.setdefault(rom, []).append(found.fileName)
+                if self.__isFound(rom):
+                    self.__addDuplicate(rom, found.fileName)
                 else:
                     self.goodBySystem.setdefault(rom.game.header, {}).setdefault(rom, found.fileName)
+                    if self.__report is not None:
+                        self.__report.write("having", found.fileName, rom)
             return found
         logging.debug("found file %s not matching any TOSEC name with %s",
             cDim(found.fileName.name), cDim(tosecRomMatches[0].sha1))
-        self.bads.append([found.fileName, tosecRomMatches[0]])
+        if self.__isFound(tosecRomMatches[0]):
+            self.__addDuplicate(tosecRomMatches[0], found.fileName)
+        else:
+            # the ROM may still be found with the expected name, so it is decided by doFinal
+            self.bads.append([found.fileName, tosecRomMatches[0]])
         return None
 
     def doStrategyNoMatch(self, scanFile: ScanFile):
         super().doStrategyNoMatch(scanFile)
         logging.debug("diag file don't match %s", cDim(scanFile.fileName.as_posix()))
-        self.bads.append([scanFile.fileName, None])
+        if self.__report is not None:
+            self.__report.write("unknown", scanFile.fileName)
+        else:
+            self.bads.append([scanFile.fileName, None])
+
+    def __isFound(self, rom: TosecGameRom) -> bool:
+        return rom in self.goodBySystem.get(rom.game.header, {})
+
+    def __addDuplicate(self, rom: TosecGameRom, fileName: Path):
+        if self.__report is not None:
+            self.__report.write("duplicate", fileName, rom)
+        else:
+            self.dups.setdefault(rom, []).append(fileName)
 
     def doFinal(self):
         super().doFinal()
-        for bad in list(self.bads):
-            if bad[1] is not None and self.goodBySystem.get(bad[1].game.header, {}).get(bad[1]) is not None:
-                self.dups.setdefault(bad[1], []).append(bad[0])
-                self.bads.remove(bad)
+        bads = []
+        for bad in self.bads:
+            if bad[1] is not None and self.__isFound(bad[1]):
+                self.__addDuplicate(bad[1], bad[0])
+            else:
+                bads.append(bad)
+        self.bads = bads
+        if self.__report is not None:
+            self.__reportFinal()
+            return
         for good in self.goodBySystem.keys():
             having = self.goodBySystem[good].keys()
             print()
             print(f"found {len(having)}/{len(good.roms)} of {cDim(good.name)}")
             missing = dict(good.roms)
             for rom in having:
-                missing.pop(rom.sha1, None)
+                missing.pop(rom.sha1Digest, None)
             if len(missing) > 0 and not self.__noMissing:
                 print(cRed("Missing"))
                 miss = lambda x: f"{x.name} - {x.sha1}"
@@ -79,6 +108,27 @@ class StrategyDiag(Strategy):
             bad = lambda x: cDim(x[0].as_posix()) if x[1] is None else f"{cDim(x[0].as_posix())} should be {cDim(x[1].name)}"
             self.__printInOrder(bad, self.bads)
 
+    def __reportFinal(self):
+        """
+        Write the misnamed files and the missing ROMs to the report and print a summary"""
+
+        for bad in self.bads:
+            self.__report.write("misnamed", bad[0], bad[1])
+        for good in self.goodBySystem.keys():
+            having = self.goodBySystem[good]
+            print(f"found {len(having)}/{len(good.roms)} of {cDim(good.name)}")
+            if self.__noMissing:
+                continue
+            found = {rom.sha1Digest for rom in having}
+            for sha1Digest, roms in good.roms.items():
+                if sha1Digest not in found:
+                    for rom in roms:
+                        self.__report.write("missing", None, rom)
+        counts = self.__report.counts
+        print(f"{cGreen('Having')} {counts['having']}, {cRed('Missing')} {counts['missing']}, "
+            f"{cYellow('Duplicates')} {counts['duplicate']}, "
+            f"{cYellow('Unknown')} {counts['unknown'] + counts['misnamed']}")
+
     def __flat(self, y: dict):
         flat = []
         for values in y.values():
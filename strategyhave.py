@@ -0,0 +1,36 @@
+#!/usr/bin/python
+
+from color import cDim
+from havedb import HaveDatabase
+from pathlib import Path
+from scanfile import ScanFile
+from strategy import Strategy
+from tosecdat import TosecGameRom
+import logging
+
+class StrategyHave(Strategy):
+    """
+    Strategy to store every ROM file found in the destination directory in a HaveDatabase.
+    The file returned by the chained strategy is stored, so it must be chained to a strategy
+    returning the file in the destination directory. Without a chained strategy the scanned
+    file itself is stored. Softlinks of the other matching ROM entries are stored as well."""
+
+    def __init__(self, haveDb: HaveDatabase, destPath: Path):
+        super().__init__()
+        self.__haveDb = haveDb
+        self.__destPath = destPath
+
+    def doStrategyMatch(self, scanFile: ScanFile, tosecRomMatches: list[TosecGameRom]) -> ScanFile:
+        found = super().doStrategyMatch(scanFile, tosecRomMatches) if self.chain is not None else scanFile
+        if found is None:
+            return None
+        # files trusted by a fast audit are not hashed
+        sha1 = found.sha1 if found.isLoaded else tosecRomMatches[0].sha1
+        foundPath = Path(found.fileName.as_posix())
+        logging.debug("have file %s", cDim(foundPath.as_posix()))
+        self.__haveDb.store(foundPath, sha1)
+        for rom in tosecRomMatches:
+            romPath = rom.getFileName(self.__destPath)
+            if romPath != foundPath and romPath.is_symlink():
+                self.__haveDb.store(romPath, sha1, True)
+        return found
@@ -1,27 +1,52 @@
 #!/usr/bin/python
 
 from color import cDim
+from destindex import DestinationIndex
+from filemove import FileMoveException
+from hashcache import HashCache
+from operations import FileOperations
 from pathlib import Path
 from scanfile import PlainFileReader, ScanFile
 from strategy import Strategy
 from tosecdat import TosecGameRom
+import copy
 import logging
-import os
-import stat
 
 class Matcher:
     """
     Search files in the given ROM list. May return a list of TOSEC rom entries matching
     the file or None if no match could be found.
-    Only accept matches with SHA1, MD5, size & CRC equal the TOSEC entry"""
+    Only accept matches with SHA1, MD5, size & CRC equal the TOSEC entry.
+    All ROM sizes and CRCs are kept to skip files which can't match any entry without reading them"""
 
     def __init__(self, romList: dict):
         self.__romList = romList
+        self.__sizes = set()
+        self.__crcSizes = set()
+        for roms in romList.values():
+            for rom in roms:
+                self.__sizes.add(rom.size)
+                self.__crcSizes.add((rom.crcValue, rom.size))
+
+    def isCandidate(self, size: int, crc: str = None) -> bool:
+        """
+        Check if any ROM entry has the given size and CRC.
+        @param size
+            size of a file in bytes
+        @param crc
+            CRC of the file as hex string or None if the CRC is unknown
+        @return
+            false if no file with these values can match, true otherwise"""
+
+        if crc is None:
+            return size in self.__sizes
+        return (int(crc, 16), size) in self.__crcSizes
 
     def findMatch(self, scanFile: ScanFile) -> list[TosecGameRom]:
-        if scanFile.isLoaded:
-            if scanFile.sha1 in self.__romList:
-                entry = self.__romList[scanFile.sha1]
+        if scanFile.isLoaded and scanFile.sha1 is not None:
+            sha1 = bytes.fromhex(scanFile.sha1)
+            if sha1 in self.__romList:
+                entry = self.__romList[sha1]
                 logging.debug("found file %s as ROM %s",
                     cDim(scanFile.fileName.as_posix()), cDim(entry[0].name))
                 if entry[0].isMatching(scanFile):
@@ -30,6 +55,20 @@ class Matcher:
                     cDim(scanFile.fileName.as_posix()), cDim(entry[0].name))
         return None
 
+    def roms(self):
+        """
+        Iterate over all ROM entries"""
+
+        for roms in self.__romList.values():
+            yield from roms
+
+    def findSha1(self, sha1: str) -> list[TosecGameRom]:
+        """
+        Get the ROM entries with the given SHA1 without checking other values.
+        Used for files already verified by findMatch before."""
+
+        return self.__romList.get(bytes.fromhex(sha1))
+
 class StrategyRename(Strategy):
     """
     Strategy to move/rename every matching file from the source directory
@@ -38,14 +77,26 @@ class StrategyRename(Strategy):
     - target paths are not exising -> paths are created
     - target files already exists and is identical -> either skip or delete source @see --delDupes
     - target files already exists and it not identical -> move is skiped
-    - several target files and move of first worked -> softlink other targets to first target"""
+    - several target files and move of first worked -> softlink other targets to first target
+    If a HashCache is given files in the target directory are only hashed if they changed.
+    Existing paths in the target directory are looked up in a DestinationIndex, which is
+    updated for every change. If no index is given the target directory is listed on init.
+    Target files are hashed at most once and their SHA1 is kept in the index while they are
+    unchanged. Before a duplicate is deleted the target file is always hashed again, using
+    the HashCache if given.
+    Moves, softlinks and deletes are done by the given FileOperations, which may also only
+    record them in a plan. If no operations are given they are executed immediately"""
 
-    def __init__(self, destPath: Path, matcher: Matcher, delDupes: bool, noWritePermission: bool):
+    def __init__(self, destPath: Path, matcher: Matcher, delDupes: bool, noWritePermission: bool,
+            hashCache: HashCache = None, destIndex: DestinationIndex = None, operations: FileOperations = None):
         super().__init__()
         self.__destPath = destPath
         self.__matcher = matcher
         self.__delDupes = delDupes
         self.__noWritePermission = noWritePermission
+        self.__hashCache = hashCache
+        self.__destIndex = destIndex if destIndex is not None else DestinationIndex(destPath)
+        self.__operations = operations if operations is not None else FileOperations()
 
     def doStrategyMatch(self, scanFile: ScanFile, tosecRomMatches: list[TosecGameRom]) -> ScanFile:
         super().doStrategyMatch(scanFile, tosecRomMatches)
@@ -56,41 +107,61 @@ class StrategyRename(Strategy):
                 otherDestFile = rom.getFileName(self.__destPath)
                 self.createParentDirectories(otherDestFile)
                 self.softLink(scanFile, otherDestFile, destFile, rom)
-            return ScanFile(PlainFileReader(destFile))
+            destReader = PlainFileReader(destFile)
+            if self.__hashCache is not None and self.__operations.immediate:
+                self.__hashCache.store(destReader.cacheKey(), scanFile.crc, scanFile.md5, scanFile.sha1)
+            # the target has the content of the matched file, so it isn't read again
+            destScan = copy.copy(scanFile)
+            destScan.fileName = destReader
+            return destScan
         if len(tosecRomMatches) > 1:
             logging.warning("other entries found for %s skipped due to previous error",
                 cDim(tosecRomMatches[0].name))
         return None
 
     def createParentDirectories(self, destFile: Path):
-        if not destFile.parent.exists():
-            logging.debug("creating directory %s", cDim(destFile.parent.as_posix()))
-            destFile.parent.mkdir(parents=True)
+        if not self.__destIndex.isDirectory(destFile.parent):
+            self.__operations.createDirectory(destFile.parent)
+            self.__destIndex.addDirectory(destFile.parent)
+
+    def removeSymlink(self, destFile: Path):
+        if self.__destIndex.isSymlink(destFile):
+            self.__operations.removeSymlink(destFile)
+            self.__destIndex.remove(destFile)
 
     def softLink(self, scanFile: ScanFile, destFile: Path, linkTo: Path, tosecRomMatch: TosecGameRom):
-        if destFile.is_symlink():
-            destFile.unlink()
-        if destFile.exists():
+        self.removeSymlink(destFile)
+        if self.__destIndex.isFile(destFile):
             self.handleDestFound(scanFile, destFile, tosecRomMatch, False)
         else:
-            logging.info("softlink file %s to %s", cDim(destFile.as_posix()), cDim(linkTo.as_posix()))
-            destFile.symlink_to(linkTo)
+            self.__operations.link(scanFile.fileName, destFile, linkTo)
+            self.__destIndex.addSymlink(destFile)
 
     def renameOrDeleteFoundFile(self, scanFile: ScanFile, destFile: Path, tosecRomMatch: TosecGameRom) -> bool:
-        if destFile.is_symlink():
-            destFile.unlink()
-        if destFile.exists():
+        self.removeSymlink(destFile)
+        if self.__destIndex.isFile(destFile):
             return self.handleDestFound(scanFile, destFile, tosecRomMatch, self.__delDupes)
-        logging.info("rename file %s to %s", cDim(scanFile.fileName.as_posix()), cDim(destFile.as_posix()))
-        scanFile.fileName.rename(destFile)
-        if self.__noWritePermission:
-            self.removeWritePermission(destFile)
+        try:
+            self.__operations.move(scanFile.fileName, destFile, scanFile.sha1, self.__noWritePermission)
+        except (OSError, FileMoveException) as error:
+            logging.error("rename file %s to %s failed: %s",
+                cDim(scanFile.fileName.as_posix()), cDim(destFile.as_posix()), error)
+            return False
+        self.__destIndex.addFile(destFile, scanFile.sha1)
         return True
 
     def handleDestFound(self, scanFile: ScanFile, destFile: Path, tosecRomMatch: TosecGameRom, deleteDups: bool):
-        scanDest = ScanFile(PlainFileReader(destFile))
-        matchDests = self.__matcher.findMatch(scanDest)
-        if matchDests is None:
+        # the source may be the only copy, so a delete is never decided by a stored digest
+        sha1 = None if deleteDups and self.__operations.immediate else self.__destIndex.digest(destFile)
+        if sha1 is not None:
+            matchDests = self.__matcher.findSha1(sha1)
+        else:
+            scanDest = ScanFile(PlainFileReader(destFile), self.__hashCache)
+            matchDests = self.__matcher.findMatch(scanDest)
+            if scanDest.isLoaded:
+                sha1 = scanDest.sha1
+                self.__destIndex.addFile(destFile, sha1)
+        if matchDests is None or sha1 != scanFile.sha1:
             logging.error("in destination directory file %s was found but does not match ROM it should have. File %s ignored",
                 cDim(destFile.as_posix()), cDim(scanFile.fileName.as_posix()))
             return False
@@ -98,13 +169,9 @@ class StrategyRename(Strategy):
             for matchDest in matchDests:
                 logging.warning("delete Duplicate file %s for matching ROM %s",
                     cDim(scanFile.fileName.as_posix()), cDim(matchDest.name))
-            scanFile.fileName.unlink()
+            self.__operations.delete(scanFile.fileName, destFile, scanFile.sha1)
         else:
             for matchDest in matchDests:
                 logging.warning("duplicate file found %s for matching ROM %s. Source file %s ignored",
                     cDim(destFile.as_posix()), cDim(matchDest.name), cDim(scanFile.fileName.as_posix()))
         return True
-
-    def removeWritePermission(self, destFile: Path):
-        currentPermission = stat.S_IMODE(os.lstat(destFile).st_mode)
-        os.chmod(destFile, currentPermission & (~stat.S_IWUSR) & (~stat.S_IWGRP) & (~stat.S_IWOTH))
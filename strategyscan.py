@@ -1,28 +1,51 @@
 #!/usr/bin/python
 
 from color import cDim
+from hashcache import HashCache
+from journal import MoveJournal
+from parallel import orderedMap
 from pathlib import Path
 from scanfile import PlainFileReader, ScanFile
 from strategyrename import Matcher
 from strategy import Strategy
 import logging
+import os
 
 class StrategyScan(Strategy):
     """
     Strategy to scan every directory/files from the source directory.
-    If a directory is found the content is retruned. Otherwise
-    either doStrategyMatch or doStrategyNoMatch is called"""
+    Directories are walked with os.scandir. If recursive is set sub directories are
+    walked depth first, otherwise they are retruned. For every file
+    either doStrategyMatch or doStrategyNoMatch is called.
+    If jobs is greater than one files are hashed by a pool of worker threads,
+    but matching and all other strategies are still called in order from the scanning thread.
+    If a HashCache is given unchanged files are not read again.
+    If staged is set MD5 and SHA1 of a file are only calculated if the CRC matches any ROM.
+    If a MoveJournal is given every processed file is recorded and files recorded by
+    a previous scan are skipped"""
 
-    def __init__(self, matcher: Matcher):
+    def __init__(self, matcher: Matcher, jobs: int = 1, hashCache: HashCache = None, staged: bool = False,
+            recursive: bool = False, journal: MoveJournal = None):
         super().__init__()
         self._matcher = matcher
+        self._jobs = jobs
+        self._hashCache = hashCache
+        self._staged = staged
+        self._recursive = recursive
+        self._journal = journal
 
     def doStrategyScan(self, listPath: list[Path]) -> list[Path]:
         scanPath = super().doStrategyScan(listPath)
         return self.__scanDirectory(scanPath)
 
-    def _scanFile(self, entry: Path):
-        scan = ScanFile(PlainFileReader(entry))
+    def _loadFile(self, entry: Path, dirEntry: os.DirEntry = None) -> ScanFile:
+        """
+        Hash the given file. Called from a worker thread if jobs is greater than one.
+        Files with a size not matching any ROM are not read"""
+
+        return ScanFile(PlainFileReader(entry, dirEntry), self._hashCache, self._matcher.isCandidate, self._staged)
+
+    def _scanFile(self, entry: Path, scan: ScanFile):
         match = self._matcher.findMatch(scan)
         if match is None:
             self.doStrategyNoMatch(scan)
@@ -31,15 +54,55 @@ class StrategyScan(Strategy):
 
     def __scanDirectory(self, listPath: list[Path]) -> list[Path]:
         foundDirectories = []
+        files = self.__listFiles(listPath, foundDirectories)
+        if self._journal is not None:
+            files = filter(self.__notScanned, files)
+        for (entry, dirEntry), scan in orderedMap(lambda file: self._loadFile(*file), files, self._jobs):
+            self._scanFile(entry, scan)
+            if self._journal is not None:
+                self._journal.scanned(entry)
+        return foundDirectories
+
+    def __notScanned(self, file: tuple) -> bool:
+        if self._journal.isScanned(file[0]):
+            logging.debug("file %s was scaned before and is skipped", cDim(file[0].as_posix()))
+            return False
+        return True
+
+    def __listFiles(self, listPath: list[Path], foundDirectories: list[Path]):
         for scanPath in listPath:
             if scanPath.is_dir() and not scanPath.is_symlink():
-                logging.debug("scan directory %s", cDim(scanPath.as_posix()))
-                for entry in scanPath.iterdir():
-                    if entry.is_file():
-                        self._scanFile(entry)
-                    elif not scanPath.is_symlink():
-                        logging.debug("add directory %s to list to scan", cDim(entry.as_posix()))
-                        foundDirectories.append(entry)
+                yield from self.__walkDirectory(scanPath, foundDirectories)
             elif scanPath.is_file():
-                self._scanFile(scanPath)
-        return foundDirectories
+                yield scanPath, None
+
+    def __walkDirectory(self, directory: Path, foundDirectories: list[Path]):
+        """
+        Yield tuples of (Path, DirEntry) for every file in the directory. The type of an
+        entry is taken from the DirEntry, so no further stat is needed. Only one open
+        directory per tree level is kept. Symlinked directories are not followed."""
+
+        logging.debug("scan directory %s", cDim(directory.as_posix()))
+        stack = [os.scandir(directory)]
+        try:
+            while len(stack) > 0:
+                dirEntry = next(stack[-1], None)
+                if dirEntry is None:
+                    stack.pop().close()
+                    continue
+                try:
+                    if dirEntry.is_file():
+                        yield Path(dirEntry.path), dirEntry
+                    elif dirEntry.is_dir(follow_symlinks=False):
+                        if self._recursive:
+                            logging.debug("scan directory %s", cDim(dirEntry.path))
+                            stack.append(os.scandir(dirEntry.path))
+                        else:
+                            logging.debug("add directory %s to list to scan", cDim(dirEntry.path))
+                            foundDirectories.append(Path(dirEntry.path))
+                except OSError as error:
+                    logging.error("scan directory entry %s caused an error %s",
+                        cDim(dirEntry.path), cDim(str(error)))
+        finally:
+            for openDirectory in stack:
+                openDirectory.close()
@@ -1,103 +1,153 @@
 #!/usr/bin/python
 
 from color import cDim
+from containers import CONTAINER_ERRORS, ContainerEntryReader, findContainerType, isContainerName
+from hashcache import HashCache
+from journal import MoveJournal
+from parallel import orderedMap
 from pathlib import Path
-from scanfile import PlainFileReader, IScanFileReader, ScanFile
+from scanfile import ScanFile
+from strategyrename import Matcher
 from strategyscan import StrategyScan
 import logging
-import zipfile
+import shutil
+import tempfile
 
-class ZipFileReader(IScanFileReader):
-    """
-    Implementation of IScanFileReader for a file in a ZIP archive.
-    Not all operations are implemented yet :-("""
-
-    def __init__(self, archive: Path, zipInfo: zipfile.ZipInfo):
-        self.__zipInfo = zipInfo
-        self.__archive = archive
-        self.__file = None
-        self.__size = zipInfo.file_size
-        self.name = Path(zipInfo.filename).name
-
-    def open(self):
-        if self.__file is not None:
-            logging.warning("zip file is already open %s", cDim(self.as_posix()))
-            return
-        self.__file = self.__archive.open(self.__zipInfo)
-
-    def close(self):
-        if self.__file is None:
-            logging.warning("zip file is already closed %s", cDim(self.as_posix()))
-            return
-        self.__file.close()
-        self.__file = None
-
-    def size(self):
-        return self.__size
-
-    def read(self, size: int):
-        return self.__file.read(size)
-
-    def as_posix(self):
-        return self.__archive.filename + '/' + self.__zipInfo.filename
-
-    def rename(self, destFile: Path):
-        data = self.__archive.read(self.__zipInfo)
-        destFile.write_bytes(data)
-        # TODO remove file from archive currently not supported by
-        # Python see https://github.com/python/cpython/pull/19358
-        # either wait for that MR or after complete file is scaned
-        # delete the complete zip or create new zip and move over all left over files
-        logging.warning("Moving a zip entry is not supported right now. File is only extracted %s",
-            cDim(self.as_posix()))
-
-    def unlink(self):
-        # TODO See rename
-        logging.warning("Deleting a zip entry is not supported right now. File Skipped %s",
-            cDim(self.as_posix()))
+NESTED_MEMORY_SIZE = 64 * 1024 * 1024
+SPOOL_DIR_NAME = ".tosecSpool"
 
 class StrategyScanCompressed(StrategyScan):
     """
     Strategy to scan every directory/files from the source directory.
     If a directory is found the content is retruned.
     Otherwise the file is checked. If Matcher does not match and file is a
-    ZIP archive every entry of the ZIP archive is scaned.
+    compressed container (ZIP, TAR, gzip, bzip2, xz or any registered container type)
+    every entry of the container is scaned.
     For each found entry either doStrategyMatch or doStrategyNoMatch is called.
-    doStrategyNoMatch is called for the ZIP archive if the ZIP has either no
-    entry or an error occurs while processing the ZIP archive."""
+    Entries with a CRC and size in the ZIP directory not matching any ROM are not decompressed.
+    If jobs is greater than one entries of containers supporting it, like ZIP archives, are
+    decompressed and hashed by a pool of worker threads. They are still matched in order.
+    doStrategyNoMatch is called for the container if it has either no
+    entry or an error occurs before any entry was processed.
+    Entries moved or deleted from a ZIP archive by other strategies are removed by rewriting
+    the archive once after all its entries are processed.
+    If spoolDir is given decompressed entries are written to its subdirectory SPOOL_DIR_NAME
+    while hashing. It should be on the filesystem of the destination directory so moving a
+    found entry is a rename. Spool files left by an interrupted scan are removed when a scan
+    starts and the subdirectory is removed after the scan.
+    Not matching entries named like a container are scaned as nested container up to
+    nestedDepth levels below the scaned file. A nested container is decompressed once
+    into a buffer, which is kept in memory up to NESTED_MEMORY_SIZE and spilled to a
+    temporary file above. Entries of nested containers can be moved but not removed."""
+
+    def __init__(self, matcher: Matcher, jobs: int = 1, hashCache: HashCache = None, staged: bool = False,
+            recursive: bool = False, spoolDir: Path = None, nestedDepth: int = 0, journal: MoveJournal = None):
+        super().__init__(matcher, jobs, hashCache, staged, recursive, journal)
+        self.__spoolDir = None if spoolDir is None else spoolDir / SPOOL_DIR_NAME
+        self.__nestedDepth = nestedDepth
+
+    def doStrategyScan(self, listPath: list[Path]) -> list[Path]:
+        if self.__spoolDir is None:
+            return super().doStrategyScan(listPath)
+        self.__clearSpoolDir()
+        try:
+            return super().doStrategyScan(listPath)
+        finally:
+            try:
+                self.__spoolDir.rmdir()
+            except OSError as error:
+                logging.warning("spool directory %s can't be removed: %s", cDim(self.__spoolDir.as_posix()), error)
+
+    def __clearSpoolDir(self):
+        """
+        Create the spool directory and remove the spool files of an interrupted scan"""
 
-    def _scanFile(self, entry: Path):
-        scan = ScanFile(PlainFileReader(entry))
+        self.__spoolDir.mkdir(exist_ok=True)
+        for spoolFile in self.__spoolDir.iterdir():
+            logging.warning("remove spool file %s of an interrupted scan", cDim(spoolFile.as_posix()))
+            spoolFile.unlink()
+
+    def _scanFile(self, entry: Path, scan: ScanFile):
         match = self._matcher.findMatch(scan)
-        if match is None:
-            if zipfile.is_zipfile(entry):
-                self.__scanZipFile(entry)
-            else:
-                self.doStrategyNoMatch(scan)
-        else:
+        if match is not None:
             self.doStrategyMatch(scan, match)
+            return
+        containerType = findContainerType(entry)
+        if containerType is None:
+            self.doStrategyNoMatch(scan)
+        else:
+            self.__scanContainer(entry, entry.as_posix(), scan, containerType, 0)
 
-    def __scanZipFile(self, entry: Path):
-        logging.debug("scan zip file %s", cDim(entry.as_posix()))
-        zipFile = zipfile.ZipFile(entry)
+    def __scanContainer(self, source, containerName: str, scan: ScanFile, containerType: type, depth: int):
+        logging.debug("scan %s file %s", containerType.name, cDim(containerName))
+        scanedEntries = 0
         try:
-            infoList = zipFile.infolist()
-            if len(infoList) == 0:
-                self.doStrategyNoMatch(entry)
-                return
+            container = containerType(source, self.__spoolDir, containerName)
+            pendingReaders = set()
+            scans = orderedMap(self.__loadEntry, self.__startEntries(container, pendingReaders),
+                self._jobs if container.parallel else 1)
+            try:
+                for reader, entryScan in scans:
+                    scanedEntries += 1
+                    try:
+                        self.__scanEntry(reader, entryScan, depth)
+                    finally:
+                        reader.release()
+                        pendingReaders.discard(reader)
+            finally:
+                scans.close()
+                # entries hashed ahead of an error are still spooled
+                for reader in pendingReaders:
+                    reader.release()
+                container.close()
+        except CONTAINER_ERRORS as error:
+            logging.error("scan %s file %s caused an error %s",
+                containerType.name, cDim(containerName), cDim(str(error)))
+        if scanedEntries == 0:
+            self.doStrategyNoMatch(scan)
 
-            for info in infoList:
-                if info.is_dir():
-                    continue
-                logging.debug("scan zip file entry %s", cDim(info.filename))
-                scan = ScanFile(ZipFileReader(zipFile, info))
-                match = self._matcher.findMatch(scan)
-                if match is None:
-                    self.doStrategyNoMatch(scan)
-                else:
-                    self.doStrategyMatch(scan, match)
-            return
-        finally:
-            zipFile.close()
-        scan = ScanFile(PlainFileReader(entry))
-        self.doStrategyNoMatch(scan)
+    def __scanEntry(self, reader: ContainerEntryReader, entryScan: ScanFile, depth: int):
+        """
+        Match a loaded entry. An error of another strategy, e.g. while creating a
+        destination directory, only skips this entry and not the rest of the container"""
+
+        try:
+            match = self._matcher.findMatch(entryScan)
+            if match is not None:
+                self.doStrategyMatch(entryScan, match)
+            elif not self.__scanNested(reader, entryScan, depth + 1):
+                self.doStrategyNoMatch(entryScan)
+        except OSError as error:
+            logging.error("processing %s caused an error %s", cDim(reader.as_posix()), cDim(str(error)))
+
+    def __startEntries(self, container, pendingReaders: set):
+        for reader in container.entries():
+            logging.debug("scan %s file entry %s", container.name, cDim(reader.as_posix()))
+            pendingReaders.add(reader)
+            yield reader
+
+    def __loadEntry(self, reader: ContainerEntryReader) -> ScanFile:
+        return ScanFile(reader, self._hashCache, self._matcher.isCandidate)
+
+    def __scanNested(self, reader: ContainerEntryReader, scan: ScanFile, depth: int) -> bool:
+        """
+        Scan a container entry as nested container.
+        @return
+            True if the entry is a container and was scaned"""
+
+        if depth > self.__nestedDepth or not isContainerName(reader.name):
+            return False
+        with tempfile.SpooledTemporaryFile(NESTED_MEMORY_SIZE) as nested:
+            try:
+                with reader.openStream() as stream:
+                    shutil.copyfileobj(stream, nested, 1024 * 1024)
+                nested.seek(0)
+                containerType = findContainerType(nested)
+            except CONTAINER_ERRORS as error:
+                logging.warning("nested file %s can't be scaned because %s", cDim(reader.as_posix()), cDim(str(error)))
+                return False
+            if containerType is None:
+                return False
+            # errors of the nested container and its entries are handled by __scanContainer
+            self.__scanContainer(nested, reader.as_posix(), scan, containerType, depth)
+            return True
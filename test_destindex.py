@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+import os
+import pytest
+from destindex import DestinationIndex
+
+def createDest(tmp_path):
+    dest = tmp_path / "dest"
+    (dest / "system" / "game").mkdir(parents=True)
+    (dest / "system" / "game" / "rom.bin").write_bytes(b"rom")
+    (dest / "system" / "link.bin").symlink_to(dest / "system" / "game" / "rom.bin")
+    return dest
+
+def test_inventoryOfDestination(tmp_path):
+    """
+    Test DestinationIndex lists files, symlinks and directories of the destination"""
+
+    dest = createDest(tmp_path)
+    index = DestinationIndex(dest)
+
+    assert index.isDirectory(dest / "system" / "game")
+    assert index.isFile(dest / "system" / "game" / "rom.bin")
+    assert not index.isSymlink(dest / "system" / "game" / "rom.bin")
+    assert index.isSymlink(dest / "system" / "link.bin")
+    assert not index.isFile(dest / "system" / "link.bin")
+    assert not index.isFile(dest / "system" / "missing.bin")
+    assert not index.isDirectory(dest / "other")
+
+def test_indexUpdated(tmp_path):
+    """
+    Test added and removed paths are visible in the index without listing the directory again"""
+
+    dest = createDest(tmp_path)
+    index = DestinationIndex(dest)
+    index.addDirectory(dest / "other" / "game")
+    index.addFile(dest / "other" / "game" / "new.bin", "db8ac1c259eb89d4a131b253bacfca5f319d54f2")
+    index.remove(dest / "system" / "link.bin")
+
+    assert index.isDirectory(dest / "other")
+    assert index.isFile(dest / "other" / "game" / "new.bin")
+    assert index.digest(dest / "other" / "game" / "new.bin") == "db8ac1c259eb89d4a131b253bacfca5f319d54f2"
+    assert index.digest(dest / "system" / "game" / "rom.bin") is None
+    assert not index.isSymlink(dest / "system" / "link.bin")
+
+def test_savedIndexOnlyChangedDirectoriesListed(tmp_path):
+    """
+    Test a saved index keeps digests of unchanged directories and lists changed directories again"""
+
+    dest = createDest(tmp_path)
+    indexFile = tmp_path / "dest.index"
+    index = DestinationIndex(dest, indexFile)
+    index.addFile(dest / "system" / "game" / "rom.bin", "db8ac1c259eb89d4a131b253bacfca5f319d54f2")
+    index.save()
+    (dest / "system" / "added.bin").write_bytes(b"added")
+
+    with pytest.MonkeyPatch.context() as patch:
+        scandir = os.scandir
+        listed = []
+        patch.setattr(os, "scandir", lambda path: listed.append(path) or scandir(path))
+        loaded = DestinationIndex(dest, indexFile)
+
+    assert listed == [dest / "system"]
+    assert loaded.isFile(dest / "system" / "added.bin")
+    assert loaded.digest(dest / "system" / "game" / "rom.bin") == "db8ac1c259eb89d4a131b253bacfca5f319d54f2"
+
+def test_digestDroppedForFileChangedInPlace(tmp_path):
+    """
+    Test a digest is not returned anymore if the file was overwritten without changing its directory"""
+
+    dest = createDest(tmp_path)
+    romFile = dest / "system" / "game" / "rom.bin"
+    index = DestinationIndex(dest)
+    index.addFile(romFile, "db8ac1c259eb89d4a131b253bacfca5f319d54f2")
+    directoryStat = os.stat(romFile.parent)
+    romFile.write_bytes(b"changed")
+    os.utime(romFile.parent, ns=(directoryStat.st_atime_ns, directoryStat.st_mtime_ns))
+    index.refresh()
+
+    assert index.digest(romFile) is None
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+import errno
+import os
+import pytest
+from filemove import FileMoveException, moveFile
+from test_strategydiag import createHelloWorld
+from unittest import mock
+
+def renameCrossDevice(source, dest):
+    if str(source).endswith(".part"):
+        return os.replace(source, dest)
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+def test_moveFileSameFilesystem(tmp_path):
+    """
+    Test moveFile on the same filesystem renames the file"""
+
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"HelloWorld")
+    inode = source.stat().st_ino
+    dest = tmp_path / "dest.txt"
+
+    moveFile(source, dest, createHelloWorld().sha1)
+
+    assert not source.exists()
+    assert dest.read_bytes() == b"HelloWorld"
+    assert dest.stat().st_ino == inode
+
+def test_moveFileCrossFilesystem(tmp_path):
+    """
+    Test moveFile to another filesystem copies the file, verifies it
+    and removes the source"""
+
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"HelloWorld")
+    os.chmod(source, 0o640)
+    dest = tmp_path / "dest.txt"
+
+    with mock.patch("os.rename", side_effect = renameCrossDevice):
+        moveFile(source, dest, createHelloWorld().sha1)
+
+    assert not source.exists()
+    assert dest.read_bytes() == b"HelloWorld"
+    assert dest.stat().st_mode & 0o777 == 0o640
+    assert os.listdir(tmp_path) == ["dest.txt"]
+
+def test_moveFileCrossFilesystemVerifyFails(tmp_path):
+    """
+    Test moveFile to another filesystem with a not matching hash
+    keeps the source and leaves no destination file"""
+
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"HelloWorld!")
+    dest = tmp_path / "dest.txt"
+
+    with mock.patch("os.rename", side_effect = renameCrossDevice):
+        with pytest.raises(FileMoveException):
+            moveFile(source, dest, createHelloWorld().sha1)
+
+    assert source.exists()
+    assert os.listdir(tmp_path) == ["source.txt"]
+
+def test_moveFileCrossFilesystemSourceNotRemovable(tmp_path):
+    """
+    Test moveFile to another filesystem keeps the complete copy if the source can't be removed"""
+
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"HelloWorld")
+    dest = tmp_path / "dest.txt"
+
+    with mock.patch("os.rename", side_effect = renameCrossDevice):
+        with mock.patch.object(type(source), "unlink", side_effect = PermissionError(errno.EACCES, "Permission denied")):
+            moveFile(source, dest, createHelloWorld().sha1)
+
+    assert source.exists()
+    assert dest.read_bytes() == b"HelloWorld"
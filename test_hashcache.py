@@ -0,0 +1,44 @@
+#!/usr/bin/python
+
+import pytest
+from hashcache import HashCache
+from scanfile import PlainFileReader, ScanFile
+from unittest import mock
+
+def test_scanFileStoredInCache(tmp_path):
+    """
+    Test ScanFile with a HashCache will store the hashes and
+    a second ScanFile of the unchanged file is loaded from the cache without reading"""
+
+    file = tmp_path / "HelloWorld.txt"
+    file.write_bytes(b"HelloWorld")
+    cache = HashCache(tmp_path / "cache.db")
+
+    first = ScanFile(PlainFileReader(file), cache)
+    with mock.patch("builtins.open") as mockOpen:
+        second = ScanFile(PlainFileReader(file), cache)
+        mockOpen.assert_not_called()
+    cache.close()
+
+    assert first.isLoaded and second.isLoaded
+    assert second.size == 10
+    assert second.crc == "77770c79"
+    assert second.md5 == "68e109f0f40ca72a15e05cc22786f8e6"
+    assert second.sha1 == "db8ac1c259eb89d4a131b253bacfca5f319d54f2"
+
+def test_scanFileChangedNotFromCache(tmp_path):
+    """
+    Test a changed file is hashed again even if the path is in the HashCache"""
+
+    file = tmp_path / "HelloWorld.txt"
+    file.write_bytes(b"HelloWorld")
+    cache = HashCache(tmp_path / "cache.db")
+    ScanFile(PlainFileReader(file), cache)
+    file.write_bytes(b"HelloWorld!")
+
+    scan = ScanFile(PlainFileReader(file), cache)
+    cache.close()
+
+    assert scan.isLoaded
+    assert scan.size == 11
+    assert scan.sha1 != "db8ac1c259eb89d4a131b253bacfca5f319d54f2"
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+
+import hashlib
+import json
+import pytest
+from journal import MoveJournal
+from operations import FileOperations
+from unittest import mock
+
+def test_resumeSkipsScannedFiles(tmp_path):
+    """
+    Test files recorded as scanned are known after resume, but not on a new journal"""
+
+    journalFile = tmp_path / "scan.journal"
+    journal = MoveJournal(journalFile)
+    journal.scanned(tmp_path / "done.bin")
+    journal.close()
+
+    resumed = MoveJournal(journalFile, True)
+    assert resumed.isScanned(tmp_path / "done.bin")
+    assert not resumed.isScanned(tmp_path / "other.bin")
+    resumed.close()
+
+def test_existingJournalNeedsResume(tmp_path):
+    """
+    Test the journal of an earlier scan is not overwritten without resume"""
+
+    journalFile = tmp_path / "scan.journal"
+    journal = MoveJournal(journalFile)
+    journal.scanned(tmp_path / "done.bin")
+    journal.close()
+
+    with pytest.raises(FileExistsError):
+        MoveJournal(journalFile)
+    assert "done.bin" in journalFile.read_text()
+
+def test_resumeFinishesMoves(tmp_path):
+    """
+    Test an interrupted copy is rolled back and a copied but not removed source is removed"""
+
+    journalFile = tmp_path / "scan.journal"
+    journal = MoveJournal(journalFile)
+    (tmp_path / "copied.bin").write_bytes(b"copied")
+    (tmp_path / "dest.bin").write_bytes(b"copied")
+    journal.plan("move", (tmp_path / "copied.bin").as_posix(), tmp_path / "dest.bin",
+        hashlib.sha1(b"copied").hexdigest())
+    (tmp_path / "source.bin").write_bytes(b"source")
+    (tmp_path / ".missing.bin.x1.part").write_bytes(b"sour")
+    journal.plan("move", (tmp_path / "source.bin").as_posix(), tmp_path / "missing.bin")
+    journal.plan("link", (tmp_path / "source.bin").as_posix(), tmp_path / "link.bin", target=tmp_path / "dest.bin")
+    journal.close()
+
+    MoveJournal(journalFile, True).close()
+
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["dest.bin", "link.bin", "scan.journal", "source.bin"]
+    assert (tmp_path / "link.bin").resolve() == tmp_path / "dest.bin"
+    records = [json.loads(line) for line in journalFile.read_text().splitlines()]
+    assert [record["done"] for record in records if "done" in record] == [0, 1, 2]
+
+def test_resumeKeepsSourceOfChangedDestination(tmp_path):
+    """
+    Test the source of an unfinished move is kept if the destination doesn't have its SHA1"""
+
+    journalFile = tmp_path / "scan.journal"
+    journal = MoveJournal(journalFile)
+    (tmp_path / "source.bin").write_bytes(b"source")
+    (tmp_path / "dest.bin").write_bytes(b"other")
+    journal.plan("move", (tmp_path / "source.bin").as_posix(), tmp_path / "dest.bin",
+        hashlib.sha1(b"source").hexdigest())
+    journal.close()
+
+    MoveJournal(journalFile, True).close()
+
+    assert (tmp_path / "source.bin").read_bytes() == b"source"
+    records = [json.loads(line) for line in journalFile.read_text().splitlines()]
+    assert [record for record in records if "done" in record] == []
+
+def test_failedMoveStaysPlanned(tmp_path):
+    """
+    Test a failed move is not recorded as done, so a resume checks it again"""
+
+    journalFile = tmp_path / "scan.journal"
+    journal = MoveJournal(journalFile)
+    source = mock.Mock()
+    source.as_posix.return_value = (tmp_path / "source.bin").as_posix()
+    source.rename.side_effect = OSError("failed")
+
+    with pytest.raises(OSError):
+        FileOperations(journal).move(source, tmp_path / "dest.bin", "0" * 40)
+    journal.close()
+
+    records = [json.loads(line) for line in journalFile.read_text().splitlines()]
+    assert [record.get("op") for record in records] == ["move"]
+
+def test_resumeKeepsDuplicateOfChangedFile(tmp_path):
+    """
+    Test an unfinished delete of a duplicate is only finished if the file it duplicates
+    still has its SHA1"""
+
+    journalFile = tmp_path / "scan.journal"
+    journal = MoveJournal(journalFile)
+    for name in ["dupe.bin", "changed.bin"]:
+        (tmp_path / name).write_bytes(b"source")
+    (tmp_path / "dest.bin").write_bytes(b"source")
+    (tmp_path / "other.bin").write_bytes(b"other")
+    journal.plan("delete", (tmp_path / "dupe.bin").as_posix(), tmp_path / "dest.bin", hashlib.sha1(b"source").hexdigest())
+    journal.plan("delete", (tmp_path / "changed.bin").as_posix(), tmp_path / "other.bin", hashlib.sha1(b"source").hexdigest())
+    journal.close()
+
+    MoveJournal(journalFile, True).close()
+
+    assert not (tmp_path / "dupe.bin").exists()
+    assert (tmp_path / "changed.bin").read_bytes() == b"source"
+    records = [json.loads(line) for line in journalFile.read_text().splitlines()]
+    assert [record["done"] for record in records if "done" in record] == [0]
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+import json
+import pytest
+from moveplan import MovePlan, PlannedOperations, applyPlan
+from operations import FileOperations
+from scanfile import PlainFileReader, ScanFile
+from strategyrename import StrategyRename
+from test_strategyscancompressed import createHelloWorldMatcher
+
+def createPlan(tmp_path, delDupes: bool):
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    source = tmp_path / "source"
+    source.mkdir()
+    matcher = createHelloWorldMatcher()
+    rom = matcher.findSha1("db8ac1c259eb89d4a131b253bacfca5f319d54f2")[0]
+    rom.getFileName.side_effect = lambda destPath: destPath / "system" / "HelloWorld.txt"
+    plan = MovePlan()
+    sr = StrategyRename(dest, matcher, delDupes, False, operations=PlannedOperations(plan))
+    for name in ["first.txt", "second.txt"]:
+        (source / name).write_bytes(b"HelloWorld")
+        sr.doStrategyMatch(ScanFile(PlainFileReader(source / name)), [rom])
+    planFile = tmp_path / "plan.json"
+    plan.save(planFile)
+    return planFile, source, dest
+
+def test_planDoesNotChangeFiles(tmp_path):
+    """
+    Test StrategyRename with PlannedOperations records the move and the delete
+    of the duplicate with byte totals without changing any file"""
+
+    planFile, source, dest = createPlan(tmp_path, True)
+
+    document = json.loads(planFile.read_text())
+    assert document["totals"] == {"moves": 1, "moveBytes": 10, "links": 0, "deletes": 1, "deleteBytes": 10}
+    assert document["moves"][0]["source"] == (source / "first.txt").as_posix()
+    assert document["deletes"][0]["source"] == (source / "second.txt").as_posix()
+    assert sorted(file.name for file in source.iterdir()) == ["first.txt", "second.txt"]
+    assert list(dest.iterdir()) == []
+
+def test_applyPlan(tmp_path):
+    """
+    Test an applied plan moves the file and deletes the duplicate afterwards"""
+
+    planFile, source, dest = createPlan(tmp_path, True)
+
+    applyPlan(planFile, FileOperations())
+
+    assert (dest / "system" / "HelloWorld.txt").read_bytes() == b"HelloWorld"
+    assert list(source.iterdir()) == []
+
+def test_applyPlanSkipsChangedFiles(tmp_path):
+    """
+    Test a source file changed since planning is not moved"""
+
+    planFile, source, dest = createPlan(tmp_path, False)
+    (source / "first.txt").write_bytes(b"changed file")
+
+    applyPlan(planFile, FileOperations())
+
+    assert list(dest.iterdir()) == []
+    assert (source / "first.txt").read_bytes() == b"changed file"
+
+def test_applyPlanKeepsDuplicateOfOtherFile(tmp_path):
+    """
+    Test a duplicate is not deleted if its planned move was skipped for another destination file"""
+
+    planFile, source, dest = createPlan(tmp_path, True)
+    (dest / "system").mkdir()
+    (dest / "system" / "HelloWorld.txt").write_bytes(b"HelloWorlD")
+
+    applyPlan(planFile, FileOperations())
+
+    assert sorted(file.name for file in source.iterdir()) == ["first.txt", "second.txt"]
+
+def test_applyPlanDeletesDuplicateOfExistingFile(tmp_path):
+    """
+    Test a duplicate is deleted if the file it duplicates exists with its SHA1"""
+
+    planFile, source, dest = createPlan(tmp_path, True)
+    (source / "first.txt").rename(tmp_path / "first.txt")
+    (dest / "system").mkdir()
+    (tmp_path / "first.txt").rename(dest / "system" / "HelloWorld.txt")
+
+    applyPlan(planFile, FileOperations())
+
+    assert list(source.iterdir()) == []
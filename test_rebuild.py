@@ -0,0 +1,120 @@
+#!/usr/bin/python
+
+import os
+from havedb import HaveDatabase
+from operations import FileOperations
+from rebuild import rebuildDestination
+from strategyhave import StrategyHave
+from strategyrename import Matcher
+from unittest import mock
+
+SHA1 = "db8ac1c259eb89d4a131b253bacfca5f319d54f2"
+
+def createMatcher(*names: str) -> Matcher:
+    roms = []
+    for name in names:
+        rom = mock.Mock()
+        rom.sha1 = SHA1
+        rom.getFileName.side_effect = lambda destPath, name=name: destPath / name
+        roms.append(rom)
+    return Matcher({bytes.fromhex(SHA1): roms})
+
+def test_rebuildMovesAndLinks(tmp_path):
+    """
+    Test a renamed ROM is moved to its new path, a new ROM entry is softlinked and
+    a softlink not expected anymore is removed, without reading any file"""
+
+    dest = tmp_path / "dest"
+    (dest / "Old").mkdir(parents=True)
+    (dest / "Old" / "HelloWorld.txt").write_bytes(b"HelloWorld")
+    os.symlink(dest / "Old" / "HelloWorld.txt", dest / "Old" / "Hello.txt")
+    haveDb = HaveDatabase(tmp_path / "have.db")
+    haveDb.store(dest / "Old" / "HelloWorld.txt", SHA1)
+    haveDb.store(dest / "Old" / "Hello.txt", SHA1, True)
+
+    rebuildDestination(dest, createMatcher("New/HelloWorld.txt", "New/World.txt"), haveDb, FileOperations())
+
+    assert (dest / "New" / "HelloWorld.txt").read_bytes() == b"HelloWorld"
+    assert os.readlink(dest / "New" / "World.txt") == (dest / "New" / "HelloWorld.txt").as_posix()
+    assert not os.path.lexists(dest / "Old" / "HelloWorld.txt")
+    assert not os.path.lexists(dest / "Old" / "Hello.txt")
+    assert list(haveDb.groups()) == [(SHA1, [dest / "New" / "HelloWorld.txt"], [dest / "New" / "World.txt"])]
+    haveDb.close()
+
+def test_rebuildKeepsFileNotInDat(tmp_path):
+    """
+    Test a file with a SHA1 not in any DAT is only reported"""
+
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    (dest / "HelloWorld.txt").write_bytes(b"HelloWorld")
+    haveDb = HaveDatabase(tmp_path / "have.db")
+    haveDb.store(dest / "HelloWorld.txt", "0" * 40)
+
+    rebuildDestination(dest, createMatcher("New/HelloWorld.txt"), haveDb, FileOperations())
+
+    assert (dest / "HelloWorld.txt").is_file()
+    assert not (dest / "New").exists()
+    haveDb.close()
+
+def test_haveStoresScannedFile(tmp_path):
+    """
+    Test a matching file scanned in the destination is stored with its softlinks"""
+
+    (tmp_path / "HelloWorld.txt").write_bytes(b"HelloWorld")
+    os.symlink(tmp_path / "HelloWorld.txt", tmp_path / "Hello.txt")
+    haveDb = HaveDatabase(tmp_path / "have.db")
+    matcher = createMatcher("HelloWorld.txt", "Hello.txt")
+    scanFile = mock.Mock()
+    scanFile.fileName = tmp_path / "HelloWorld.txt"
+    scanFile.isLoaded = True
+    scanFile.sha1 = SHA1
+
+    StrategyHave(haveDb, tmp_path).doStrategyMatch(scanFile, matcher.findSha1(SHA1))
+
+    assert list(haveDb.groups()) == [(SHA1, [tmp_path / "HelloWorld.txt"], [tmp_path / "Hello.txt"])]
+    haveDb.close()
+
+def test_rebuildRemovesDeletedFile(tmp_path):
+    """
+    Test a stored file deleted since the last scan is removed from the have database
+    and its softlinks are removed instead of linking the new paths to it"""
+
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    os.symlink(dest / "HelloWorld.txt", dest / "Hello.txt")
+    haveDb = HaveDatabase(tmp_path / "have.db")
+    haveDb.store(dest / "HelloWorld.txt", SHA1)
+    haveDb.store(dest / "Hello.txt", SHA1, True)
+
+    rebuildDestination(dest, createMatcher("HelloWorld.txt", "World.txt"), haveDb, FileOperations())
+
+    assert list(dest.iterdir()) == []
+    assert list(haveDb.groups()) == []
+    haveDb.close()
+
+def test_rebuildMovesNextFileAfterFailedMove(tmp_path):
+    """
+    Test the next stored copy is moved if the move of the first copy failed"""
+
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    haveDb = HaveDatabase(tmp_path / "have.db")
+    for name in ["first.txt", "second.txt"]:
+        (dest / name).write_bytes(b"HelloWorld")
+        haveDb.store(dest / name, SHA1)
+    operations = FileOperations()
+    move = operations.move
+
+    def failFirstMove(source, *args):
+        if source.name == "first.txt":
+            raise OSError("failed")
+        move(source, *args)
+    operations.move = failFirstMove
+
+    rebuildDestination(dest, createMatcher("New/HelloWorld.txt"), haveDb, operations)
+
+    assert (dest / "New" / "HelloWorld.txt").is_file()
+    assert (dest / "first.txt").is_file()
+    assert not (dest / "second.txt").exists()
+    haveDb.close()
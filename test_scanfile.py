@@ -0,0 +1,56 @@
+#!/usr/bin/python
+
+import pytest
+from scanfile import PlainFileReader, ScanFile
+from test_strategydiag import createHelloWorld
+from unittest import mock
+
+def test_scanFileStagedNoCandidate(tmp_path):
+    """
+    Test a staged ScanFile with a CRC not matching any ROM
+    only calculates the CRC"""
+
+    file = tmp_path / "HelloWorld.txt"
+    file.write_bytes(b"HelloWorld")
+    isCandidate = mock.MagicMock(side_effect = lambda size, crc: crc is None)
+
+    scan = ScanFile(PlainFileReader(file), None, isCandidate, True)
+
+    assert scan.isLoaded
+    assert scan.crc == createHelloWorld().crc
+    assert scan.md5 is None
+    assert scan.sha1 is None
+    isCandidate.assert_called_with(10, createHelloWorld().crc)
+
+def test_scanFileStagedCandidate(tmp_path):
+    """
+    Test a staged ScanFile with a CRC matching a ROM
+    calculates all hashes"""
+
+    file = tmp_path / "HelloWorld.txt"
+    file.write_bytes(b"HelloWorld")
+    hw = createHelloWorld()
+
+    scan = ScanFile(PlainFileReader(file), None, mock.MagicMock(return_value = True), True)
+
+    assert scan.isLoaded
+    assert scan.size == hw.size
+    assert scan.crc == hw.crc
+    assert scan.md5 == hw.md5
+    assert scan.sha1 == hw.sha1
+
+def test_scanFileStagedCandidateReadAgain(tmp_path):
+    """
+    Test a staged ScanFile bigger than the replay buffer
+    calculates all hashes by reading the file again"""
+
+    file = tmp_path / "HelloWorld.txt"
+    file.write_bytes(b"HelloWorld")
+    hw = createHelloWorld()
+
+    with mock.patch.object(ScanFile, "REPLAY_SIZE", 4):
+        scan = ScanFile(PlainFileReader(file), None, mock.MagicMock(return_value = True), True)
+
+    assert scan.isLoaded
+    assert scan.md5 == hw.md5
+    assert scan.sha1 == hw.sha1
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+
+import pytest
+from scanfile import PlainFileReader
+from strategyaudit import StrategyAudit
+from test_strategyscan import mockOtherStrategis
+from test_strategyscancompressed import createHelloWorldMatcher
+from unittest import mock
+
+def createAudit(tmp_path, sample: float = 0):
+    matcher = createHelloWorldMatcher()
+    rom = matcher.findSha1("db8ac1c259eb89d4a131b253bacfca5f319d54f2")[0]
+    rom.getFileName.side_effect = lambda destPath: destPath / "HelloWorld.txt"
+    return mockOtherStrategis(StrategyAudit(tmp_path, matcher, sample=sample)), rom
+
+def test_auditTrustsExpectedPathAndSize(tmp_path):
+    """
+    Test a file at the expected path with the expected size is matched without reading it,
+    while other files are hashed"""
+
+    ss, rom = createAudit(tmp_path)
+    (tmp_path / "HelloWorld.txt").write_bytes(b"HelloWorld")
+    (tmp_path / "other.txt").write_bytes(b"HelloWorld")
+    readerOpen = PlainFileReader.open
+
+    with mock.patch.object(PlainFileReader, "open", autospec=True, side_effect=readerOpen) as mockOpen:
+        ss.doStrategyScan([tmp_path])
+
+    assert [call.args[0].as_posix() for call in mockOpen.call_args_list] == [(tmp_path / "other.txt").as_posix()]
+    assert sorted(call.args[0].fileName.name for call in ss.doStrategyMatch.call_args_list) == [
+        "HelloWorld.txt", "other.txt"]
+    ss.doStrategyNoMatch.assert_not_called()
+
+def test_auditSampleFindsDamagedFile(tmp_path):
+    """
+    Test a sampled file at the expected path with the expected size but other content is not matching"""
+
+    ss, rom = createAudit(tmp_path, 100)
+    (tmp_path / "HelloWorld.txt").write_bytes(b"HelloWorlD")
+
+    ss.doStrategyScan([tmp_path])
+
+    ss.doStrategyMatch.assert_not_called()
+    ss.doStrategyNoMatch.assert_called_once()
+
+def test_auditSampleReadErrorIsNoMatch(tmp_path):
+    """
+    Test a sampled file at the expected path which can't be read is not trusted"""
+
+    ss, rom = createAudit(tmp_path, 100)
+    (tmp_path / "HelloWorld.txt").write_bytes(b"HelloWorld")
+
+    with mock.patch.object(PlainFileReader, "open", side_effect=OSError(5, "Input/output error")):
+        ss.doStrategyScan([tmp_path])
+
+    ss.doStrategyMatch.assert_not_called()
+    ss.doStrategyNoMatch.assert_called_once()
@@ -1,6 +1,8 @@
 #!/usr/bin/python
 
+import json
 import pytest
+from diagreport import JsonLinesReport
 from pathlib import Path
 from scanfile import PlainFileReader, ScanFile
 from strategy import Strategy
@@ -107,3 +109,33 @@ def test_doStrategyMatchDuplicate():
     assert len(sd.goodBySystem) == 1
     assert sd.dups.get(mockGameRom)[0].as_posix() == mockDups.fileName.as_posix()
     assert sd.goodBySystem.get(mockGameRom.game.header) == { mockGameRom: mockGood.fileName }
+
+@mock.patch('builtins.print')
+def test_reportIsWrittenWhileScanning(mockPrint, tmp_path):
+    """
+    Test StrategyDiag with a report writes unknown and duplicate files while scanning
+    without keeping them and reconciles a misnamed file found before its good file"""
+
+    report = JsonLinesReport(tmp_path / "report.jsonl")
+    sd = StrategyDiag(False, False, report)
+    mockGood = createHelloWorld()
+    mockGameRom = createGameRomFromScanFile(mockGood)
+    mockGameRom.game.header.roms = {b"hw": [mockGameRom]}
+    mockGameRom.sha1Digest = b"hw"
+    mockGameRom.game.name = "HelloWorld"
+    mockGameRom.game.header.name = "Test DAT"
+    misnamed = createHelloWorld()
+    misnamed.fileName = PlainFileReader(Path("Other.txt"))
+    sd.doStrategyMatch(misnamed, [mockGameRom])
+    sd.doStrategyNoMatch(createHelloWorld())
+    sd.doStrategyMatch(mockGood, [mockGameRom])
+    sd.doStrategyMatch(createHelloWorld(), [mockGameRom])
+    assert len(sd.bads) == 1
+    assert len(sd.dups) == 0
+    sd.doFinal()
+    report.close()
+
+    lines = [json.loads(line) for line in (tmp_path / "report.jsonl").read_text().splitlines()]
+    assert [(line["status"], line["path"]) for line in lines] == [("unknown", "HelloWorld.txt"),
+        ("having", "HelloWorld.txt"), ("duplicate", "HelloWorld.txt"), ("duplicate", "Other.txt")]
+    assert len(sd.bads) == 0
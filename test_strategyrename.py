@@ -0,0 +1,60 @@
+#!/usr/bin/python
+
+import os
+import pytest
+from scanfile import PlainFileReader, ScanFile
+from strategyrename import StrategyRename
+from test_strategyscancompressed import createHelloWorldMatcher
+from unittest import mock
+
+def test_duplicateOfMovedFileNotHashed(tmp_path):
+    """
+    Test StrategyRename.doStrategyMatch detects a duplicate of a moved file
+    from the destination index without reading the destination file if it is kept"""
+
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    source = tmp_path / "source"
+    source.mkdir()
+    matcher = createHelloWorldMatcher()
+    rom = matcher.findSha1("db8ac1c259eb89d4a131b253bacfca5f319d54f2")[0]
+    rom.getFileName.side_effect = lambda destPath: destPath / "system" / "HelloWorld.txt"
+    sr = StrategyRename(dest, matcher, False, False)
+    for name in ["first.txt", "second.txt"]:
+        (source / name).write_bytes(b"HelloWorld")
+    first = ScanFile(PlainFileReader(source / "first.txt"))
+    second = ScanFile(PlainFileReader(source / "second.txt"))
+
+    sr.doStrategyMatch(first, [rom])
+    with mock.patch.object(PlainFileReader, "open") as mockOpen:
+        sr.doStrategyMatch(second, [rom])
+
+    mockOpen.assert_not_called()
+    assert (dest / "system" / "HelloWorld.txt").read_bytes() == b"HelloWorld"
+    assert [path.name for path in source.iterdir()] == ["second.txt"]
+
+def test_duplicateNotDeletedForChangedDestination(tmp_path):
+    """
+    Test StrategyRename.doStrategyMatch hashes the destination file again before deleting
+    a duplicate, so a destination overwritten in place keeps the source file"""
+
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    source = tmp_path / "source"
+    source.mkdir()
+    matcher = createHelloWorldMatcher()
+    rom = matcher.findSha1("db8ac1c259eb89d4a131b253bacfca5f319d54f2")[0]
+    rom.getFileName.side_effect = lambda destPath: destPath / "HelloWorld.txt"
+    rom.isMatching.return_value = True
+    sr = StrategyRename(dest, matcher, True, False)
+    for name in ["first.txt", "second.txt"]:
+        (source / name).write_bytes(b"HelloWorld")
+    sr.doStrategyMatch(ScanFile(PlainFileReader(source / "first.txt")), [rom])
+    destStat = os.stat(dest / "HelloWorld.txt")
+    os.chmod(dest / "HelloWorld.txt", 0o644)
+    (dest / "HelloWorld.txt").write_bytes(b"HelloWorlD")
+    os.utime(dest / "HelloWorld.txt", ns=(destStat.st_atime_ns, destStat.st_mtime_ns))
+
+    sr.doStrategyMatch(ScanFile(PlainFileReader(source / "second.txt")), [rom])
+
+    assert (source / "second.txt").read_bytes() == b"HelloWorld"
@@ -1,5 +1,6 @@
 #!/usr/bin/python
 
+import os
 import pytest
 from pathlib import Path
 from strategyrename import Matcher
@@ -11,101 +12,140 @@ def createMockMatcher(val: bool) -> Matcher:
     m.findMatch = mock.MagicMock(return_value = 'any' if val else None)
     return m
 
-def createMockDirWithEntry(entry: list[Path]) -> Path:
-    m = mock.Mock()
-    m.is_dir = mock.MagicMock(return_value = True)
-    m.is_file = mock.MagicMock(return_value = False)
-    m.is_symlink = mock.MagicMock(return_value = False)
-    m.iterdir = mock.MagicMock(return_value = entry)
-    m.as_posix = mock.MagicMock(return_value = 'DirWithEntry')
-    return m
-
-def createMockFile() -> Path:
-    m = mock.Mock()
-    m.is_dir = mock.MagicMock(return_value = False)
-    m.is_file = mock.MagicMock(return_value = True)
-    m.as_posix = mock.MagicMock(return_value = 'MockFile')
-    stat = mock.Mock()
-    stat.st_size = 4
-    m.stat = mock.MagicMock(return_value = stat)
-    return m
+def createDirWithFiles(directory: Path, count: int) -> list[Path]:
+    directory.mkdir(exist_ok=True)
+    files = []
+    for i in range(count):
+        file = directory / f"file{i:02}"
+        file.write_bytes(bytes([i]) * i * 1000)
+        files.append(file)
+    return files
 
 def mockOtherStrategis(toPatch: StrategyScan) -> StrategyScan:
     toPatch.doStrategyNoMatch = mock.MagicMock()
     toPatch.doStrategyMatch = mock.MagicMock()
     return toPatch
-    
 
-def test_doStrategyScanEmptyDirectory():
+
+def test_doStrategyScanEmptyDirectory(tmp_path):
     """
     Test StrategyScan.doStrategyScan with empty directory
     will not call Matcher and return empty array"""
 
     matcher = createMockMatcher(False)
-    mockDir = createMockDirWithEntry([])
     ss = mockOtherStrategis(StrategyScan(matcher))
 
-    ret = ss.doStrategyScan([mockDir])
+    ret = ss.doStrategyScan([tmp_path])
 
     assert len(ret) == 0
     matcher.findMatch.assert_not_called()
-    mockDir.iterdir.assert_called_once()
     ss.doStrategyNoMatch.assert_not_called()
     ss.doStrategyMatch.assert_not_called()
 
-@mock.patch("builtins.open", mock.mock_open(read_data=b'test'))
-def test_doStrategyScanSingleFileNegative():
+def test_doStrategyScanSingleFileNegative(tmp_path):
     """
     Test StrategyScan.doStrategyScan with a single file in directory 
     will call Matcher and return empty array.
     Matcher will return false so doStrategyNoMatch is called"""
 
     matcher = createMockMatcher(False)
-    mockDir = createMockDirWithEntry([createMockFile()])
+    createDirWithFiles(tmp_path, 1)
     ss = mockOtherStrategis(StrategyScan(matcher))
     
-    ret = ss.doStrategyScan([mockDir])
+    ret = ss.doStrategyScan([tmp_path])
 
     assert len(ret) == 0
     matcher.findMatch.assert_called_once()
-    mockDir.iterdir.assert_called_once()
     ss.doStrategyNoMatch.assert_called_once()
     ss.doStrategyMatch.assert_not_called()
 
-@mock.patch("builtins.open", mock.mock_open(read_data=b'test'))
-def test_doStrategyScanSingleFilePositive():
+def test_doStrategyScanSingleFilePositive(tmp_path):
     """
     Test StrategyScan.doStrategyScan with a single file in directory 
     will call Matcher and return empty array.
     Matcher will return true so doStrategyMatch is called"""
 
     matcher = createMockMatcher(True)
-    mockDir = createMockDirWithEntry([createMockFile()])
+    createDirWithFiles(tmp_path, 1)
     ss = mockOtherStrategis(StrategyScan(matcher))
     
-    ret = ss.doStrategyScan([mockDir])
+    ret = ss.doStrategyScan([tmp_path])
 
     assert len(ret) == 0
     matcher.findMatch.assert_called_once()
-    mockDir.iterdir.assert_called_once()
     ss.doStrategyNoMatch.assert_not_called()
     ss.doStrategyMatch.assert_called_once()
 
-def test_doStrategyScanSingleDirectory():
+def test_doStrategyScanSingleDirectory(tmp_path):
     """
     Test StrategyScan.doStrategyScan with a single directory in directory 
     will not call Matcher and return empty directory."""
 
     matcher = createMockMatcher(True)
-    subDir = [createMockDirWithEntry([])];
-    mockDir = createMockDirWithEntry(subDir)
+    subDir = tmp_path / "subDir"
+    subDir.mkdir()
     ss = mockOtherStrategis(StrategyScan(matcher))
     
-    ret = ss.doStrategyScan([mockDir])
+    ret = ss.doStrategyScan([tmp_path])
 
-    assert len(ret) == 1
-    assert ret == subDir
+    assert ret == [subDir]
     matcher.findMatch.assert_not_called()
-    mockDir.iterdir.assert_called_once()
     ss.doStrategyNoMatch.assert_not_called()
     ss.doStrategyMatch.assert_not_called()
+
+def test_doStrategyScanRecursive(tmp_path):
+    """
+    Test StrategyScan.doStrategyScan recursive will scan files in all
+    sub directories, but not follow symlinked directories"""
+
+    matcher = createMockMatcher(False)
+    createDirWithFiles(tmp_path, 2)
+    createDirWithFiles(tmp_path / "subDir", 2)
+    createDirWithFiles(tmp_path / "subDir" / "subSubDir", 2)
+    (tmp_path / "link").symlink_to(tmp_path / "subDir")
+    ss = mockOtherStrategis(StrategyScan(matcher, recursive=True))
+
+    ret = ss.doStrategyScan([tmp_path])
+
+    assert len(ret) == 0
+    assert matcher.findMatch.call_count == 6
+    assert ss.doStrategyNoMatch.call_count == 6
+
+def test_doStrategyScanParallelKeepsOrder(tmp_path):
+    """
+    Test StrategyScan.doStrategyScan with several worker threads
+    will call the other strategies in the order of the directory entries"""
+
+    createDirWithFiles(tmp_path, 20)
+    files = [entry.path for entry in os.scandir(tmp_path)]
+    matcher = createMockMatcher(False)
+    ss = mockOtherStrategis(StrategyScan(matcher, 4))
+
+    ret = ss.doStrategyScan([tmp_path])
+
+    assert len(ret) == 0
+    assert matcher.findMatch.call_count == len(files)
+    scaned = [call.args[0].fileName.as_posix() for call in ss.doStrategyNoMatch.call_args_list]
+    assert scaned == files
+    ss.doStrategyMatch.assert_not_called()
+
+def test_doStrategyScanUnknownSizeNotRead(tmp_path):
+    """
+    Test StrategyScan.doStrategyScan with a file of a size no ROM has
+    will not read the file and call doStrategyNoMatch"""
+
+    file = tmp_path / "unknown.bin"
+    file.write_bytes(b"unknown")
+    matcher = createMockMatcher(False)
+    matcher.isCandidate = mock.MagicMock(return_value = False)
+    ss = mockOtherStrategis(StrategyScan(matcher))
+
+    with mock.patch("builtins.open") as mockOpen:
+        ret = ss.doStrategyScan([file])
+        mockOpen.assert_not_called()
+
+    assert len(ret) == 0
+    matcher.isCandidate.assert_called_once_with(7, None)
+    ss.doStrategyNoMatch.assert_called_once()
+    assert not ss.doStrategyNoMatch.call_args.args[0].isLoaded
+    ss.doStrategyMatch.assert_not_called()
@@ -0,0 +1,260 @@
+#!/usr/bin/python
+
+import gzip
+import logging
+import pytest
+import tarfile
+import zipfile
+from strategyrename import Matcher
+from strategyscancompressed import SPOOL_DIR_NAME, StrategyScanCompressed
+from test_strategydiag import createHelloWorld
+from test_strategyscan import mockOtherStrategis
+from unittest import mock
+
+def createHelloWorldMatcher() -> Matcher:
+    hw = createHelloWorld()
+    rom = mock.Mock()
+    rom.name = "HelloWorld.txt"
+    rom.size = hw.size
+    rom.crcValue = int(hw.crc, 16)
+    rom.md5 = hw.md5
+    rom.sha1 = hw.sha1
+    return Matcher({bytes.fromhex(hw.sha1): [rom]})
+
+def createZip(tmp_path, entries: dict):
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w") as zipFile:
+        for name, data in entries.items():
+            zipFile.writestr(name, data)
+    return archive
+
+def test_doStrategyScanZipOnlyCandidatesDecompressed(tmp_path):
+    """
+    Test StrategyScanCompressed.doStrategyScan with a ZIP archive
+    will only decompress entries with CRC and size of a ROM"""
+
+    archive = createZip(tmp_path, {"unknown.txt": b"unknown", "HelloWorld.txt": b"HelloWorld"})
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher()))
+    zipOpen = zipfile.ZipFile.open
+
+    with mock.patch.object(zipfile.ZipFile, "open", autospec=True, side_effect=zipOpen) as mockOpen:
+        ss.doStrategyScan([archive])
+
+    assert mockOpen.call_count == 1
+    assert mockOpen.call_args.args[1].filename == "HelloWorld.txt"
+    ss.doStrategyMatch.assert_called_once()
+    assert ss.doStrategyMatch.call_args.args[0].sha1 == createHelloWorld().sha1
+    ss.doStrategyNoMatch.assert_called_once()
+    assert not ss.doStrategyNoMatch.call_args.args[0].isLoaded
+
+def test_zipEntrySpooledWhileHashing(tmp_path):
+    """
+    Test a ZIP entry with a spool directory is decompressed only once
+    while hashing and renamed from the spool file"""
+
+    archive = createZip(tmp_path, {"HelloWorld.txt": b"HelloWorld"})
+    spoolDir = tmp_path / "dest"
+    spoolDir.mkdir()
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher(), spoolDir=spoolDir))
+    ss.doStrategyMatch.side_effect = lambda scan, match: scan.fileName.rename(spoolDir / "HelloWorld.txt", scan.sha1)
+    zipOpen = zipfile.ZipFile.open
+
+    with mock.patch.object(zipfile.ZipFile, "open", autospec=True, side_effect=zipOpen) as mockOpen:
+        ss.doStrategyScan([archive])
+
+    assert mockOpen.call_count == 1
+    assert [file.name for file in spoolDir.iterdir()] == ["HelloWorld.txt"]
+    assert (spoolDir / "HelloWorld.txt").read_bytes() == b"HelloWorld"
+
+def test_zipEntrySpoolRemovedOnNoMatch(tmp_path):
+    """
+    Test the spool file of a not moved ZIP entry is removed"""
+
+    archive = createZip(tmp_path, {"HelloWorld.txt": b"HelloWorld"})
+    spoolDir = tmp_path / "dest"
+    spoolDir.mkdir()
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher(), spoolDir=spoolDir))
+
+    ss.doStrategyScan([archive])
+
+    ss.doStrategyMatch.assert_called_once()
+    assert list(spoolDir.iterdir()) == []
+
+def test_spoolFilesOfInterruptedScanRemoved(tmp_path):
+    """
+    Test spool files left by an interrupted scan are removed and a long entry name
+    is spooled into a file with a short name"""
+
+    longName = "HelloWorld" * 24 + ".txt"
+    archive = createZip(tmp_path, {longName: b"HelloWorld"})
+    spoolDir = tmp_path / "dest"
+    (spoolDir / SPOOL_DIR_NAME).mkdir(parents=True)
+    (spoolDir / SPOOL_DIR_NAME / "tmpx1.part").write_bytes(b"Hello")
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher(), spoolDir=spoolDir))
+    ss.doStrategyMatch.side_effect = lambda scan, match: scan.fileName.rename(spoolDir / "HelloWorld.txt", scan.sha1)
+
+    ss.doStrategyScan([archive])
+
+    assert [file.name for file in spoolDir.iterdir()] == ["HelloWorld.txt"]
+
+def test_zipEntryMovedIsRemoved(tmp_path):
+    """
+    Test a moved ZIP entry is removed from the archive after the archive is scaned"""
+
+    archive = createZip(tmp_path, {"unknown.txt": b"unknown", "HelloWorld.txt": b"HelloWorld"})
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher()))
+    ss.doStrategyMatch.side_effect = lambda scan, match: scan.fileName.rename(dest / "HelloWorld.txt", scan.sha1)
+
+    ss.doStrategyScan([archive])
+
+    assert (dest / "HelloWorld.txt").read_bytes() == b"HelloWorld"
+    with zipfile.ZipFile(archive) as zipFile:
+        assert zipFile.namelist() == ["unknown.txt"]
+
+def test_doStrategyScanTarGz(tmp_path, caplog):
+    """
+    Test StrategyScanCompressed.doStrategyScan with a gzip compressed TAR archive
+    will scan every member as a stream and move a found member from the spool file
+    without a warning about the member kept in the archive"""
+
+    source = tmp_path / "source"
+    source.mkdir()
+    (source / "unknown.txt").write_bytes(b"unknown")
+    (source / "HelloWorld.txt").write_bytes(b"HelloWorld")
+    archive = tmp_path / "archive.tar.gz"
+    with tarfile.open(archive, "w:gz") as tarFile:
+        tarFile.add(source / "unknown.txt", "unknown.txt")
+        tarFile.add(source / "HelloWorld.txt", "dir/HelloWorld.txt")
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher(), spoolDir=dest))
+    ss.doStrategyMatch.side_effect = lambda scan, match: scan.fileName.rename(dest / "HelloWorld.txt", scan.sha1)
+
+    ss.doStrategyScan([archive])
+
+    ss.doStrategyMatch.assert_called_once()
+    assert ss.doStrategyMatch.call_args.args[0].fileName.as_posix() == archive.as_posix() + "/dir/HelloWorld.txt"
+    ss.doStrategyNoMatch.assert_called_once()
+    assert [file.name for file in dest.iterdir()] == ["HelloWorld.txt"]
+    assert [record for record in caplog.records if record.levelno >= logging.WARNING] == []
+
+def test_doStrategyScanGzip(tmp_path):
+    """
+    Test StrategyScanCompressed.doStrategyScan with a gzip file
+    will scan the decompressed file and a move deletes the gzip file"""
+
+    archive = tmp_path / "HelloWorld.txt.gz"
+    with gzip.open(archive, "wb") as gzipFile:
+        gzipFile.write(b"HelloWorld")
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher()))
+    ss.doStrategyMatch.side_effect = lambda scan, match: scan.fileName.rename(dest / "HelloWorld.txt", scan.sha1)
+
+    ss.doStrategyScan([archive])
+
+    ss.doStrategyMatch.assert_called_once()
+    assert ss.doStrategyMatch.call_args.args[0].size == 10
+    ss.doStrategyNoMatch.assert_not_called()
+    assert (dest / "HelloWorld.txt").read_bytes() == b"HelloWorld"
+    assert not archive.exists()
+
+def test_nestedZipScaned(tmp_path):
+    """
+    Test a ROM in a ZIP archive inside a ZIP archive is found and moved
+    while the outer archive is left unchanged"""
+
+    inner = createZip(tmp_path, {"HelloWorld.txt": b"HelloWorld"}).read_bytes()
+    (tmp_path / "archive.zip").unlink()
+    outer = tmp_path / "outer.zip"
+    with zipfile.ZipFile(outer, "w") as zipFile:
+        zipFile.writestr("inner.zip", inner)
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher(), nestedDepth=1))
+    ss.doStrategyMatch.side_effect = lambda scan, match: scan.fileName.rename(dest / "HelloWorld.txt", scan.sha1)
+
+    ss.doStrategyScan([outer])
+
+    ss.doStrategyMatch.assert_called_once()
+    assert ss.doStrategyMatch.call_args.args[0].fileName.as_posix() == outer.as_posix() + "/inner.zip/HelloWorld.txt"
+    ss.doStrategyNoMatch.assert_not_called()
+    assert (dest / "HelloWorld.txt").read_bytes() == b"HelloWorld"
+    with zipfile.ZipFile(outer) as zipFile:
+        assert zipFile.namelist() == ["inner.zip"]
+
+def test_nestedZipBelowDepthNotScaned(tmp_path):
+    """
+    Test a ZIP archive inside a ZIP archive is a not matching entry if nestedDepth is 0"""
+
+    inner = createZip(tmp_path, {"HelloWorld.txt": b"HelloWorld"}).read_bytes()
+    outer = tmp_path / "outer.zip"
+    with zipfile.ZipFile(outer, "w") as zipFile:
+        zipFile.writestr("inner.zip", inner)
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher()))
+
+    ss.doStrategyScan([outer])
+
+    ss.doStrategyMatch.assert_not_called()
+    ss.doStrategyNoMatch.assert_called_once()
+    assert ss.doStrategyNoMatch.call_args.args[0].fileName.as_posix() == outer.as_posix() + "/inner.zip"
+
+def test_zipEntriesHashedInParallelMatchedInOrder(tmp_path):
+    """
+    Test entries of a ZIP archive hashed by several threads are matched
+    in the order of the archive"""
+
+    names = [f"HelloWorld{index}.txt" for index in range(8)]
+    archive = createZip(tmp_path, {name: b"HelloWorld" for name in names} | {"unknown.txt": b"unknown"})
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher(), jobs=4))
+
+    ss.doStrategyScan([archive])
+
+    assert [call.args[0].fileName.name for call in ss.doStrategyMatch.call_args_list] == names
+    assert all(call.args[0].sha1 == createHelloWorld().sha1 for call in ss.doStrategyMatch.call_args_list)
+    ss.doStrategyNoMatch.assert_called_once()
+
+def test_strategyErrorSkipsOnlyEntry(tmp_path):
+    """
+    Test an error of another strategy for a ZIP entry doesn't stop the scan of the other entries"""
+
+    archive = createZip(tmp_path, {"first/HelloWorld.txt": b"HelloWorld", "second/HelloWorld.txt": b"HelloWorld"})
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher()))
+    ss.doStrategyMatch.side_effect = [FileExistsError("exists"), None]
+
+    ss.doStrategyScan([archive])
+
+    assert ss.doStrategyMatch.call_count == 2
+    ss.doStrategyNoMatch.assert_not_called()
+
+def test_zipEntrySpoolSyncedBeforeRename(tmp_path):
+    """
+    Test a spooled ZIP entry is synced before it is renamed into the destination"""
+
+    archive = createZip(tmp_path, {"HelloWorld.txt": b"HelloWorld"})
+    spoolDir = tmp_path / "dest"
+    spoolDir.mkdir()
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher(), spoolDir=spoolDir))
+    ss.doStrategyMatch.side_effect = lambda scan, match: scan.fileName.rename(spoolDir / "HelloWorld.txt", scan.sha1)
+
+    with mock.patch("os.fsync") as mockFsync:
+        ss.doStrategyScan([archive])
+
+    mockFsync.assert_called_once()
+    assert (spoolDir / "HelloWorld.txt").read_bytes() == b"HelloWorld"
+
+def test_zipRewriteErrorDoesNotStopScan(tmp_path):
+    """
+    Test an error while removing moved entries keeps the archive and the scan continues"""
+
+    archive = createZip(tmp_path, {"HelloWorld.txt": b"HelloWorld", "unknown.txt": b"unknown"})
+    ss = mockOtherStrategis(StrategyScanCompressed(createHelloWorldMatcher()))
+    ss.doStrategyMatch.side_effect = lambda scan, match: scan.fileName.unlink()
+
+    with mock.patch("containers.removeZipEntries", side_effect=OSError("disk full")):
+        ss.doStrategyScan([archive])
+
+    with zipfile.ZipFile(archive) as zipFile:
+        assert zipFile.namelist() == ["HelloWorld.txt", "unknown.txt"]
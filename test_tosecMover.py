@@ -0,0 +1,60 @@
+#!/usr/bin/python
+
+import hashlib
+import logging
+import pytest
+import zlib
+from scanoptions import ScanOptions
+from tosecMover import Tosec, createJobParser, runJobsFile
+from unittest import mock
+
+def test_runJobsFile(tmp_path):
+    """
+    Test every valid job of a jobs file is run in order with the parsed options"""
+
+    jobsFile = tmp_path / "jobs.txt"
+    jobsFile.write_text("# nightly\n--source 'new files' -x dest\n\n--unknown dest\n--noHaving other\n")
+    tosec = mock.Mock()
+
+    runJobsFile(tosec, jobsFile, createJobParser())
+
+    assert [call.args[0] for call in tosec.scanDirectory.call_args_list] == [
+        ScanOptions("dest", source="new files", scanCompressed=True),
+        ScanOptions("other", noHaving=True)]
+
+def writeDat(datFile, name: str, games: int):
+    """
+    Write a TOSEC DAT with the given number of games and one game without ROM"""
+
+    lines = ["<?xml version=\"1.0\"?>", "<datafile>", f"<header><name>{name}</name></header>"]
+    for game in range(games):
+        content = f"{name} {game}".encode()
+        lines.append(f"<game name=\"{name} {game}\"><rom name=\"{game}.bin\" size=\"{len(content)}\" "
+            f"crc=\"{zlib.crc32(content):08x}\" md5=\"{hashlib.md5(content).hexdigest()}\" "
+            f"sha1=\"{hashlib.sha1(content).hexdigest()}\"/></game>")
+    lines.append(f"<game name=\"{name} broken\"></game>")
+    lines.append("</datafile>")
+    datFile.write_text("\n".join(lines))
+
+def loadDats(datPath, jobs: int, caplog) -> tuple:
+    caplog.clear()
+    with mock.patch("tosecMover.Matcher") as mockMatcher:
+        Tosec(datPath.as_posix(), jobs=jobs)
+    romList = mockMatcher.call_args.args[0]
+    return ([(sha1, [rom.name for rom in roms]) for sha1, roms in romList.items()],
+        [(record.levelname, record.getMessage()) for record in caplog.records])
+
+def test_parallelLoadSameAsSerial(tmp_path, caplog):
+    """
+    Test DATs parsed by worker processes give the same ROM list and log as a serial load"""
+
+    for index in range(4):
+        writeDat(tmp_path / f"dat{index}.dat", f"System{index} - Games", 3)
+    caplog.set_level(logging.INFO)
+
+    serial = loadDats(tmp_path, 1, caplog)
+    parallel = loadDats(tmp_path, 3, caplog)
+
+    assert len(serial[0]) == 12
+    assert len([record for record in serial[1] if record[0] == "WARNING"]) == 4
+    assert parallel == serial
@@ -1,7 +1,12 @@
 #!/usr/bin/python
 
+import gc
+import hashlib
 import pytest
-from tosecdat import InvalidTosecFileException, TosecGameEntry, TosecGameRom, TosecHeader
+import weakref
+import zlib
+from pathlib import Path
+from tosecdat import InvalidTosecFileException, TosecGameEntry, TosecGameRom, TosecHeader, parseElements, readTosecFile
 from unittest import mock
 from test_strategydiag import createHelloWorld
 import xml.etree.ElementTree
@@ -109,6 +114,17 @@ def test_doTosecGameEntryMultipleRoms():
     assert len(tge.roms) == 3
     assert tge.name == "DummyGame"
     
+def test_doTosecGameEntryMultipleRomsPathName():
+    """
+    Test the path of a game entry with several ROMs contains the game directory"""
+
+    header = mock.Mock()
+    header.system = "Dummy"
+    header.category = "Games"
+    tge = TosecGameEntry(createDummyTOSECGame([createDummyTOSECRom(), createDummyTOSECRom()]), header)
+
+    assert tge.getPathName(Path("base")) == Path("base/Dummy/Games/DummyGame")
+
 def test_doTosecGameEntryNoName():
     """
     Test if no name attribute is present an exception is thrown"""
@@ -128,3 +144,108 @@ def test_doTosecGameEntryNoRoms():
     with pytest.raises(InvalidTosecFileException):
         TosecGameEntry(test, mock.Mock())
 
+
+def test_doTosecGameRom():
+    """
+    Test a valid ROM entry is parsed into int size and binary hashes
+    and the hashes are still available as hex strings"""
+
+    hw = createHelloWorld()
+    tgr = TosecGameRom(createDummyTOSECRom(), mock.Mock())
+
+    assert tgr.size == hw.size
+    assert tgr.sha1Digest == bytes.fromhex(hw.sha1)
+    assert tgr.sha1 == hw.sha1
+    assert tgr.md5 == hw.md5
+    assert tgr.crc == hw.crc
+    assert tgr.isMatching(hw)
+
+def test_doTosecGameRomInvalidHash():
+    """
+    Test if a hash isn't a hex string an exception is thrown"""
+
+    rom = createDummyTOSECRom()
+    rom.attrib["sha1"] = "no hex"
+
+    with pytest.raises(InvalidTosecFileException):
+        TosecGameRom(rom, mock.Mock())
+
+def writeDummyDat(datFile: Path, games: int):
+    tosec = createDummyTOSEC()
+    for index in range(games):
+        rom = createDummyTOSECRom()
+        content = f"game {index}".encode()
+        rom.attrib["name"] = f"{index}.bin"
+        rom.attrib["size"] = str(len(content))
+        rom.attrib["crc"] = format(zlib.crc32(content), "08x")
+        rom.attrib["md5"] = hashlib.md5(content).hexdigest()
+        rom.attrib["sha1"] = hashlib.sha1(content).hexdigest()
+        game = createDummyTOSECGame([rom])
+        game.attrib["name"] = f"Game {index}"
+        tosec.getroot().append(game)
+    tosec.write(datFile)
+
+def test_readTosecFileReleasesGameElements(tmp_path):
+    """
+    Test readTosecFile removes every game element from the tree once the game entry was
+    created, so a parsed game element is released before the next game ends"""
+
+    datFile = tmp_path / "dummy.dat"
+    writeDummyDat(datFile, 50)
+    iterparse = xml.etree.ElementTree.iterparse
+    gameElements = []
+    aliveGames = []
+
+    def recordingIterparse(*args):
+        for event, element in iterparse(*args):
+            if event == "end" and element.tag == "game":
+                aliveGames.append(sum(1 for game in gameElements if game() is not None))
+                gameElements.append(weakref.ref(element))
+            yield event, element
+
+    with mock.patch("xml.etree.ElementTree.iterparse", side_effect=recordingIterparse):
+        romList = readTosecFile(datFile)
+    gc.collect()
+
+    assert len(romList) == 50
+    assert len(gameElements) == 50
+    assert max(aliveGames) == 0
+    assert all(element() is None for element in gameElements)
+
+def test_readTosecFileGamesBeforeHeader(tmp_path):
+    """
+    Test games ahead of the header are read once the header is parsed"""
+
+    datFile = tmp_path / "dummy.dat"
+    writeDummyDat(datFile, 3)
+    tosec = xml.etree.ElementTree.parse(datFile)
+    header = tosec.getroot().find("header")
+    tosec.getroot().remove(header)
+    tosec.getroot().append(header)
+    tosec.write(datFile)
+
+    romList = readTosecFile(datFile)
+
+    assert len(romList) == 3
+    assert all(rom.game.header.name == "Dummy - Games" for roms in romList.values() for rom in roms)
+
+def test_readTosecFileMalformedXml(tmp_path, caplog):
+    """
+    Test a DAT file with malformed XML after valid games is skipped completely"""
+
+    datFile = tmp_path / "dummy.dat"
+    writeDummyDat(datFile, 3)
+    datFile.write_text(datFile.read_text()[:-20])
+
+    assert readTosecFile(datFile) == {}
+    assert "File skipped because: invalid XML" in caplog.text
+
+def test_parseElementsMalformedXml(tmp_path):
+    """
+    Test a parse error is raised as InvalidTosecFileException"""
+
+    datFile = tmp_path / "dummy.dat"
+    datFile.write_text("<datafile><header>")
+
+    with pytest.raises(InvalidTosecFileException):
+        list(parseElements(datFile))
@@ -0,0 +1,32 @@
+#!/usr/bin/python
+
+import pytest
+from tosecindex import TosecIndex
+
+def test_indexLoadUnchangedDat(tmp_path):
+    """
+    Test a stored ROM list is loaded from a saved index as long as the DAT is unchanged"""
+
+    dat = tmp_path / "dummy.dat"
+    dat.write_text("<datafile/>")
+    indexFile = tmp_path / "dummy.index"
+    index = TosecIndex(indexFile)
+    assert index.load(dat) is None
+    index.store(dat, {"sha1": ["rom"]})
+    index.save()
+
+    assert TosecIndex(indexFile).load(dat) == {"sha1": ["rom"]}
+
+def test_indexChangedDatNotLoaded(tmp_path):
+    """
+    Test a changed DAT file is not loaded from the index"""
+
+    dat = tmp_path / "dummy.dat"
+    dat.write_text("<datafile/>")
+    indexFile = tmp_path / "dummy.index"
+    index = TosecIndex(indexFile)
+    index.store(dat, {"sha1": ["rom"]})
+    index.save()
+    dat.write_text("<datafile></datafile>")
+
+    assert TosecIndex(indexFile).load(dat) is None
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+import json
+import logging
+import os
+import socket
+import stat
+import subprocess
+import sys
+import threading
+import tosecClient
+from tosecMover import createJobParser
+from tosecserver import runJob, serve
+from unittest import mock
+
+def sendJob(tosec, request: dict) -> tuple:
+    server, client = socket.socketpair()
+    with server, client:
+        client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        runJob(tosec, server, createJobParser())
+        server.shutdown(socket.SHUT_WR)
+        messages = [json.loads(line) for line in client.makefile("r", encoding="utf-8")]
+    assert "exit" in messages[-1]
+    return "".join(message["output"] for message in messages[:-1]), messages[-1]["exit"]
+
+def test_runJobParsedInClientDirectory(tmp_path):
+    """
+    Test a job is parsed and run in the working directory of the client
+    and the output of the job is sent back"""
+
+    tosec = mock.Mock()
+    workDir = os.getcwd()
+    tosec.scanDirectory.side_effect = lambda params: print("scan", os.getcwd(), params.source, params.dest)
+
+    output, status = sendJob(tosec, {"cwd": tmp_path.as_posix(), "args": ["--source", "new", "dest"]})
+
+    assert output == f"scan {tmp_path.as_posix()} new dest\n"
+    assert status == 0
+    assert os.getcwd() == workDir
+
+def test_runJobInvalidArguments(tmp_path):
+    """
+    Test a job with invalid arguments is not run and the usage is sent back"""
+
+    tosec = mock.Mock()
+
+    output, status = sendJob(tosec, {"cwd": tmp_path.as_posix(), "args": ["--unknown"]})
+
+    tosec.scanDirectory.assert_not_called()
+    assert "usage: tosecClient.py SOCKET" in output
+    assert status == 2
+
+def test_runJobError(tmp_path):
+    """
+    Test a job logging an error or raising an exception ends with status 1"""
+
+    tosec = mock.Mock()
+    tosec.scanDirectory.side_effect = lambda params: logging.error("destination missing")
+
+    output, status = sendJob(tosec, {"cwd": tmp_path.as_posix(), "args": ["dest"]})
+
+    assert "destination missing" in output
+    assert status == 1
+
+    tosec.scanDirectory.side_effect = OSError("failed")
+    assert sendJob(tosec, {"cwd": tmp_path.as_posix(), "args": ["dest"]})[1] == 1
+
+def test_clientExitsWithJobStatus(tmp_path):
+    """
+    Test the client prints the output of the job and exits with its status"""
+
+    socketPath = tmp_path / "tosec.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socketPath.as_posix())
+        server.listen()
+        def acceptJob():
+            connection, _ = server.accept()
+            with connection:
+                runJob(mock.Mock(), connection, createJobParser())
+        thread = threading.Thread(target=acceptJob)
+        thread.start()
+        # the client runs in its own process, so its stdout is not redirected to the job
+        client = subprocess.run([sys.executable, tosecClient.__file__, socketPath.as_posix(), "--unknown"],
+            capture_output=True, text=True)
+        thread.join()
+
+    assert client.returncode == 2
+    assert "usage: tosecClient.py SOCKET" in client.stdout
+
+def test_serveSocketOnlyForOwner(tmp_path):
+    """
+    Test the server socket is created without permissions for group and others"""
+
+    socketPath = tmp_path / "tosec.sock"
+    modes = []
+
+    def accept(server):
+        modes.append(stat.S_IMODE(os.stat(socketPath).st_mode))
+        raise KeyboardInterrupt()
+
+    with mock.patch.object(socket.socket, "accept", accept):
+        serve(mock.Mock(), socketPath, createJobParser())
+
+    assert modes == [0o600]
+    assert not socketPath.exists()
+
+def test_runJobClientDisconnected(tmp_path):
+    """
+    Test a job is finished without error if the client disconnected"""
+
+    tosec = mock.Mock()
+    tosec.scanDirectory.side_effect = lambda params: [print("line" * 1000) for _ in range(100)]
+    server, client = socket.socketpair()
+    with server:
+        client.sendall((json.dumps({"cwd": tmp_path.as_posix(), "args": ["dest"]}) + "\n").encode("utf-8"))
+        client.close()
+        runJob(tosec, server, createJobParser())
+
+    tosec.scanDirectory.assert_called_once()
+
+def test_serveContinuesAfterConnectionError(tmp_path):
+    """
+    Test the server accepts the next job if a connection failed"""
+
+    socketPath = tmp_path / "tosec.sock"
+    connections = [(mock.MagicMock(), None), (mock.MagicMock(), None), KeyboardInterrupt()]
+
+    with mock.patch.object(socket.socket, "accept", side_effect=connections):
+        with mock.patch("tosecserver.runJob", side_effect=[BrokenPipeError(), None]) as mockRunJob:
+            serve(mock.Mock(), socketPath, createJobParser())
+
+    assert mockRunJob.call_count == 2
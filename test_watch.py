@@ -0,0 +1,46 @@
+#!/usr/bin/python
+
+import pytest
+from watch import DirectoryWatcher
+
+def test_watchReportsWrittenFile(tmp_path):
+    """
+    Test a written file is reported once after it settled"""
+
+    with DirectoryWatcher(tmp_path, False, 0.1) as watcher:
+        changes = watcher.changes()
+        (tmp_path / "new.bin").write_bytes(b"partial")
+        with open(tmp_path / "new.bin", "ab") as file:
+            file.write(b"complete")
+
+        assert next(changes) == [tmp_path / "new.bin"]
+
+def test_watchRecursiveReportsFilesOfNewDirectory(tmp_path):
+    """
+    Test the files of a created subdirectory are reported once and the subdirectory
+    is watched if recursive is set"""
+
+    with DirectoryWatcher(tmp_path, True, 0.1) as watcher:
+        changes = watcher.changes()
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "first.bin").write_bytes(b"first")
+
+        assert next(changes) == [tmp_path / "sub" / "first.bin"]
+
+        (tmp_path / "sub" / "second.bin").write_bytes(b"second")
+        assert next(changes) == [tmp_path / "sub" / "second.bin"]
+
+def test_watchRecursiveListsMovedDirectory(tmp_path):
+    """
+    Test the files of a directory moved into the watched directory are reported"""
+
+    watched = tmp_path / "watched"
+    watched.mkdir()
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "old.bin").write_bytes(b"old")
+
+    with DirectoryWatcher(watched, True, 0.1) as watcher:
+        changes = watcher.changes()
+        (tmp_path / "sub").rename(watched / "sub")
+
+        assert next(changes) == [watched / "sub" / "old.bin"]
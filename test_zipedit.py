@@ -0,0 +1,161 @@
+#!/usr/bin/python
+
+import io
+import pytest
+import struct
+import warnings
+import zipfile
+from unittest import mock
+from zipedit import removeZipEntries
+
+def createZip(tmp_path):
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zipFile:
+        zipFile.writestr("first.txt", b"first" * 1000)
+        zipFile.writestr("dir/", b"")
+        zipFile.writestr("dir/second.txt", b"second" * 1000)
+        zipFile.writestr("third.txt", b"third" * 1000)
+    return archive
+
+def headerOffsets(archive, *names: str) -> set:
+    with zipfile.ZipFile(archive) as zipFile:
+        return {info.header_offset for info in zipFile.infolist() if info.filename in names}
+
+def test_removeZipEntries(tmp_path):
+    """
+    Test removeZipEntries keeps all other entries unchanged"""
+
+    archive = createZip(tmp_path)
+    with zipfile.ZipFile(archive) as zipFile:
+        before = {info.filename: info.compress_size for info in zipFile.infolist()}
+
+    removeZipEntries(archive, headerOffsets(archive, "first.txt"))
+
+    with zipfile.ZipFile(archive) as zipFile:
+        assert zipFile.testzip() is None
+        assert zipFile.namelist() == ["dir/", "dir/second.txt", "third.txt"]
+        assert zipFile.read("dir/second.txt") == b"second" * 1000
+        assert zipFile.read("third.txt") == b"third" * 1000
+        assert all(info.compress_size == before[info.filename] for info in zipFile.infolist())
+    assert [file.name for file in tmp_path.iterdir()] == ["archive.zip"]
+
+def test_removeZipEntriesAll(tmp_path):
+    """
+    Test removeZipEntries deletes the archive if no file entry is left"""
+
+    archive = createZip(tmp_path)
+
+    removeZipEntries(archive, headerOffsets(archive, "first.txt", "dir/second.txt", "third.txt"))
+
+    assert not archive.exists()
+
+def test_removeZipEntriesDuplicateName(tmp_path):
+    """
+    Test removeZipEntries only removes the given entry of several entries with the same name"""
+
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w") as zipFile, warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        zipFile.writestr("same.txt", b"first")
+        zipFile.writestr("same.txt", b"second")
+        zipFile.writestr("other.txt", b"other")
+    with zipfile.ZipFile(archive) as zipFile:
+        first = zipFile.infolist()[0]
+
+    removeZipEntries(archive, {first.header_offset})
+
+    with zipfile.ZipFile(archive) as zipFile:
+        assert zipFile.namelist() == ["same.txt", "other.txt"]
+        assert zipFile.read("same.txt") == b"second"
+
+def test_removeZipEntriesZip64(tmp_path):
+    """
+    Test removeZipEntries keeps a ZIP64 entry readable"""
+
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zipFile:
+        with zipFile.open("big.txt", "w", force_zip64=True) as entry:
+            entry.write(b"big" * 1000)
+        zipFile.writestr("first.txt", b"first")
+
+    removeZipEntries(archive, headerOffsets(archive, "first.txt"))
+
+    with zipfile.ZipFile(archive) as zipFile:
+        assert zipFile.testzip() is None
+        assert zipFile.read("big.txt") == b"big" * 1000
+
+class UnseekableFile(io.RawIOBase):
+    def __init__(self, file):
+        self.file = file
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.file.write(data)
+
+def test_removeZipEntriesDataDescriptor(tmp_path):
+    """
+    Test removeZipEntries with an archive written as stream with data descriptors"""
+
+    archive = tmp_path / "archive.zip"
+    with open(archive, "wb") as file:
+        with zipfile.ZipFile(UnseekableFile(file), "w", zipfile.ZIP_DEFLATED) as zipFile:
+            zipFile.writestr("first.txt", b"first" * 1000)
+            zipFile.writestr("second.txt", b"second" * 1000)
+    with zipfile.ZipFile(archive) as zipFile:
+        assert all(info.flag_bits & 0x08 for info in zipFile.infolist())
+
+    removeZipEntries(archive, headerOffsets(archive, "first.txt"))
+
+    with zipfile.ZipFile(archive) as zipFile:
+        assert zipFile.testzip() is None
+        assert zipFile.namelist() == ["second.txt"]
+        assert zipFile.read("second.txt") == b"second" * 1000
+
+def patchEntryHeaders(archive, name: str, flagBits: int, compressType: int):
+    """
+    Change flag bits and compression method of an entry in its local header and the central directory"""
+
+    with zipfile.ZipFile(archive) as zipFile:
+        info = zipFile.getinfo(name)
+        centralOffset = zipFile.start_dir + sum(46 + len(other.orig_filename.encode()) + len(other.extra)
+            + len(other.comment) for other in zipFile.infolist()[:zipFile.infolist().index(info)])
+    data = bytearray(archive.read_bytes())
+    struct.pack_into("<HH", data, info.header_offset + 6, flagBits, compressType)
+    struct.pack_into("<HH", data, centralOffset + 8, flagBits, compressType)
+    archive.write_bytes(bytes(data))
+
+def test_removeZipEntriesKeepsRawEntries(tmp_path):
+    """
+    Test removeZipEntries copies kept entries byte for byte, even encrypted entries
+    and entries with a compression method zipfile can't decompress"""
+
+    archive = createZip(tmp_path)
+    patchEntryHeaders(archive, "third.txt", 0x1, 9)
+    with zipfile.ZipFile(archive) as zipFile:
+        info = zipFile.getinfo("third.txt")
+        third = archive.read_bytes()[info.header_offset:zipFile.start_dir]
+
+    removeZipEntries(archive, headerOffsets(archive, "first.txt"))
+
+    with zipfile.ZipFile(archive) as zipFile:
+        info = zipFile.getinfo("third.txt")
+        assert zipFile.namelist() == ["dir/", "dir/second.txt", "third.txt"]
+        assert (info.flag_bits, info.compress_type) == (0x1, 9)
+        assert archive.read_bytes()[info.header_offset:zipFile.start_dir] == third
+        assert zipFile.read("dir/second.txt") == b"second" * 1000
+
+def test_removeZipEntriesErrorKeepsArchive(tmp_path):
+    """
+    Test the archive is unchanged and no temporary file is left if the rewrite fails"""
+
+    archive = createZip(tmp_path)
+    before = archive.read_bytes()
+
+    with mock.patch("zipedit.writeCentralDirectory", side_effect=OSError("disk full")):
+        with pytest.raises(OSError):
+            removeZipEntries(archive, headerOffsets(archive, "first.txt"))
+
+    assert archive.read_bytes() == before
+    assert [file.name for file in tmp_path.iterdir()] == ["archive.zip"]
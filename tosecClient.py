@@ -0,0 +1,30 @@
+#!/usr/bin/python
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+def main(argv: list[str] = None):
+    parser = argparse.ArgumentParser(description="send a scan job to a running 'tosecMover.py --serve SOCKET'")
+    parser.add_argument("socket", help="unix socket of the server")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments of the job like for tosecMover.py without the TOSEC path")
+    args = parser.parse_args(argv)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(args.socket)
+        request = json.dumps({"cwd": os.getcwd(), "args": args.args}) + "\n"
+        connection.sendall(request.encode("utf-8"))
+        with connection.makefile("r", encoding="utf-8") as reader:
+            for line in reader:
+                message = json.loads(line)
+                if "exit" in message:
+                    sys.exit(message["exit"])
+                sys.stdout.write(message["output"])
+                sys.stdout.flush()
+    print("connection to the server was closed before the job finished", file=sys.stderr)
+    sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,165 +1,305 @@
 #!/usr/bin/python
 
 from pathlib import Path
+from scanoptions import ScanOptions
 from color import cDim
+from destindex import DestinationIndex
+from diagreport import REPORT_FORMATS, DiagReport, createDiagReport
+from hashcache import HashCache
+from havedb import HaveDatabase
+from journal import MoveJournal
+from moveplan import MovePlan, PlannedOperations, applyPlan
+from operations import FileOperations
 from strategydiag import StrategyDiag
+from rebuild import rebuildDestination
+from strategyaudit import StrategyAudit
+from strategyhave import StrategyHave
 from strategyrename import StrategyRename, Matcher
 from strategyscan import StrategyScan
 from strategyscancompressed import StrategyScanCompressed
-from tosecdat import InvalidTosecFileException, TosecGameEntry, TosecHeader
+from tosecdat import joinRomLists, readTosecFile, readTosecFileRecorded
+from tosecindex import TosecIndex
+from tosecserver import serve
+from watch import DirectoryWatcher
+from concurrent.futures import ProcessPoolExecutor
 import argparse
 import logging
-import xml.etree.ElementTree
+import shlex
 
 class Tosec:
     """
     Tosec scanner. On init read all TOSEC DATs found in the given directory
-    or the single file.
+    or the single file. If useIndex is set the parsed DATs are stored in a
+    compiled index file next to the given path and only changed DATs are parsed again.
     The class will scan the given directores and either rename or diagnosis
-    the result depending on the given arguments."""
+    the result depending on the given arguments. Scans can be repeated, the inventory of
+    every destination directory is kept and only refreshed for the next scan."""
 
-    def __init__(self, tosecDir: str):
+    def __init__(self, tosecDir: str, useIndex: bool = False, jobs: int = 1):
         logging.debug("Init TOSEC DAT path %s", cDim(tosecDir))
+        self.__destIndexes = {}
         tosecPath = Path(tosecDir).resolve()
         if not tosecPath.exists():
             logging.error("TOSEC DAT path %s does not exists", cDim(tosecPath))
             return
+        index = None
+        if useIndex:
+            index = TosecIndex(tosecPath.with_name(tosecPath.name + ".index"))
         if not tosecPath.is_dir():
-            romList = self.__readTosecFile(tosecPath)
+            tosecFiles = [tosecPath]
         else:
-            romList = {}
-            for tosecEntry in tosecPath.iterdir():
-                if not tosecEntry.is_dir():
-                    newRomList = self.__readTosecFile(tosecEntry)
-                    self.__joinRomLists(romList, newRomList)
+            tosecFiles = [tosecEntry for tosecEntry in tosecPath.iterdir() if not tosecEntry.is_dir()]
+        fileRomLists = [index.load(tosecFile) if index is not None else None for tosecFile in tosecFiles]
+        parsedRomLists = self.__readTosecFiles(
+            [tosecFile for tosecFile, fileRomList in zip(tosecFiles, fileRomLists) if fileRomList is None], jobs)
+        romList = {}
+        for tosecFile, fileRomList in zip(tosecFiles, fileRomLists):
+            if fileRomList is None:
+                fileRomList = next(parsedRomLists)
+                if index is not None:
+                    index.store(tosecFile, fileRomList)
+            joinRomLists(romList, fileRomList)
+        if index is not None:
+            index.save()
         self.__matcher = Matcher(romList)
 
-    def __readTosecFile(self, tosecFile: Path) -> dict:
+    def __readTosecFiles(self, tosecFiles: list[Path], jobs: int):
         """
-        Reads a single TOSEC DAT file. Returns a dictonary of all ROM entries
-        of the DAT file. If a ROM is found several times in the DAT the complete
-        game entry is skipped."""
+        Parse the given TOSEC DAT files. If jobs is greater than one the files are parsed
+        by a pool of worker processes. The ROM lists are always returned in the order of the
+        given files, so they are joined in the same order as a serial load. The log records
+        of a worker are emitted when its ROM list is returned, so the log is the same as well."""
 
-        fileRomList = {}
+        if jobs <= 1 or len(tosecFiles) <= 1:
+            return map(readTosecFile, tosecFiles)
+        level = logging.getLogger().getEffectiveLevel()
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tosecFiles))) as executor:
+            results = list(executor.map(readTosecFileRecorded, tosecFiles, [level] * len(tosecFiles)))
+        return self.__emitRecorded(results)
+
+    def __emitRecorded(self, results: list):
+        for fileRomList, records in results:
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            yield fileRomList
+
+    def __destinationIndex(self, destPath: Path, indexFile: str) -> DestinationIndex:
+        destIndex = self.__destIndexes.get(destPath)
+        if destIndex is None:
+            destIndex = DestinationIndex(destPath, Path(indexFile) if indexFile is not None else None)
+            self.__destIndexes[destPath] = destIndex
+        else:
+            destIndex.refresh()
+        return destIndex
+
+    def scanDirectory(self, options: ScanOptions):
+        """
+        Run a single scan with the given options. Can be called several times with the loaded DATs."""
+
+        if options.resume and options.journal is None:
+            logging.error("a scan can only be resumed with a journal")
+            return
+        if options.plan is not None and (options.source is None or options.journal is not None):
+            logging.error("a plan can only be created for a source and without journal")
+            return
+        if options.rebuild and (options.source is not None or options.haveDb is None):
+            logging.error("a rebuild is only done for the destination with a have database")
+            return
+        if options.fastAudit and (options.source is not None or options.scanCompressed):
+            logging.error("a fast audit is only done for the destination without compressed files")
+            return
+        hashCache = None
+        journal = None
+        haveDb = None
+        report = None
         try:
-            root = xml.etree.ElementTree.parse(tosecFile.as_posix()).getroot()
-            gameList = []
-            header = TosecHeader(root)
-            for game in root.findall("game"):
+            if options.hashCache is not None:
+                hashCache = HashCache(Path(options.hashCache))
+            if options.journal is not None:
                 try:
-                    entry = TosecGameEntry(game, header)
-                    gameRomList = self.__createGameEntryRomList(entry, fileRomList)
-                    gameList.append(entry)
-                    self.__joinRomLists(fileRomList, gameRomList)
-                except InvalidTosecFileException as exception:
-                    logging.warning("TOSEC DAT file %s parser error. Entry skipped because: %s",
-                        cDim(tosecFile.as_posix()), exception)
-            logging.info("TOSEC DAT file %s loaded %s entries with %s roms",
-                cDim(tosecFile.as_posix()), len(gameList), len(fileRomList))
-            header.games = gameList
-            header.roms = fileRomList
-        except (InvalidTosecFileException, xml.etree.ElementTree.ParseError) as exception:
-            logging.warning("TOSEC DAT file %s parser error. File skipped because: %s",
-                cDim(tosecFile.as_posix()), exception)
-        return fileRomList
-
-    def __createGameEntryRomList(self, entry: TosecGameEntry, romList: dict) -> dict:
-        """
-        Reads a single TOSEC DAT game entry ROM files.
-        It will check the given SHA1 dictonary if any ROM file is already
-        in the database. Will throw an exception if all ROMs of at least another game entries is identical
-        Otherwise a dict of sha1 ROMs is returned."""
-
-        dups = {}
-        gameRomList = {}
-        for rom in entry.roms:
-            if rom.sha1 in romList:
-                for gameEntry in romList[rom.sha1]:
-                    game = gameEntry.game
-                    dups[game] = dups.get(game, 0) + 1
-            gameRomList[rom.sha1] = [rom]
-
-        if len(dups) > 0:
-            for game, duplicateRoms in dict(dups).items():
-                if len(game.roms) != duplicateRoms or duplicateRoms != len(gameRomList):
-                    dups.pop(game)
-            if len(dups) > 0:
-                sha1s = ', '.join(str(rom.sha1) for rom in entry.roms)
-                games = ', '.join(str(dup.name) for dup in dups.keys())
-                logging.debug("All Game ROMs %s of with sha1 %s were already added in other game %s",
-                    cDim(entry.name), cDim(sha1s), cDim(games))
-                raise InvalidTosecFileException(f"All Game ROMs {cDim(entry.name)} were already added in other game {cDim(games)}")
-        return gameRomList
-
-    def __joinRomLists(self, romList: dict, concatList: dict):
-        """
-        Joins two dictonaries together by adding entres for concatList into romList.
-        Will skip all files with matching sha1, but different values for md5, size or crc
-        If a ROM sha1 occurs in several roms entries the returned rom list will contain all."""
-
-        for entryKey, rom in concatList.items():
-            rom0 = rom[0]
-            if entryKey in romList:
-                existingEntry = romList[entryKey][0]
-                logging.info("TOSEC file %s with same sha1 %s and matching {md5=%s size=%s} already found in other TOSEC file %s",
-                    cDim(existingEntry.game.header.name + "/" + existingEntry.name),
-                    cDim(entryKey),
-                    existingEntry.md5 == rom0.md5,
-                    existingEntry.size == rom0.size,
-                    cDim(rom0.game.header.name + "/" + rom0.name))
-                if existingEntry.md5 == rom0.md5 and existingEntry.size == rom0.size and existingEntry.crc == rom0.crc:
-                    romList[entryKey].extend(rom)
+                    journal = MoveJournal(Path(options.journal), options.resume)
+                except FileExistsError as error:
+                    logging.error("journal %s of an earlier scan exists. Continue it with --resume or delete it",
+                        cDim(error.filename))
+                    return
+            if options.haveDb is not None:
+                haveDb = HaveDatabase(Path(options.haveDb))
+            if options.report is not None:
+                report = createDiagReport(Path(options.report), options.reportFormat)
+            if options.rebuild:
+                rebuildDestination(Path(options.dest).resolve(), self.__matcher, haveDb, FileOperations(journal))
             else:
-                romList[entryKey] = rom
+                self.__scanDirectory(options, hashCache, journal, haveDb, report)
+        finally:
+            if hashCache is not None:
+                hashCache.close()
+            if journal is not None:
+                journal.close()
+            if haveDb is not None:
+                haveDb.close()
+            if report is not None:
+                report.close()
 
-    def scanDirectory(self, params: argparse.Namespace):
-        if params.source is not None:
-            scanPath = Path(params.source).resolve()
-            destPath = Path(params.dest).resolve()
+    def __scanDirectory(self, options: ScanOptions, hashCache: HashCache, journal: MoveJournal,
+            haveDb: HaveDatabase, report: DiagReport):
+        destIndex = None
+        plan = None
+        if options.source is not None:
+            scanPath = Path(options.source).resolve()
+            destPath = Path(options.dest).resolve()
             if not destPath.exists():
-                logging.error("destination directory %s does not exists", cDim(params.dest))
+                logging.error("destination directory %s does not exists", cDim(options.dest))
                 return
             if not destPath.is_dir():
-                logging.error("destination %s is not a directory", cDim(params.destDir))
+                logging.error("destination %s is not a directory", cDim(options.dest))
                 return
-            strategy = StrategyRename(destPath, self.__matcher, params.delDupes, params.noWritePermission)
-            if params.diag:
-                strategy = strategy.doChain(StrategyDiag(params.noMissing, params.noHaving))
+            if options.plan is not None:
+                # the planned changes must not be kept for other scans
+                plan = MovePlan()
+                operations = PlannedOperations(plan)
+                destIndex = DestinationIndex(destPath, Path(options.destIndex) if options.destIndex is not None else None)
+            else:
+                operations = FileOperations(journal)
+                destIndex = self.__destinationIndex(destPath, options.destIndex)
+            strategy = StrategyRename(destPath, self.__matcher, options.delDupes, options.noWritePermission,
+                hashCache, destIndex, operations)
+            if haveDb is not None and plan is None:
+                strategy = strategy.doChain(StrategyHave(haveDb, destPath))
+            if options.diag or report is not None:
+                strategy = strategy.doChain(StrategyDiag(options.noMissing, options.noHaving, report))
         else:
-            scanPath = Path(params.dest).resolve()
-            strategy = StrategyDiag(params.noMissing, params.noHaving)
-        if params.scanCompressed:
-            strategy = strategy.doChain(StrategyScanCompressed(self.__matcher))
+            scanPath = Path(options.dest).resolve()
+            strategy = StrategyDiag(options.noMissing, options.noHaving, report)
+            if haveDb is not None:
+                strategy = StrategyHave(haveDb, scanPath).doChain(strategy)
+        if options.fastAudit:
+            strategy = strategy.doChain(StrategyAudit(scanPath, self.__matcher, options.jobs, hashCache,
+                options.stagedHash, options.recursive, options.auditSample))
+        elif options.scanCompressed:
+            strategy = strategy.doChain(StrategyScanCompressed(self.__matcher, options.jobs, hashCache,
+                options.stagedHash, options.recursive, destPath if options.source is not None and plan is None else None,
+                options.nestedDepth, journal))
         else:
-            strategy = strategy.doChain(StrategyScan(self.__matcher))
+            strategy = strategy.doChain(StrategyScan(self.__matcher, options.jobs, hashCache, options.stagedHash,
+                options.recursive, journal))
         if not scanPath.exists():
             logging.error("directory %s to scan does not exsits", cDim(scanPath.as_posix()))
             return
         try:
-            scanPaths = [scanPath]
-            while True:
-                startPaths = scanPaths
-                scanPaths = strategy.doStrategyScan(scanPaths)
-                if not params.recursive or len(scanPaths) <= 0 or startPaths == scanPaths:
-                    break
+            strategy.doStrategyScan([scanPath])
+            if options.watch:
+                self.__watch(strategy, scanPath, options.recursive)
         finally:
             strategy.doFinal()
+            if plan is not None:
+                plan.save(Path(options.plan))
+            elif destIndex is not None:
+                destIndex.save()
+
+    def __watch(self, strategy, scanPath: Path, recursive: bool):
+        if not scanPath.is_dir():
+            logging.error("only directories can be watched %s", cDim(scanPath.as_posix()))
+            return
+        with DirectoryWatcher(scanPath, recursive) as watcher:
+            try:
+                for paths in watcher.changes():
+                    logging.info("scan new files %s", cDim(", ".join(path.as_posix() for path in paths)))
+                    strategy.doStrategyScan(paths)
+            except KeyboardInterrupt:
+                logging.warning("watching %s stopped", cDim(scanPath.as_posix()))
+
+def addJobArguments(parser: argparse.ArgumentParser, optionalDest: bool = False):
+    """
+    Add the arguments of a single scan to the parser. They are used on the command line
+    and for every job sent to a server."""
+
+    parser.add_argument("--hashCache", help="file to store hashes of scaned files. Unchanged files are not read again on the next run")
+    parser.add_argument("--destIndex", help="file to store the inventory of the destination directory. Only changed directories are listed again on the next run")
+    parser.add_argument("--journal", help="file to record every scaned file and every move, softlink and delete. Used by --resume to continue an interrupted scan")
+    parser.add_argument("--resume", action="store_true", help="continue the scan recorded in the journal. Unfinished operations are finished or rolled back and scaned files are skipped")
+    parser.add_argument("--plan", help="file to write the moves, softlinks and deletes of the scan to, without changing any file. The plan is executed by --apply")
+    parser.add_argument("--haveDb", help="file to store the SHA1 of every ROM file found or moved in the destination directory. Used by --rebuild")
+    parser.add_argument("--rebuild", action="store_true", help="move and softlink the files stored in the have database to the paths of the loaded TOSEC DATs without reading them. Files not in any DAT anymore are reported")
+    parser.add_argument("--jobs", type=int, default=1, help="number of threads used to hash files and ZIP entries and processes used to parse TOSEC DATs. Matching and moving is still done in order by a single thread")
+    parser.add_argument("--stagedHash", action="store_true", help="calculate MD5 and SHA1 only for files with a CRC and size of any ROM. Matching files are read twice if they are bigger than 16MB")
+    parser.add_argument("--loglevel", choices=["error", "warning", "info", "debug"], default="warning", help="Loglevel for the programm. debug - very verbose. error - only important messages")
+    parser.add_argument("--delDupes", action="store_true", help="Delete duplicates found in source directory")
+    parser.add_argument("--diag", action="store_true", help="Also print diagnostic information when scanning source directory. This is always enabled if source is not given")
+    parser.add_argument("--noHaving", action="store_true", help="If in diagnostic mode don't print 'Having' files")
+    parser.add_argument("--noMissing", action="store_true", help="If in diagnostic mode don't print 'Missing' files")
+    parser.add_argument("--report", help="file to write the diagnosis to while scanning instead of printing it. Only a summary is printed. Implies --diag")
+    parser.add_argument("--reportFormat", choices=REPORT_FORMATS.keys(), default="jsonl", help="format of the diag report: JSON Lines or CSV")
+    parser.add_argument("--noWritePermission", action="store_true", help="remove write permission on a renamed file")
+    parser.add_argument("--fastAudit", action="store_true", help="if no source is given trust files at the expected path of a ROM with the expected size without hashing them. All other files are hashed")
+    parser.add_argument("--auditSample", type=float, default=0, metavar="PERCENT", help="in a fast audit hash this percentage of the trusted files randomly to find damaged files")
+    parser.add_argument("--source", help="source file or directory to scan")
+    parser.add_argument("-r", action="store_true", dest="recursive", help="source directory is scaned recursively")
+    parser.add_argument("-x", action="store_true", dest="scanCompressed", help="compressed files in source directory is scaned. Supported file formats are ZIP, TAR (also compressed), gzip, bzip2 and xz. Moved entries are removed from ZIP archives")
+    parser.add_argument("--nestedDepth", type=int, default=2, help="if compressed files are scaned, containers inside containers are scaned up to this depth. 0 disables scanning nested containers")
+    parser.add_argument("dest", nargs="?" if optionalDest else None, help="destination directory to move found files. If no source is given the directory is scaned without moving")
+
+def createJobParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="tosecClient.py SOCKET")
+    addJobArguments(parser)
+    return parser
+
+def createParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datIndex", action="store_true", help="store parsed TOSEC DATs in a compiled index next to the TOSEC path. Only changed DAT files are parsed again")
+    parser.add_argument("--apply", metavar="PLAN", help="execute a plan written by --plan without loading the TOSEC DATs. Moves are ordered by source device and destination directory")
+    parser.add_argument("--serve", metavar="SOCKET", help="load the TOSEC DATs once and run scan jobs sent by tosecClient.py to this unix socket. dest is given by every job")
+    parser.add_argument("--jobsFile", help="file with one scan job per line, given by the same arguments as on the command line without the TOSEC path. All jobs are run one after another with the DATs loaded once")
+    parser.add_argument("--watch", action="store_true", help="after the scan keep watching the scaned directory with inotify and scan new files once they are completely written. Stopped by Ctrl-C")
+    parser.add_argument("tosec", nargs="?", help="filename of TOSEC DAT file or directory to process")
+    addJobArguments(parser, True)
+    return parser
+
+def runJobsFile(tosec: Tosec, jobsFile: Path, jobParser: argparse.ArgumentParser):
+    """
+    Run every job of a jobs file. A line holds the arguments of a job quoted like in a shell.
+    Empty lines and lines starting with # are skipped. A job with invalid arguments is reported
+    and the next job is run."""
+
+    with open(jobsFile, encoding="utf-8") as file:
+        for lineNumber, line in enumerate(file, 1):
+            if len(line.strip()) == 0 or line.lstrip().startswith("#"):
+                continue
+            try:
+                params = jobParser.parse_args(shlex.split(line))
+            except (ValueError, SystemExit):
+                logging.error("job in line %s of %s is invalid and skipped", lineNumber, cDim(jobsFile.as_posix()))
+                continue
+            logging.info("run job in line %s: %s", lineNumber, cDim(line.strip()))
+            tosec.scanDirectory(ScanOptions.fromNamespace(params))
+
+def main(argv: list[str] = None):
+    parser = createParser()
+    args = parser.parse_args(argv)
+    if args.apply is not None:
+        logging.basicConfig(level=args.loglevel.upper())
+        try:
+            journal = MoveJournal(Path(args.journal), args.resume) if args.journal is not None else None
+        except FileExistsError as error:
+            parser.error(f"journal {error.filename} of an earlier scan exists. Continue it with --resume or delete it")
+        try:
+            applyPlan(Path(args.apply), FileOperations(journal), journal)
+        finally:
+            if journal is not None:
+                journal.close()
+        return
+    if args.tosec is None:
+        parser.error("the following arguments are required: tosec")
+    if args.serve is None and args.jobsFile is None and args.dest is None:
+        parser.error("the following arguments are required: dest")
+
+    logging.basicConfig(level=args.loglevel.upper())
+    t = Tosec(args.tosec, args.datIndex, args.jobs)
+    if args.serve is not None:
+        serve(t, Path(args.serve), createJobParser())
+    elif args.jobsFile is not None:
+        runJobsFile(t, Path(args.jobsFile), createJobParser())
+    else:
+        t.scanDirectory(ScanOptions.fromNamespace(args))
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--loglevel", choices=["error", "warning", "info", "debug"], default="warning", help="Loglevel for the programm. debug - very verbose. error - only important messages")
-parser.add_argument("--delDupes", action="store_true", help="Delete duplicates found in source directory")
-parser.add_argument("--diag", action="store_true", help="Also print diagnostic information when scanning source directory. This is always enabled if source is not given")
-parser.add_argument("--noHaving", action="store_true", help="If in diagnostic mode don't print 'Having' files")
-parser.add_argument("--noMissing", action="store_true", help="If in diagnostic mode don't print 'Missing' files")
-parser.add_argument("--noWritePermission", action="store_true", help="remove write permission on a renamed file")
-parser.add_argument("tosec", help="filename of TOSEC DAT file or directory to process")
-parser.add_argument("--source", help="source file or directory to scan")
-parser.add_argument("-r", action="store_true", dest="recursive", help="source directory is scaned recursively")
-parser.add_argument("-x", action="store_true", dest="scanCompressed", help="compressed files in source directory is scaned. Supported file formats is ZIP. **Experimental** file is only extracted but not moved")
-parser.add_argument("dest", help="destination directory to move found files. If no source is given the directory is scaned without moving")
-
-args = parser.parse_args()
-
-logging.basicConfig(level=args.loglevel.upper())
-t = Tosec(args.tosec)
-t.scanDirectory(args)
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from color import cDim
 from pathlib import Path
 from scanfile import ScanFile
 import logging
+import sys
 import xml.etree.ElementTree
 
 class InvalidTosecFileException(Exception):
@@ -16,6 +17,8 @@ class TosecHeader:
     On init the given XML tree is scaned for header and header/name.
     If XML elements aren't found an exception is raised """
 
+    __slots__ = ("games", "roms", "name", "system", "category")
+
     def __init__(self, root: xml.etree.ElementTree.Element):
         header = root.find("header")
         if header is None:
@@ -27,31 +30,59 @@ class TosecHeader:
         self.roms = {}
         self.name = name.text
         splitName = self.name.split(" - ", 1)
-        self.system = splitName[0]
-        self.category = splitName[1] if len(splitName) > 1 else None
+        self.system = sys.intern(splitName[0])
+        self.category = sys.intern(splitName[1]) if len(splitName) > 1 else None
 
 class TosecGameRom:
     """
     TOSEC DAT ROM entry.
-    On init the XML element is parsed. """
+    On init the XML element is parsed. To keep all ROMs of a TOSEC collection
+    in memory the size is stored as int and the hashes in binary form.
+    The hashes are available as hex strings by sha1, md5 and crc."""
+
+    __slots__ = ("game", "name", "size", "md5Digest", "sha1Digest", "crcValue")
 
     def __init__(self, romEntry: xml.etree.ElementTree.Element, game): # game: TosecGameEntry
         self.game = game
         self.name = romEntry.get("name")
         if self.name is None:
             raise InvalidTosecFileException("no {} found for ROM {}".format(cDim("datafile/game/rom{name}"), cDim(self.name)))
-        self.size = romEntry.get("size")
-        if self.size is None:
-            raise InvalidTosecFileException("no {} found for ROM {}".format(cDim("datafile/game/rom{size}"), cDim(self.name)))
-        self.md5 = romEntry.get("md5")
-        if self.md5 is None:
-            raise InvalidTosecFileException("no {} found for ROM {}".format(cDim("datafile/game/rom{md5}"), cDim(self.name)))
-        self.crc = romEntry.get("crc")
-        if self.crc is None:
-            raise InvalidTosecFileException("no {} found for ROM {}".format(cDim("datafile/game/rom{crc}"), cDim(self.name)))
-        self.sha1 = romEntry.get("sha1")
-        if self.sha1 is None:
-            raise InvalidTosecFileException("no {} found for ROM {}".format(cDim("datafile/game/rom{sha1}"), cDim(self.name)))
+        size = self.__getAttribute(romEntry, "size")
+        if not size.isdigit():
+            raise InvalidTosecFileException("invalid {} {} for ROM {}".format(cDim("datafile/game/rom{size}"), cDim(size), cDim(self.name)))
+        self.size = int(size)
+        self.md5Digest = self.__getDigest(romEntry, "md5")
+        crc = self.__getAttribute(romEntry, "crc")
+        try:
+            self.crcValue = int(crc, 16)
+        except ValueError as error:
+            raise InvalidTosecFileException("invalid {} {} for ROM {}".format(cDim("datafile/game/rom{crc}"), cDim(crc), cDim(self.name))) from error
+        self.sha1Digest = self.__getDigest(romEntry, "sha1")
+
+    def __getAttribute(self, romEntry: xml.etree.ElementTree.Element, attribute: str) -> str:
+        value = romEntry.get(attribute)
+        if value is None:
+            raise InvalidTosecFileException("no {} found for ROM {}".format(cDim(f"datafile/game/rom{{{attribute}}}"), cDim(self.name)))
+        return value
+
+    def __getDigest(self, romEntry: xml.etree.ElementTree.Element, attribute: str) -> bytes:
+        value = self.__getAttribute(romEntry, attribute)
+        try:
+            return bytes.fromhex(value)
+        except ValueError as error:
+            raise InvalidTosecFileException("invalid {} {} for ROM {}".format(cDim(f"datafile/game/rom{{{attribute}}}"), cDim(value), cDim(self.name))) from error
+
+    @property
+    def sha1(self) -> str:
+        return self.sha1Digest.hex()
+
+    @property
+    def md5(self) -> str:
+        return self.md5Digest.hex()
+
+    @property
+    def crc(self) -> str:
+        return format(self.crcValue, "0>8x")
 
     def isMatching(self, scanFile: ScanFile) -> bool:
         """
@@ -61,7 +92,7 @@ class TosecGameRom:
         @return
             true if all criteria match, false otherwise"""
 
-        return scanFile is not None and self.md5 == scanFile.md5 and self.crc == scanFile.crc and self.size == str(scanFile.size)
+        return scanFile is not None and self.md5 == scanFile.md5 and self.crc == scanFile.crc and self.size == scanFile.size
 
     def getFileName(self, basePath: Path) -> Path:
         """
@@ -84,6 +115,7 @@ class TosecGameEntry:
     but can have unlimited ROM files.
     If XML structure doesn't fit a game entry an exception is raised"""
 
+    __slots__ = ("header", "name", "roms")
 
     def __init__(self, gameEntry: xml.etree.ElementTree.Element, header: TosecHeader):
         self.header = header
@@ -114,5 +146,167 @@ class TosecGameEntry:
         if self.header.category is not None:
             path /= self.header.category
         if len(self.roms) > 1:
-            return path / self.fileName
+            return path / self.name
         return path
+
+def readTosecFile(tosecFile: Path) -> dict:
+    """
+    Reads a single TOSEC DAT file. Returns a dictonary of binary sha1 to all ROM entries
+    of the DAT file. If a ROM is found several times in the DAT the complete
+    game entry is skipped.
+    The file is parsed as a stream. Every game element is dropped after the
+    game entry was created, so the XML tree is never completely in memory.
+    Game elements ahead of the header are kept until the header is parsed.
+    Malformed XML is reported as InvalidTosecFileException like a missing header
+    and the complete file is skipped, even if games were parsed before the error."""
+
+    fileRomList = {}
+    try:
+        gameList = []
+        pendingGames = []
+        header = None
+        root = None
+        depth = 0
+        for event, element in parseElements(tosecFile):
+            if event == "start":
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            if element.tag == "header":
+                header = TosecHeader(root)
+                for game in pendingGames:
+                    readGameEntry(tosecFile, game, header, gameList, fileRomList)
+                    game.clear()
+                pendingGames = []
+            elif element.tag == "game":
+                if header is None:
+                    pendingGames.append(element)
+                    root.remove(element)
+                    continue
+                readGameEntry(tosecFile, element, header, gameList, fileRomList)
+            root.remove(element)
+            element.clear()
+        if header is None:
+            raise InvalidTosecFileException("no datafile/header found")
+        logging.info("TOSEC DAT file %s loaded %s entries with %s roms",
+            cDim(tosecFile.as_posix()), len(gameList), len(fileRomList))
+        header.games = gameList
+        header.roms = fileRomList
+    except InvalidTosecFileException as exception:
+        logging.warning("TOSEC DAT file %s parser error. File skipped because: %s",
+            cDim(tosecFile.as_posix()), exception)
+        return {}
+    return fileRomList
+
+def readGameEntry(tosecFile: Path, element, header: TosecHeader, gameList: list, fileRomList: dict):
+    """
+    Create the game entry of a game element and add it with its ROM entries.
+    An invalid game entry is skipped."""
+
+    try:
+        entry = TosecGameEntry(element, header)
+        gameRomList = createGameEntryRomList(entry, fileRomList)
+        gameList.append(entry)
+        joinRomLists(fileRomList, gameRomList)
+    except InvalidTosecFileException as exception:
+        logging.warning("TOSEC DAT file %s parser error. Entry skipped because: %s",
+            cDim(tosecFile.as_posix()), exception)
+
+def parseElements(tosecFile: Path):
+    """
+    Iterate over the start and end events of the XML elements of the DAT file.
+    A parse error is raised as InvalidTosecFileException"""
+
+    try:
+        yield from xml.etree.ElementTree.iterparse(tosecFile.as_posix(), ("start", "end"))
+    except xml.etree.ElementTree.ParseError as error:
+        raise InvalidTosecFileException(f"invalid XML {error}") from error
+
+class RecordingHandler(logging.Handler):
+    """
+    Logging handler keeping the formatted records, so they can be sent to another process"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord):
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+def readTosecFileRecorded(tosecFile: Path, level: int) -> tuple:
+    """
+    Reads a single TOSEC DAT file like readTosecFile in a worker process. The log records
+    are not written but returned, so the caller can emit them in the order of the files.
+    @param level
+        the log level of the caller
+    @return
+        tuple of the ROM list and the list of log records"""
+
+    rootLogger = logging.getLogger()
+    handlers = rootLogger.handlers
+    oldLevel = rootLogger.level
+    handler = RecordingHandler()
+    rootLogger.handlers = [handler]
+    rootLogger.setLevel(level)
+    try:
+        return readTosecFile(tosecFile), handler.records
+    finally:
+        rootLogger.handlers = handlers
+        rootLogger.setLevel(oldLevel)
+
+def createGameEntryRomList(entry: TosecGameEntry, romList: dict) -> dict:
+    """
+    Reads a single TOSEC DAT game entry ROM files.
+    It will check the given SHA1 dictonary if any ROM file is already
+    in the database. Will throw an exception if all ROMs of at least another game entries is identical
+    Otherwise a dict of binary sha1 to ROMs is returned."""
+
+    dups = {}
+    gameRomList = {}
+    for rom in entry.roms:
+        if rom.sha1Digest in romList:
+            for gameEntry in romList[rom.sha1Digest]:
+                game = gameEntry.game
+                dups[game] = dups.get(game, 0) + 1
+        gameRomList[rom.sha1Digest] = [rom]
+
+    if len(dups) > 0:
+        for game, duplicateRoms in dict(dups).items():
+            if len(game.roms) != duplicateRoms or duplicateRoms != len(gameRomList):
+                dups.pop(game)
+        if len(dups) > 0:
+            sha1s = ', '.join(str(rom.sha1) for rom in entry.roms)
+            games = ', '.join(str(dup.name) for dup in dups.keys())
+            logging.debug("All Game ROMs %s of with sha1 %s were already added in other game %s",
+                cDim(entry.name), cDim(sha1s), cDim(games))
+            raise InvalidTosecFileException(f"All Game ROMs {cDim(entry.name)} were already added in other game {cDim(games)}")
+    return gameRomList
+
+def joinRomLists(romList: dict, concatList: dict):
+    """
+    Joins two dictonaries together by adding entres for concatList into romList.
+    Will skip all files with matching sha1, but different values for md5, size or crc
+    If a ROM sha1 occurs in several roms entries the returned rom list will contain all."""
+
+    for entryKey, rom in concatList.items():
+        rom0 = rom[0]
+        if entryKey in romList:
+            existingEntry = romList[entryKey][0]
+            logging.info("TOSEC file %s with same sha1 %s and matching {md5=%s size=%s} already found in other TOSEC file %s",
+                cDim(existingEntry.game.header.name + "/" + existingEntry.name),
+                cDim(rom0.sha1),
+                existingEntry.md5Digest == rom0.md5Digest,
+                existingEntry.size == rom0.size,
+                cDim(rom0.game.header.name + "/" + rom0.name))
+            if (existingEntry.md5Digest == rom0.md5Digest and existingEntry.size == rom0.size
+                    and existingEntry.crcValue == rom0.crcValue):
+                romList[entryKey].extend(rom)
+        else:
+            romList[entryKey] = rom
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+
+from color import cDim
+from pathlib import Path
+import logging
+import os
+import pickle
+
+class TosecIndex:
+    """
+    Compiled index of parsed TOSEC DAT files stored in a single binary file.
+    For every DAT file the ROM list returned by the parser is stored together
+    with size and modification time of the DAT. An entry is only used as long as
+    the DAT file is unchanged. Entries of DAT files no longer loaded are dropped on save."""
+
+    VERSION = 2
+
+    def __init__(self, indexFile: Path):
+        self.__indexFile = indexFile
+        self.__entries = {}
+        self.__used = {}
+        self.__changed = False
+        if not indexFile.exists():
+            return
+        try:
+            with open(indexFile, "rb") as file:
+                index = pickle.load(file)
+            if index.get("version") == self.VERSION:
+                self.__entries = index["dats"]
+            else:
+                logging.info("TOSEC index %s has an old format and is rebuild", cDim(indexFile.as_posix()))
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as exception:
+            logging.warning("TOSEC index %s can't be read and is rebuild because: %s",
+                cDim(indexFile.as_posix()), exception)
+
+    def load(self, tosecFile: Path) -> dict:
+        """
+        Get the ROM list of a DAT file from the index.
+        @param tosecFile
+            the DAT file
+        @return
+            the stored ROM list or None if the DAT isn't in the index or was changed"""
+
+        stat = tosecFile.stat()
+        entry = self.__entries.get(tosecFile.name)
+        if entry is None or entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+            return None
+        logging.debug("TOSEC DAT file %s loaded from index", cDim(tosecFile.as_posix()))
+        self.__used[tosecFile.name] = entry
+        return entry[2]
+
+    def store(self, tosecFile: Path, romList: dict):
+        """
+        Store the parsed ROM list of a DAT file in the index.
+        @param tosecFile
+            the parsed DAT file
+        @param romList
+            the ROM list returned by the parser"""
+
+        stat = tosecFile.stat()
+        self.__used[tosecFile.name] = (stat.st_mtime_ns, stat.st_size, romList)
+        self.__changed = True
+
+    def save(self):
+        """
+        Write the index file if any DAT file was added, changed or removed."""
+
+        if not self.__changed and self.__used.keys() == self.__entries.keys():
+            return
+        logging.info("write TOSEC index %s", cDim(self.__indexFile.as_posix()))
+        tempFile = self.__indexFile.with_name(self.__indexFile.name + ".tmp")
+        try:
+            with open(tempFile, "wb") as file:
+                pickle.dump({"version": self.VERSION, "dats": self.__used}, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tempFile, self.__indexFile)
+        except OSError as error:
+            logging.warning("TOSEC index %s can't be written because: %s",
+                cDim(self.__indexFile.as_posix()), error)
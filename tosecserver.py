@@ -0,0 +1,138 @@
+#!/usr/bin/python
+
+from color import cDim
+from pathlib import Path
+from scanoptions import ScanOptions
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import socket
+
+def serve(tosec, socketPath: Path, jobParser: argparse.ArgumentParser):
+    """
+    Run scan jobs sent to a unix socket until the process is stopped. The TOSEC DATs
+    and the inventory of the destination directories stay loaded between jobs.
+    Jobs are processed one after another in the order of their connection.
+    @param tosec
+        the loaded Tosec scanner
+    @param socketPath
+        the socket file to create. It can only be used by the owner
+    @param jobParser
+        parser for the arguments of a job"""
+
+    if socketPath.is_socket():
+        socketPath.unlink()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        # the socket is created without permissions for others, so no one else can connect
+        oldUmask = os.umask(0o177)
+        try:
+            server.bind(socketPath.as_posix())
+        finally:
+            os.umask(oldUmask)
+        try:
+            server.listen()
+            logging.warning("waiting for jobs on %s", cDim(socketPath.as_posix()))
+            while True:
+                connection, _ = server.accept()
+                with connection:
+                    try:
+                        runJob(tosec, connection, jobParser)
+                    except OSError as error:
+                        # a client hanging up must not stop the server
+                        logging.warning("connection of job closed: %s", error)
+        except KeyboardInterrupt:
+            logging.warning("server stopped")
+        finally:
+            socketPath.unlink()
+
+class JobOutput(io.TextIOBase):
+    """
+    Text stream sending everything written to it as output message of a job.
+    If the client disconnected the output is dropped, so the job is still finished."""
+
+    def __init__(self, connection: socket.socket):
+        super().__init__()
+        self.__connection = connection
+        self.connected = True
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if len(text) > 0:
+            self.send({"output": text})
+        return len(text)
+
+    def send(self, message: dict):
+        if not self.connected:
+            return
+        try:
+            self.__connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        except OSError:
+            self.connected = False
+
+    def flush(self):
+        pass
+
+class ErrorCounter(logging.Handler):
+    """
+    Logging handler counting the error messages of a job"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.errors = 0
+
+    def emit(self, record: logging.LogRecord):
+        self.errors += 1
+
+def runJob(tosec, connection: socket.socket, jobParser: argparse.ArgumentParser):
+    """
+    Run a single job received from a connection. The job is a JSON line with the
+    arguments and the working directory of the client. Output and log messages of
+    the job are sent back to the client as JSON lines {"output": text}. The last line
+    is {"exit": status} with status 0 if the job succeeded, 2 for invalid arguments
+    and 1 if the job failed or logged an error."""
+
+    with connection.makefile("r", encoding="utf-8") as reader:
+        status = 1
+        output = JobOutput(connection)
+        try:
+            request = json.loads(reader.readline())
+            args = request["args"]
+            jobDir = request["cwd"]
+        except (ValueError, KeyError, TypeError) as error:
+            logging.error("invalid job request: %s", error)
+            output.send({"exit": status})
+            return
+        logging.info("run job %s in %s", cDim(" ".join(args)), cDim(jobDir))
+        rootLogger = logging.getLogger()
+        logLevel = rootLogger.level
+        handler = logging.StreamHandler(output)
+        errorCounter = ErrorCounter()
+        workDir = os.getcwd()
+        rootLogger.addHandler(handler)
+        rootLogger.addHandler(errorCounter)
+        try:
+            os.chdir(jobDir)
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                try:
+                    params = jobParser.parse_args(args)
+                except SystemExit as exit:
+                    status = exit.code
+                    return
+                rootLogger.setLevel(params.loglevel.upper())
+                tosec.scanDirectory(ScanOptions.fromNamespace(params))
+            status = 1 if errorCounter.errors > 0 else 0
+        except Exception:
+            logging.exception("job %s failed", cDim(" ".join(args)))
+        finally:
+            rootLogger.setLevel(logLevel)
+            rootLogger.removeHandler(handler)
+            rootLogger.removeHandler(errorCounter)
+            os.chdir(workDir)
+            output.send({"exit": status})
+            if not output.connected:
+                logging.warning("client of job %s disconnected, the output was dropped", cDim(" ".join(args)))
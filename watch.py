@@ -0,0 +1,133 @@
+#!/usr/bin/python
+
+from color import cDim
+from pathlib import Path
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+EVENT_HEADER = struct.Struct("iIII")
+
+class DirectoryWatcher:
+    """
+    Watch a directory for new files with Linux inotify. A file is reported once it was
+    closed after writing or moved into the directory and no further event for it
+    arrived for settleTime seconds, so partially written files are not scaned.
+    If recursive is set created and moved in subdirectories are watched as well. Their
+    files are reported one by one, either by their own events or, if they were already
+    in the directory when it was added, by listing it once. If the kernel drops events
+    the watched directory itself is reported again."""
+
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+
+    def __init__(self, directory: Path, recursive: bool, settleTime: float = 2.0):
+        self.__directory = directory
+        self.__recursive = recursive
+        self.__settleTime = settleTime
+        self.__libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.__fd = self.__libc.inotify_init1(os.O_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.__watches = {}
+        self.__addWatches(directory)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+
+    def __addWatch(self, directory: Path):
+        wd = self.__libc.inotify_add_watch(self.__fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            logging.error("watch directory %s caused an error %s", cDim(directory.as_posix()),
+                cDim(os.strerror(error)))
+            return
+        logging.debug("watch directory %s", cDim(directory.as_posix()))
+        self.__watches[wd] = directory
+
+    def __addWatches(self, directory: Path, listFiles: bool = False) -> list[Path]:
+        """
+        Watch the directory and all its subdirectories if recursive is set.
+        @return
+            the files already in the directories if listFiles is set"""
+
+        self.__addWatch(directory)
+        files = []
+        if not self.__recursive:
+            return files
+        for parent, dirNames, fileNames in os.walk(directory):
+            for dirName in dirNames:
+                self.__addWatch(Path(parent) / dirName)
+            if listFiles:
+                files.extend(Path(parent) / fileName for fileName in fileNames)
+        return files
+
+    def __readEvents(self):
+        """
+        Yield tuples of (mask, path) for all events available"""
+
+        data = os.read(self.__fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, nameLength = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + nameLength].rstrip(b"\0"))
+            offset += nameLength
+            if mask & IN_Q_OVERFLOW:
+                logging.warning("watch events of %s were dropped. The directory is scaned again",
+                    cDim(self.__directory.as_posix()))
+                yield mask, self.__directory
+            elif mask & IN_IGNORED:
+                self.__watches.pop(wd, None)
+            elif wd in self.__watches:
+                yield mask, self.__watches[wd] / name
+
+    def changes(self):
+        """
+        Wait for new files. Runs until the generator is closed.
+        @return
+            generator of lists with the new files"""
+
+        pending = {}
+        while True:
+            timeout = None
+            if len(pending) > 0:
+                timeout = max(0, min(pending.values()) + self.__settleTime - time.monotonic())
+            ready, _, _ = select.select([self.__fd], [], [], timeout)
+            if len(ready) > 0:
+                for mask, path in self.__readEvents():
+                    if mask & IN_ISDIR:
+                        if self.__recursive and path != self.__directory:
+                            # files written later are reported by their own events
+                            for file in self.__addWatches(path, True):
+                                pending[file] = time.monotonic()
+                        continue
+                    elif mask & IN_CREATE:
+                        # files are reported when they are closed after writing
+                        continue
+                    pending[path] = time.monotonic()
+            now = time.monotonic()
+            settled = [path for path, eventTime in pending.items() if now - eventTime >= self.__settleTime]
+            if len(settled) > 0:
+                for path in settled:
+                    del pending[path]
+                yield settled
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+
+from color import cDim
+from pathlib import Path
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+
+CHUNK_SIZE = 1024 * 1024
+
+ZIP64_EXTRA_ID = 0x0001
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP_COUNT_LIMIT = 0xFFFF
+UTF8_FLAG = 0x800
+
+EXTRA_HEADER = struct.Struct("<HH")
+CENTRAL_DIRECTORY = struct.Struct("<4s4B4HL2L5H2L")
+END_ARCHIVE64 = struct.Struct("<4sQ2H2L4Q")
+END_ARCHIVE64_LOCATOR = struct.Struct("<4sLQL")
+END_ARCHIVE = struct.Struct("<4s4H2LH")
+
+def removeZipEntries(archive: Path, headerOffsets: set):
+    """
+    Remove entries from a ZIP archive. The archive is rewritten once into a temporary
+    file next to it. All left over entries are copied as raw compressed data with their
+    local header without decompressing or compressing them again, so encrypted entries
+    and entries of any compression method are kept byte for byte. The central directory
+    is written for the new offsets. At the end the archive is replaced atomically.
+    If no file entry is left the archive is deleted. On error the archive is unchanged.
+    Entries are identified by the offset of their local header, because a ZIP archive
+    may contain several entries with the same name.
+    @param archive
+        the ZIP archive to change
+    @param headerOffsets
+        header_offset of the ZipInfo of every entry to remove"""
+
+    with zipfile.ZipFile(archive) as source:
+        infoList = source.infolist()
+        keep = [info for info in infoList if info.header_offset not in headerOffsets]
+        if all(info.is_dir() for info in keep):
+            logging.info("delete zip file %s because all entries were removed", cDim(archive.as_posix()))
+            archive.unlink()
+            return
+        # an entry reaches up to the next entry or the central directory. This includes
+        # the local header and an optional data descriptor without parsing them
+        offsets = sorted(info.header_offset for info in infoList) + [source.start_dir]
+        entryEnd = dict(zip(offsets[:-1], offsets[1:]))
+        comment = source.comment
+
+    logging.info("rewrite zip file %s without %s entries", cDim(archive.as_posix()), len(infoList) - len(keep))
+    tempFd, tempName = tempfile.mkstemp(prefix="." + archive.name + ".", suffix=".part", dir=archive.parent)
+    try:
+        with open(archive, "rb") as sourceFile, os.fdopen(tempFd, "wb") as target:
+            newOffsets = [copyRawEntry(sourceFile, info, entryEnd[info.header_offset], target) for info in keep]
+            writeCentralDirectory(target, keep, newOffsets, comment)
+            target.flush()
+            os.fsync(target.fileno())
+        shutil.copystat(archive, tempName)
+        os.replace(tempName, archive)
+    except BaseException:
+        os.unlink(tempName)
+        raise
+
+def copyRawEntry(sourceFile, info: zipfile.ZipInfo, end: int, target) -> int:
+    """
+    Copy a ZIP entry with its local header as raw bytes into the target file.
+    @return
+        the offset of the local header in the target file"""
+
+    offset = target.tell()
+    sourceFile.seek(info.header_offset)
+    remaining = end - info.header_offset
+    while remaining > 0:
+        data = sourceFile.read(min(CHUNK_SIZE, remaining))
+        if len(data) == 0:
+            raise zipfile.BadZipFile(f"zip entry {info.filename} is truncated")
+        target.write(data)
+        remaining -= len(data)
+    return offset
+
+def writeCentralDirectory(target, infoList: list, offsets: list, comment: bytes):
+    """
+    Write the central directory and the end records for the copied entries.
+    ZIP64 records are written if sizes, offsets or the number of entries need them."""
+
+    start = target.tell()
+    for info, offset in zip(infoList, offsets):
+        target.write(centralDirectoryRecord(info, offset))
+    size = target.tell() - start
+    count = len(infoList)
+    if count >= ZIP_COUNT_LIMIT or size >= ZIP64_LIMIT or start >= ZIP64_LIMIT:
+        end64 = target.tell()
+        target.write(END_ARCHIVE64.pack(b"PK\x06\x06", END_ARCHIVE64.size - 12, 45, 45, 0, 0,
+            count, count, size, start))
+        target.write(END_ARCHIVE64_LOCATOR.pack(b"PK\x06\x07", 0, end64, 1))
+    target.write(END_ARCHIVE.pack(b"PK\x05\x06", 0, 0, min(count, ZIP_COUNT_LIMIT), min(count, ZIP_COUNT_LIMIT),
+        min(size, ZIP64_LIMIT), min(start, ZIP64_LIMIT), len(comment)))
+    target.write(comment)
+
+def centralDirectoryRecord(info: zipfile.ZipInfo, offset: int) -> bytes:
+    """
+    Create the central directory record of an entry with its local header at offset."""
+
+    zip64 = b""
+    fileSize = info.file_size
+    compressSize = info.compress_size
+    if fileSize >= ZIP64_LIMIT:
+        zip64 += struct.pack("<Q", fileSize)
+        fileSize = ZIP64_LIMIT
+    if compressSize >= ZIP64_LIMIT:
+        zip64 += struct.pack("<Q", compressSize)
+        compressSize = ZIP64_LIMIT
+    if offset >= ZIP64_LIMIT:
+        zip64 += struct.pack("<Q", offset)
+        offset = ZIP64_LIMIT
+    extra = stripZip64Extra(info.extra)
+    if len(zip64) > 0:
+        extra = EXTRA_HEADER.pack(ZIP64_EXTRA_ID, len(zip64)) + zip64 + extra
+    filename = info.orig_filename.encode("utf-8" if info.flag_bits & UTF8_FLAG else "cp437")
+    year, month, day, hour, minute, second = info.date_time
+    dosDate = (year - 1980) << 9 | month << 5 | day
+    dosTime = hour << 11 | minute << 5 | second // 2
+    return CENTRAL_DIRECTORY.pack(b"PK\x01\x02", info.create_version, info.create_system,
+        info.extract_version, info.reserved, info.flag_bits, info.compress_type, dosTime, dosDate,
+        info.CRC, compressSize, fileSize, len(filename), len(extra), len(info.comment), 0,
+        info.internal_attr, info.external_attr, offset) + filename + extra + info.comment
+
+def stripZip64Extra(extra: bytes) -> bytes:
+    """
+    Remove the ZIP64 extra field, which is written again for the new offset if needed."""
+
+    stripped = b""
+    offset = 0
+    while offset + EXTRA_HEADER.size <= len(extra):
+        fieldId, size = EXTRA_HEADER.unpack_from(extra, offset)
+        end = offset + EXTRA_HEADER.size + size
+        if fieldId != ZIP64_EXTRA_ID:
+            stripped += extra[offset:end]
+        offset = end
+    return stripped